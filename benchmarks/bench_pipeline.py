@@ -0,0 +1,348 @@
+#!/usr/bin/env python
+"""
+Benchmarks of the server and floating IP pipelines against synthetic
+inventories.
+
+Each case lists, filters and deletes a generated inventory of servers or
+floating IPs through a fake connection, in a process of its own so that its
+peak memory use can be measured. The listing is generated page by page, so
+the memory measured is the memory that cloud-cleaner itself holds on to.
+
+Run from the top of the repository:
+
+    python benchmarks/bench_pipeline.py --sizes 1000,10000
+
+With --inventory, the listing is read from a file written by
+"cloud-clean --dump-inventory" in place of the generated inventory, so the
+filters run against the resources of a real cloud. Nothing is deleted in
+those cases.
+
+With --baseline, the results are compared to a stored baseline, and the
+command fails if any case got slower or used more memory than the baseline
+allows. --update-baseline stores the results as the new baseline instead.
+"""
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+
+from munch import munchify
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# pylint: disable=wrong-import-position
+from cloud_cleaner.config import CloudCleanerConfig  # noqa: E402
+from cloud_cleaner.inventory_file import read_inventory  # noqa: E402
+from cloud_cleaner.resources import Fip, Server  # noqa: E402
+from tests.fake_openstack import FakeOpenStack, fake_cloud  # noqa: E402
+
+DEFAULT_SIZES = '1000,10000,100000'
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'baseline.json')
+NOW = datetime(2018, 2, 23, 16)
+RESOURCES = ('server', 'fip')
+# Name of the collection each resource type lists
+COLLECTIONS = {'server': 'servers', 'fip': 'floating_ips'}
+
+
+class FakeConnection(object):  # pylint: disable=R0205
+    """
+    Stands in for an OpenStack connection, generating a listing of "size"
+    servers and floating IPs on demand and sleeping "latency" seconds on
+    each call.
+    """
+    def __init__(self, size, latency):
+        self.__size = size
+        self.__latency = latency
+        self.__deleted = set()
+        self.calls = 0
+        self.compute = munchify({})
+        self.compute.servers = self.__servers
+        self.network = munchify({})
+        self.network.ips = self.__ips
+
+    def delete_server(self, server_id):
+        """Delete a generated server"""
+        self.__call()
+        self.__deleted.add(server_id)
+
+    def delete_floating_ip(self, fip_id):
+        """Delete a generated floating IP"""
+        self.__call()
+        self.__deleted.add(fip_id)
+
+    def __servers(self, limit=None, marker=None, **_):
+        return [server(index) for index in self.__page(limit, marker)
+                if 'server-%d' % index not in self.__deleted]
+
+    def __ips(self, limit=None, marker=None, **_):
+        return [fip(index) for index in self.__page(limit, marker)
+                if 'fip-%d' % index not in self.__deleted]
+
+    def __page(self, limit, marker):
+        self.__call()
+        start = 0 if marker is None else int(marker.split('-')[1]) + 1
+        end = self.__size if limit is None else min(self.__size,
+                                                    start + limit)
+        return range(start, end)
+
+    def __call(self):
+        self.calls += 1
+        if self.__latency:
+            time.sleep(self.__latency)
+
+
+def server(index):
+    """
+    Generate a server. About half of them are old enough to delete, and a
+    tenth of those are pets.
+    """
+    launched = NOW - timedelta(hours=index % 1440)
+    return munchify({
+        'id': 'server-%d' % index,
+        'name': ('pet-%d' if index % 10 == 0 else 'test-%d') % index,
+        'user_id': 'user-%d' % (index % 50),
+        'status': 'ACTIVE',
+        'launched_at': launched.strftime('%Y-%m-%dT%H:%M:%S.%f')
+    })
+
+
+def fip(index):
+    """
+    Generate a floating IP. Half of them are attached, and half are in the
+    subnet that is cleaned.
+    """
+    return munchify({
+        'id': 'fip-%d' % index,
+        'floating_ip_address': '10.%d.%d.%d' % (index % 2, index // 65536 %
+                                                256, index % 256),
+        'fixed_ip_address': '192.168.%d.%d' % (index // 256 % 256,
+                                               index % 256),
+        'port_id': 'port-%d' % index if index % 4 < 2 else None,
+        'status': 'DOWN'
+    })
+
+
+def run_case(kind, size, options):
+    """
+    Run one case in this process.
+
+    :return: dict of the results of the case
+    """
+    if options.inventory:
+        return run_inventory_case(kind, options.inventory)
+    if options.http:
+        cloud = fake_cloud(http_service(kind, size, options.latency))
+        service = cloud.__enter__()
+        args = ['--os-cloud', 'fake']
+    else:
+        conn = FakeConnection(size, options.latency)
+        args = ['--os-auth-url', 'http://bench.invalid']
+    args += ['--concurrency', str(options.concurrency)]
+    if kind == 'server':
+        target = Server(now=NOW.replace(tzinfo=None))
+        args += ['server', '--age', '30d', '--skip-name', 'pet-']
+    else:
+        target = Fip()
+        args += ['fip', '--floating-subnet', '10.0.0.0/16']
+    config = CloudCleanerConfig(args=args)
+    if not options.http:
+        config.get_conn = lambda: conn
+    target.register(config)
+    config.parse_args()
+    phases = {}
+    started = time.perf_counter()
+    target.prep_deletion()
+    target.process()
+    phases['process'] = time.perf_counter() - started
+    selected = len(target.plan_entries())
+    started = time.perf_counter()
+    target.clean()
+    phases['clean'] = time.perf_counter() - started
+    total = sum(phases.values())
+    if options.http:
+        cloud.__exit__(None, None, None)
+        calls = sum(service.calls.values())
+    else:
+        calls = conn.calls
+    return {
+        'case': '%s-%d' % (kind, size),
+        'selected': selected,
+        'calls': calls,
+        'seconds': phases,
+        'throughput': size / total if total else 0.0,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    }
+
+
+def run_inventory_case(kind, path):
+    """
+    Run one case in this process against the listing in an inventory file.
+    Only the process phase is run, as there is nothing to delete.
+
+    :return: dict of the results of the case
+    """
+    if kind == 'server':
+        target = Server()
+        args = ['server', '--age', '30d', '--skip-name', 'pet-']
+    else:
+        target = Fip()
+        args = ['fip', '--floating-subnet', '10.0.0.0/16']
+    config = CloudCleanerConfig(args=['--from-inventory', path] + args)
+    target.register(config)
+    config.parse_args()
+    started = time.perf_counter()
+    target.prep_deletion()
+    target.process()
+    seconds = time.perf_counter() - started
+    size = sum(1 for _ in read_inventory(path, COLLECTIONS[kind]))
+    return {
+        'case': '%s-inventory' % kind,
+        'selected': len(target.plan_entries()),
+        'calls': 0,
+        'seconds': {'process': seconds, 'clean': 0.0},
+        'throughput': size / seconds if seconds else 0.0,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    }
+
+
+def http_service(kind, size, latency):
+    """
+    Build the fake OpenStack service, on a free port, serving the same
+    inventory as FakeConnection does.
+    """
+    if kind == 'server':
+        servers = (server(index) for index in range(size))
+        return FakeOpenStack(servers=(dict(s, **{
+            'id': 'server-%08d' % int(s.id.split('-')[1]),
+            'updated': s.launched_at[:19] + 'Z',
+            'OS-SRV-USG:launched_at': s.launched_at}) for s in servers),
+            latency=latency)
+    return FakeOpenStack(floating_ips=(dict(f, id='fip-%08d' %
+                                            int(f.id.split('-')[1]))
+                                       for f in map(fip, range(size))),
+                         latency=latency)
+
+
+def run_isolated(kind, size, options):
+    """
+    Run one case in a new process, so that its peak memory is its own.
+
+    :return: dict of the results of the case
+    """
+    output = subprocess.check_output(
+        [sys.executable, os.path.abspath(__file__), '--case', kind,
+         '--sizes', str(size), '--latency', str(options.latency),
+         '--concurrency', str(options.concurrency)] +
+        (['--http'] if options.http else []) +
+        (['--inventory', options.inventory] if options.inventory else []),
+        stderr=subprocess.DEVNULL)
+    return json.loads(output.decode('utf-8'))
+
+
+def regressions(results, baseline, tolerance):
+    """
+    Compare results to a baseline.
+
+    :return: List of messages describing each regression
+    """
+    found = []
+    for result in results:
+        base = baseline.get(result['case'])
+        if base is None:
+            continue
+        if result['throughput'] < base['throughput'] * (1 - tolerance):
+            found.append('%s throughput %.0f/s, baseline %.0f/s' %
+                         (result['case'], result['throughput'],
+                          base['throughput']))
+        if result['peak_rss_kb'] > base['peak_rss_kb'] * (1 + tolerance):
+            found.append('%s peak RSS %d KiB, baseline %d KiB' %
+                         (result['case'], result['peak_rss_kb'],
+                          base['peak_rss_kb']))
+    return found
+
+
+def report(results):
+    """Print a table of the results"""
+    print('%-16s %9s %8s %10s %10s %12s %12s' %
+          ('case', 'selected', 'calls', 'process s', 'clean s', 'items/s',
+           'peak RSS KiB'))
+    for result in results:
+        print('%-16s %9d %8d %10.3f %10.3f %12.0f %12d' %
+              (result['case'], result['selected'], result['calls'],
+               result['seconds']['process'], result['seconds']['clean'],
+               result['throughput'], result['peak_rss_kb']))
+
+
+def main(argv=None):
+    """Entry point of the benchmarks"""
+    parser = ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help='Comma separated inventory sizes to run')
+    parser.add_argument('--resources', default=','.join(RESOURCES),
+                        help='Comma separated resource types to run')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds each fake OpenStack call takes')
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='Number of deletes to run in parallel')
+    parser.add_argument('--http', action='store_true',
+                        help='Go through openstacksdk to the fake OpenStack '
+                             'service over HTTP, in place of the fake '
+                             'connection. The peak RSS then includes the '
+                             'service')
+    parser.add_argument('--inventory', metavar='PATH',
+                        help='Read the listings from a file written by '
+                             'cloud-clean --dump-inventory, in place of '
+                             'generating them. --sizes is ignored')
+    parser.add_argument('--baseline', nargs='?', const=DEFAULT_BASELINE,
+                        help='Fail if the results regress past this '
+                             'baseline file')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='Store the results in the baseline file')
+    parser.add_argument('--tolerance', type=float, default=0.3,
+                        help='Fraction a result may be worse than the '
+                             'baseline by. Defaults to 0.3')
+    parser.add_argument('--case', choices=RESOURCES, help=None)
+    options = parser.parse_args(argv)
+    sizes = [int(size) for size in options.sizes.split(',')]
+    if options.inventory:
+        # The size is that of the inventory
+        sizes = sizes[:1]
+    if options.case is not None:
+        # Running as the worker process of a single case. Only the results
+        # go to stdout, not the report of each deletion.
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            result = run_case(options.case, sizes[0], options)
+        print(json.dumps(result))
+        return 0
+    results = [run_isolated(kind, size, options)
+               for kind in options.resources.split(',') for size in sizes]
+    report(results)
+    path = options.baseline or DEFAULT_BASELINE
+    if options.update_baseline:
+        with open(path, 'w') as baseline_file:
+            json.dump({r['case']: {'throughput': r['throughput'],
+                                   'peak_rss_kb': r['peak_rss_kb']}
+                       for r in results}, baseline_file, indent=2,
+                      sort_keys=True)
+            baseline_file.write('\n')
+        print('Baseline written to %s' % path)
+    elif options.baseline is not None:
+        with open(path) as baseline_file:
+            found = regressions(results, json.load(baseline_file),
+                                options.tolerance)
+        for message in found:
+            print('REGRESSION: %s' % message)
+        if found:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+"""
+Benchmarks of the time cloud-cleaner takes to start.
+
+Each case runs a fresh Python interpreter a number of times and reports the
+median and the fastest wall clock time. Short, frequent cron runs spend most
+of their time starting, so this is what they pay on every run before the
+first call to OpenStack.
+
+Run from the top of the repository:
+
+    python benchmarks/bench_startup.py --repeat 20
+
+With --baseline, the results are compared to a stored baseline, and the
+command fails if any case got slower than the baseline allows.
+--update-baseline stores the results as the new baseline instead.
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'baseline_startup.json')
+# The code each case runs in a fresh interpreter
+CASES = (
+    ('interpreter', 'pass'),
+    ('import', 'import cloud_cleaner.bin.entrypoint'),
+    ('help', 'from cloud_cleaner.bin.entrypoint import cloud_clean\n'
+             'try:\n'
+             '    cloud_clean(["--help"])\n'
+             'except SystemExit:\n'
+             '    pass'),
+    ('parse', 'from cloud_cleaner.bin.entrypoint import register_selected\n'
+              'from cloud_cleaner.config import CloudCleanerConfig\n'
+              'config = CloudCleanerConfig(args=["server", "--age", "1d"])\n'
+              'register_selected(config)\n'
+              'config.parse_args()'),
+    # The cost that the cases above avoid until a connection is needed
+    ('openstack', 'import openstack.connection'),
+)
+
+
+def run_case(code, repeat):
+    """
+    Time a snippet of code in fresh interpreters.
+
+    :param code: The code to run
+    :param repeat: Number of interpreters to start
+    :return: Sorted list of the wall clock times, in milliseconds
+    """
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.check_call([sys.executable, '-c', code], cwd=ROOT,
+                              stdout=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - started) * 1000)
+    return sorted(timings)
+
+
+def regressions(results, baseline, tolerance):
+    """
+    Compare results to a baseline.
+
+    :return: List of messages describing each regression
+    """
+    found = []
+    for result in results:
+        base = baseline.get(result['case'])
+        if base is None:
+            continue
+        if result['median_ms'] > base['median_ms'] * (1 + tolerance):
+            found.append('%s median %.1f ms, baseline %.1f ms' %
+                         (result['case'], result['median_ms'],
+                          base['median_ms']))
+    return found
+
+
+def report(results):
+    """Print a table of the results"""
+    print('%-12s %10s %10s' % ('case', 'median ms', 'min ms'))
+    for result in results:
+        print('%-12s %10.1f %10.1f' % (result['case'], result['median_ms'],
+                                       result['min_ms']))
+
+
+def main(argv=None):
+    """Entry point of the benchmarks"""
+    parser = ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=10,
+                        help='Number of times to run each case')
+    parser.add_argument('--cases', default=','.join(c for c, _ in CASES),
+                        help='Comma separated cases to run')
+    parser.add_argument('--baseline', nargs='?', const=DEFAULT_BASELINE,
+                        help='Fail if the results regress past this '
+                             'baseline file')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='Store the results in the baseline file')
+    parser.add_argument('--tolerance', type=float, default=0.3,
+                        help='Fraction a result may be worse than the '
+                             'baseline by. Defaults to 0.3')
+    options = parser.parse_args(argv)
+    wanted = options.cases.split(',')
+    results = []
+    for case, code in CASES:
+        if case in wanted:
+            timings = run_case(code, options.repeat)
+            results.append({'case': case, 'min_ms': timings[0],
+                            'median_ms': timings[len(timings) // 2]})
+    report(results)
+    path = options.baseline or DEFAULT_BASELINE
+    if options.update_baseline:
+        with open(path, 'w') as baseline_file:
+            json.dump({r['case']: {'median_ms': r['median_ms']}
+                       for r in results}, baseline_file, indent=2,
+                      sort_keys=True)
+            baseline_file.write('\n')
+        print('Baseline written to %s' % path)
+    elif options.baseline is not None:
+        with open(path) as baseline_file:
+            found = regressions(results, json.load(baseline_file),
+                                options.tolerance)
+        for message in found:
+            print('REGRESSION: %s' % message)
+        if found:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
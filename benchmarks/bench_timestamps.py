@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+Benchmark of the age filter's handling of launch timestamps.
+
+Times selecting the timestamps older than an interval two ways: by parsing
+each one with strptime and adding the interval to it, as the age filter
+used to, and by comparing parse_timestamp to a cutoff computed once, as it
+does now. Both must select the same timestamps.
+
+Run from the top of the repository:
+
+    python benchmarks/bench_timestamps.py --count 100000
+"""
+import os
+import sys
+from argparse import ArgumentParser
+from datetime import datetime, timedelta, timezone
+from timeit import default_timer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# pylint: disable=wrong-import-position
+from cloud_cleaner.config import DATE_FORMAT  # noqa: E402
+from cloud_cleaner.resources.resource import Resource, \
+    parse_timestamp  # noqa: E402
+
+NOW = datetime(2018, 2, 23, 16, tzinfo=timezone.utc)
+INTERVAL = timedelta(days=3)
+
+
+def timestamps(count):
+    """Generate launch timestamps seven minutes apart"""
+    start = datetime(2017, 1, 1)
+    return [(start + timedelta(minutes=7 * i)).strftime(DATE_FORMAT)
+            for i in range(count)]
+
+
+def per_record(records):
+    """Select the old timestamps the way the age filter used to"""
+    return sum(1 for record in records if NOW > (
+        datetime.strptime(record, DATE_FORMAT).replace(
+            tzinfo=timezone.utc) + INTERVAL))
+
+
+def with_cutoff(records):
+    """Select the old timestamps the way the age filter does now"""
+    cutoff = Resource(now=NOW)._cutoff(INTERVAL)  # pylint: disable=W0212
+    return sum(1 for record in records if parse_timestamp(record) < cutoff)
+
+
+def timed(select, records):
+    """
+    :return: Tuple of the number of timestamps selected and the seconds taken
+    """
+    started = default_timer()
+    count = select(records)
+    return count, default_timer() - started
+
+
+def main(argv=None):
+    """Entry point of the benchmark"""
+    parser = ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--count', type=int, default=100000,
+                        help='Number of timestamps to filter')
+    options = parser.parse_args(argv)
+    records = timestamps(options.count)
+    old_count, old_time = timed(per_record, records)
+    new_count, new_time = timed(with_cutoff, records)
+    print('%d timestamps: %.3fs before, %.3fs after, %.1fx faster' %
+          (options.count, old_time, new_time, old_time / new_time))
+    if old_count != new_count:
+        print('MISMATCH: %d selected before, %d after' %
+              (old_count, new_count))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+Contains the AuthCache class, an on-disk cache of the Keystone tokens and
+service catalogs of earlier runs
+"""
+import json
+import os
+import stat
+
+# Seconds before a cached token expires that it is no longer used
+DEFAULT_MARGIN = 300
+
+
+class AuthCache(object):  # pylint: disable=R0205
+    """
+    Keeps the authentication state of keystoneauth plugins, which is the
+    token and the service catalog that came with it, in a JSON file. Each
+    state is stored under the cache id of its plugin, which changes with the
+    cloud, the user and the project, so that several of them can share a
+    file.
+
+    The file holds tokens, so it is only ever written readable by its owner.
+    A file that anyone else can read or write is ignored rather than used.
+    """
+    def __init__(self, path, margin=DEFAULT_MARGIN):
+        self.__path = path
+        self.__margin = margin
+
+    def load(self, auth):
+        """
+        Install the cached authentication state in a plugin, unless it
+        expires within the margin.
+
+        :param auth: The keystoneauth plugin
+        :return: True if the plugin now holds a cached token
+        """
+        key = auth.get_cache_id()
+        if key is None:
+            return False
+        state = self.__read().get(key)
+        if state is None:
+            return False
+        try:
+            auth.set_auth_state(state)
+        except (ValueError, KeyError, TypeError):
+            auth.invalidate()
+            return False
+        if auth.auth_ref is None or \
+                auth.auth_ref.will_expire_soon(self.__margin):
+            auth.invalidate()
+            return False
+        return True
+
+    def save(self, auth):
+        """
+        Store the authentication state of a plugin, replacing the file in
+        one step.
+
+        :param auth: The keystoneauth plugin, once it has authenticated
+        :return: None
+        """
+        key = auth.get_cache_id()
+        state = auth.get_auth_state()
+        if key is None or state is None:
+            return
+        states = self.__read()
+        states[key] = state
+        partial = self.__path + '.partial'
+        descriptor = os.open(partial, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                             stat.S_IRUSR | stat.S_IWUSR)
+        with os.fdopen(descriptor, 'w') as cache_file:
+            # A file left behind with other permissions keeps them
+            os.fchmod(cache_file.fileno(), stat.S_IRUSR | stat.S_IWUSR)
+            json.dump(states, cache_file)
+        os.replace(partial, self.__path)
+
+    def __read(self):
+        """
+        Read the cached states, skipping a file that is missing, corrupt or
+        open to other users.
+
+        :return: dict of the states by cache id
+        """
+        try:
+            with open(self.__path) as cache_file:
+                if os.fstat(cache_file.fileno()).st_mode & \
+                        (stat.S_IRWXG | stat.S_IRWXO):
+                    return {}
+                states = json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(states, dict):
+            return {}
+        return states
@@ -0,0 +1,15 @@
+from typing import Dict
+from keystoneauth1.identity.base import BaseIdentityPlugin
+
+
+DEFAULT_MARGIN: int
+
+
+class AuthCache(object):
+    def __init__(self, path: str, margin: int = DEFAULT_MARGIN): ...
+
+    def load(self, auth: BaseIdentityPlugin) -> bool: ...
+
+    def save(self, auth: BaseIdentityPlugin): ...
+
+    def __read(self) -> Dict[str, str]: ...
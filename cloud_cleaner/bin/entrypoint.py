@@ -2,37 +2,324 @@
 Entry-point methods for CLI commands
 """
 import sys
-from cloud_cleaner.config import CloudCleanerConfig
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from cloud_cleaner.config import CloudCleanerConfig, target_label
+from cloud_cleaner.plan import PlanError, read_plan, write_plan
 from cloud_cleaner.resources import ALL_RESOURCES
+from cloud_cleaner.resources.resource import parse_timestamp
 
 
 def cloud_clean(args=sys.argv[1:],  # pylint: disable=W0102
-                config=None):
+                config=None, sleep=time.sleep):
     """
     Entrypoint for the cloud-clean CLI interface
 
     :param args: Command line arguments passed from user
     :param config: The config object to be used
-    :return: None
+    :param sleep: Function to wait between the runs of watch mode
+    :return: The exit status: 0 if the run succeeded. Runs with --target
+             return 1 if any of the targets failed.
     """
     # Construct or configure cloud cleaner config
     if config is None:
         config = CloudCleanerConfig(args=args)
     else:
         config.set_args(args)
-    # Register all the resource types and options with the configurator
-    for resource in ALL_RESOURCES.values():
-        resource.register(config)
+    register_selected(config)
     config.parse_args()
-    # Call the process method for the target resource type
+    if config.get_targets():
+        return fan_out(config)
+    journal = config.get_journal()
+    try:
+        if config.get_arg("resume"):
+            if journal is None:
+                sys.exit("--resume needs the --journal of the run to resume")
+            with exported(config):
+                resume(config)
+            return 0
+        if journal is not None and deletes(config):
+            # Only runs that delete start over; a dry run must not hide the
+            # deletions that an interrupted run left outstanding
+            journal.start()
+        if config.get_arg("apply") is not None:
+            with exported(config):
+                apply_plan(config)
+        elif config.get_arg("watch") is None:
+            with exported(config):
+                run_once(config, ALL_RESOURCES[config.get_resource()])
+        else:
+            watch(config, ALL_RESOURCES[config.get_resource()], sleep)
+    finally:
+        config.close()
+    return 0
+
+
+def register_selected(config):
+    """
+    List every resource type as a sub-command, but only load the resource
+    type selected by the arguments and register its options.
+
+    :param config: The config object, before its arguments are parsed
+    :return: None
+    """
+    for name in ALL_RESOURCES:
+        config.add_subparser(name, ALL_RESOURCES.describe(name))
+    selected = config.select_resource()
+    if selected is not None:
+        ALL_RESOURCES[selected].register(config)
+
+
+def deletes(config):
+    """
+    Tell whether the run deletes anything, rather than only reporting what
+    it would delete or writing a plan.
+
+    :param config: The parsed config object
+    :return: True if the run deletes resources
+    """
+    if config.get_arg("apply") is not None:
+        return True
+    return bool(config.get_arg("force")) and \
+        config.get_arg("plan_out") is None
+
+
+def fan_out(config, executor=None):
+    """
+    Run the command against each of the --target clouds, each in its own
+    worker process with its own connection, and report the results of all
+    of them together.
+
+    :param config: The parsed config object
+    :param executor: concurrent.futures executor to run the targets with.
+                     Defaults to a process pool with a worker per target.
+    :return: The exit status: 0 if every target succeeded, otherwise 1
+    """
+    targets = config.get_targets()
+    if executor is None:
+        # Imported here, as loading multiprocessing slows down the start of
+        # every other run
+        # pylint: disable=import-outside-toplevel
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(max_workers=len(targets))
+    with executor:
+        futures = [(target_label(target),
+                    executor.submit(run_target, target_label(target),
+                                    config.target_args(target)))
+                   for target in targets]
+    results = []
+    for label, future in futures:
+        try:
+            results.append(future.result())
+        except Exception as error:  # pylint: disable=broad-except
+            # Such as a worker process that died
+            results.append({'target': label, 'error': repr(error),
+                            'seconds': 0.0, 'calls': {}})
+    failed = [result for result in results if result['error'] is not None]
+    for result in results:
+        print("%-30s %-6s %7.1fs  %s" %
+              (result['target'],
+               "FAILED" if result['error'] is not None else "ok",
+               result['seconds'], result['error'] or result['calls']))
+    print("%d of %d targets succeeded" %
+          (len(results) - len(failed), len(results)))
+    return 1 if failed else 0
+
+
+def run_target(label, args):
+    """
+    Run the command against a single target. Runs in a worker process.
+
+    :param label: Name of the target, for the report
+    :param args: Command line arguments for the target
+    :return: dict of the "target", "error" (None if the run succeeded),
+             "seconds" and OpenStack "calls" of the run
+    """
+    started = time.monotonic()
+    config = CloudCleanerConfig(args=args)
+    error = None
+    calls = {}
+    try:
+        cloud_clean(args, config)
+        calls = config.get_rate_control().counters()
+    except (Exception, SystemExit) as failure:  # pylint: disable=broad-except
+        error = str(failure) or repr(failure)
+    return {'target': label, 'error': error,
+            'seconds': time.monotonic() - started, 'calls': calls}
+
+
+def run_once(config, resource):
+    """
+    Run the passes for a resource a single time.
+
+    :param config: The parsed config object
+    :param resource: The resource to process
+    :return: None
+    """
+    # Call the process method for the target resource type. Every pass below
+    # is served from the same inventory, so the resources are only listed
+    # from OpenStack once per run
     print("Options parsed, fetching resources")
-    if config.get_arg("force"):
-        ALL_RESOURCES[config.get_resource()].prep_deletion()
-        ALL_RESOURCES[config.get_resource()].process()
+    if config.get_arg("plan_out") is not None:
+        created = datetime.now(timezone.utc)
+        with phase(config, resource, "process"):
+            resource.prep_deletion()
+            resource.process()
+        write_plan(config.get_arg("plan_out"), resource.type_name,
+                   resource.plan_entries(), created)
+        print("Plan written to %s, no changes made" %
+              config.get_arg("plan_out"))
+        if config.get_arg("email"):
+            with phase(config, resource, "process"):
+                resource.process()
+    elif config.get_arg("force"):
+        with phase(config, resource, "process"):
+            resource.prep_deletion()
+            resource.process()
         print("Resources fetched, cleaning")
-        ALL_RESOURCES[config.get_resource()].clean()
+        with phase(config, resource, "clean"):
+            resource.clean()
+        if config.get_arg("email"):
+            # Re-evaluate the remaining resources for the warning pass
+            with phase(config, resource, "process"):
+                resource.process()
     else:
         print("No changes made, force option not enabled")
-    ALL_RESOURCES[config.get_resource()].process()
+        with phase(config, resource, "process"):
+            resource.process()
     if config.get_arg("email"):
-        ALL_RESOURCES[config.get_resource()].send_emails()
+        with phase(config, resource, "email"):
+            resource.send_emails()
+    config.info("OpenStack calls: %s" % config.get_rate_control().counters())
+
+
+def apply_plan(config):
+    """
+    Delete the resources of the plan file given by --apply.
+
+    :param config: The parsed config object
+    :return: None
+    """
+    plan = read_plan(config.get_arg("apply"))
+    name = config.get_resource()
+    if name is not None and name != plan['resource']:
+        raise PlanError("The plan is for %s, not %s" %
+                        (plan['resource'], name))
+    resource = registered(config, plan['resource'])
+    print("Applying plan of %d %s resources" %
+          (len(plan['items']), plan['resource']))
+    with phase(config, resource, "apply"):
+        resource.apply(plan['items'], parse_timestamp(plan['created']))
+    with phase(config, resource, "clean"):
+        resource.clean()
+    config.info("OpenStack calls: %s" % config.get_rate_control().counters())
+
+
+def resume(config):
+    """
+    Finish the deletions left outstanding by the last run recorded in the
+    --journal file.
+
+    :param config: The parsed config object
+    :return: None
+    """
+    journal = config.get_journal()
+    try:
+        outstanding = journal.outstanding()
+        if not outstanding:
+            print("Nothing left to resume")
+        for name, entries in outstanding.items():
+            print("Resuming deletion of %d %s resources" %
+                  (len(entries), name))
+            resource = registered(config, name)
+            resource.resume(entries)
+            with phase(config, resource, "clean"):
+                resource.clean()
+    finally:
+        journal.close()
+    config.info("OpenStack calls: %s" % config.get_rate_control().counters())
+
+
+def registered(config, name):
+    """
+    Look up a resource type that was not selected on the command line, such
+    as the type of a plan or a journal, and register it with the config.
+
+    :param config: The parsed config object
+    :param name: Name of the resource type
+    :return: The resource
+    """
+    resource = ALL_RESOURCES[name]
+    resource.register(config)
+    return resource
+
+
+def watch(config, resource, sleep=time.sleep):
+    """
+    Repeat the run for a resource on the schedule given by --watch, until
+    interrupted. The connection and the inventory are kept between runs, and
+    the resource polls for what changed instead of listing everything again.
+    A run that fails is logged, and the next one starts from a full listing.
+
+    :param config: The parsed config object
+    :param resource: The resource to process
+    :param sleep: Function to wait between runs
+    :return: None
+    """
+    interval = config.get_arg("watch")
+    if config.get_arg("email") and not config.get_arg("ledger"):
+        config.warning("Without --ledger, every run emails every warning")
+    listed = False
+    try:
+        while True:
+            started = time.monotonic()
+            try:
+                with exported(config):
+                    if listed:
+                        with phase(config, resource, "poll"):
+                            resource.poll()
+                    listed = True
+                    run_once(config, resource)
+            except Exception as error:  # pylint: disable=broad-except
+                config.warning("Run failed: %s" % error)
+                config.get_inventory().refresh()
+            sleep(max(0, interval - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        config.info("Stopped watching")
+
+
+def phase(config, resource, name):
+    """
+    Time a phase of a run in the metrics of the run.
+
+    :param config: The parsed config object
+    :param resource: The resource the phase is for
+    :param name: Name of the phase
+    :return: Context manager timing its body
+    """
+    return config.get_metrics().timer("phase_seconds",
+                                      resource=resource.type_name,
+                                      phase=name)
+
+
+@contextmanager
+def exported(config):
+    """
+    Count a run in the metrics, whether or not it raises, and write the
+    metrics out at its end.
+
+    :param config: The parsed config object
+    """
+    succeeded = False
+    try:
+        yield
+        succeeded = True
+    finally:
+        metrics = config.get_metrics()
+        now = time.time()
+        metrics.count("runs", outcome="ok" if succeeded else "failed")
+        metrics.set("last_run_timestamp_seconds", now)
+        if succeeded:
+            metrics.set("last_success_timestamp_seconds", now)
+        config.write_metrics()
@@ -1,2 +1,43 @@
+from concurrent.futures import Executor
+from typing import Any, Callable, ContextManager, Dict, List
+
+
 def cloud_clean(args: list = sys.argv[1:],
-                config: CloudCleanerConfig = None): ...
+                config: CloudCleanerConfig = None,
+                sleep: Callable[[float], None] = time.sleep
+                ) -> int: ...
+
+
+def register_selected(config: CloudCleanerConfig): ...
+
+
+def deletes(config: CloudCleanerConfig) -> bool: ...
+
+
+def fan_out(config: CloudCleanerConfig, executor: Executor = None) -> int: ...
+
+
+def run_target(label: str, args: List[str]) -> Dict[str, Any]: ...
+
+
+def run_once(config: CloudCleanerConfig, resource: Resource): ...
+
+
+def apply_plan(config: CloudCleanerConfig): ...
+
+
+def resume(config: CloudCleanerConfig): ...
+
+
+def registered(config: CloudCleanerConfig, name: str) -> Resource: ...
+
+
+def watch(config: CloudCleanerConfig, resource: Resource,
+          sleep: Callable[[float], None] = time.sleep): ...
+
+
+def phase(config: CloudCleanerConfig, resource: Resource,
+          name: str) -> ContextManager: ...
+
+
+def exported(config: CloudCleanerConfig) -> ContextManager: ...
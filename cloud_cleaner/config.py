@@ -2,13 +2,44 @@
 Contains CloudCleanerConfig for configuring the CLI options in this program
 """
 import logging
+import os
 import sys
 from argparse import ArgumentParser
-import openstack
-import json
+from threading import Lock
+from cloud_cleaner.auth_cache import AuthCache
+from cloud_cleaner.executor import DeletionExecutor
+from cloud_cleaner.inventory import Inventory
+from cloud_cleaner.inventory_file import InventoryWriter
+from cloud_cleaner.journal import DeletionJournal
+from cloud_cleaner.ledger import NotificationLedger
+from cloud_cleaner.metrics import Metrics
+from cloud_cleaner.shard import parse_shard
+from cloud_cleaner.throttle import RateControl
 
 DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+# Options naming files that each target of a multi-cloud run keeps apart
+PER_TARGET_OPTIONS = ('--ledger', '--journal', '--plan-out', '--apply',
+                      '--metrics-textfile', '--metrics-json', '--auth-cache',
+                      '--dump-inventory')
+# Options that need a connection, which --from-inventory runs do not have
+ONLINE_OPTIONS = (('--force', 'force'), ('--email', 'email'),
+                  ('--watch', 'watch'), ('--apply', 'apply'),
+                  ('--resume', 'resume'), ('--target', 'targets'),
+                  ('--dump-inventory', 'dump_inventory'))
+# Connection options that --target sets for each target
+TARGETED_OPTIONS = ('--os-cloud', '--os-region-name')
+# Options that work on a single resource type, so not on the group of them
+SINGLE_TYPE_OPTIONS = (('--plan-out', 'plan_out'), ('--apply', 'apply'),
+                       ('--resume', 'resume'))
+# Options that run once, so that --watch cannot repeat them
+RUN_ONCE_OPTIONS = (('--apply', 'apply'), ('--resume', 'resume'))
+# The resource type that runs every other one
+GROUP_RESOURCE = 'all'
 DEFAULT_ARGUMENTS = sys.argv
+HELP_OPTIONS = ('-h', '--help')
+CLOUD_EPILOG = '''OpenStack connection options, such as --os-cloud and
+--os-auth-url, are also accepted; see the openstacksdk documentation. They
+are not listed here, as loading them means loading openstacksdk.'''
 
 help_strings = {
     "force": '''Perform delete operations, don't just report them.
@@ -24,7 +55,67 @@ help_strings = {
     "smtpN": '''The smtp server name which should be used to send emails.
              Only used if --email is set. Required if --email is set''',
     "smtpP": '''The smtp server port which should be used to send emails.
-             Only used if --email is set. Required if --email is set'''
+             Only used if --email is set. Required if --email is set''',
+    "ledger": '''Path of a file in which to record the warnings emailed,
+              so that repeated runs only email new or escalated warnings.
+              By default every run emails every warning.''',
+    "concurrency": '''Number of delete calls to run in parallel. Defaults to
+                   1, which deletes resources one at a time.''',
+    "in_flight": '''Maximum number of delete calls in flight against any one
+                 OpenStack endpoint. Defaults to the value of
+                 --concurrency.''',
+    "rate_limit": '''Maximum number of calls per second to make to each
+                  OpenStack service. By default calls are not rate
+                  limited.''',
+    "page_size": '''Number of resources to request from OpenStack per page
+                 when listing them. Defaults to 1000.''',
+    "prefetch": '''Number of pages to fetch ahead in the background while
+                the current page is being filtered. Defaults to 1. Set to 0
+                to fetch pages only when they are needed.''',
+    "retries": '''Number of times to retry a call that OpenStack throttles
+               (HTTP 429 or 503) before giving up. Defaults to 5.''',
+    "watch": '''Keep running, and repeat the run every given number of
+             seconds. Only resources changed since the last run are listed
+             again where OpenStack allows it. By default the command runs
+             once and exits.''',
+    "plan_out": '''Write the resources that would be deleted to the given
+                plan file, without deleting anything.''',
+    "apply": '''Delete the resources in the given plan file, written by
+             --plan-out, except those changed since the plan was made. The
+             resource type is taken from the plan.''',
+    "journal": '''Path of a file in which to record each deletion before it
+               is made and as it completes, so that an interrupted run can
+               be resumed with --resume.''',
+    "resume": '''Only delete the resources that the last run recorded in
+              the --journal file did not finish deleting.''',
+    "target": '''Cloud from clouds.yaml to clean, optionally with a region
+              as CLOUD:REGION. Repeat to clean several clouds or regions at
+              once, each in its own process. The paths given to %s get a
+              suffix for each target.''' % ", ".join(PER_TARGET_OPTIONS),
+    "shard": '''Only clean the share of the resources in shard INDEX of
+             COUNT, counting from 0. The shard of a resource only depends
+             on its id, so COUNT hosts can each clean one shard without
+             overlapping.''',
+    "metrics_textfile": '''Write the counts and timings of the run to the
+                        given file in the Prometheus text format, such as
+                        for the textfile collector of the node exporter.
+                        With --watch, the file is rewritten after every
+                        run.''',
+    "metrics_json": '''Write the counts and timings of the run to the given
+                    file as JSON. With --watch, the file is rewritten after
+                    every run.''',
+    "auth_cache": '''Path of a file in which to keep the Keystone token and
+                  service catalog between runs, readable only by its owner.
+                  A cached token is used until shortly before it expires,
+                  so that frequent runs do not each authenticate. By default
+                  every run authenticates.''',
+    "dump_inventory": '''Write the resources listed from OpenStack to the
+                      given file, one JSON object per line, for use with
+                      --from-inventory.''',
+    "from_inventory": '''Read the resources from a file written by
+                      --dump-inventory instead of listing them from
+                      OpenStack, and report what the filters select. No
+                      connection is made, so nothing can be deleted.'''
 }
 
 
@@ -37,12 +128,16 @@ class CloudCleanerConfig():  # pylint: disable=R0902
     """
     def __init__(self, parser=None, args=None):
         if parser is None:
-            parser = ArgumentParser()
+            parser = ArgumentParser(epilog=CLOUD_EPILOG)
         if args is None:
             args = DEFAULT_ARGUMENTS
-        self.__cloud_config = openstack.config.OpenStackConfig()
-        self.__cloud_config.register_argparse_arguments(parser, args)
+        # The OpenStack options are only registered by #parse_args, so that
+        # openstacksdk is not loaded just to print the help
+        self.__cloud_config = None
         self.__parser = parser
+        # Options must be given in full, so that #target_args finds every
+        # path to give a suffix for each target
+        self.__parser.allow_abbrev = False
         # Register global options
         self.__parser.add_argument("--force", "-f",
                                    help=help_strings["force"],
@@ -59,27 +154,96 @@ class CloudCleanerConfig():  # pylint: disable=R0902
                                    default="")
         self.__parser.add_argument("--smtpP", help=help_strings["smtpP"],
                                    default=0)
+        self.__parser.add_argument("--ledger", help=help_strings["ledger"],
+                                   default=None)
+        # Not stored as "concurrency", which openstacksdk reads from the
+        # parsed arguments as its own per-service setting
+        self.__parser.add_argument("--concurrency", type=int, default=1,
+                                   dest="delete_concurrency",
+                                   help=help_strings["concurrency"])
+        self.__parser.add_argument("--max-in-flight", dest="max_in_flight",
+                                   type=int, default=None,
+                                   help=help_strings["in_flight"])
+        self.__parser.add_argument("--rate-limit", dest="rate_limit",
+                                   type=float, default=None,
+                                   help=help_strings["rate_limit"])
+        self.__parser.add_argument("--page-size", dest="page_size",
+                                   type=int, default=None,
+                                   help=help_strings["page_size"])
+        self.__parser.add_argument("--prefetch", type=int, default=None,
+                                   help=help_strings["prefetch"])
+        self.__parser.add_argument("--max-retries", dest="max_retries",
+                                   type=int, default=5,
+                                   help=help_strings["retries"])
+        self.__parser.add_argument("--watch", type=int, default=None,
+                                   metavar="SECONDS",
+                                   help=help_strings["watch"])
+        self.__parser.add_argument("--plan-out", dest="plan_out",
+                                   metavar="PATH", default=None,
+                                   help=help_strings["plan_out"])
+        self.__parser.add_argument("--apply", metavar="PATH", default=None,
+                                   help=help_strings["apply"])
+        self.__parser.add_argument("--journal", metavar="PATH", default=None,
+                                   help=help_strings["journal"])
+        self.__parser.add_argument("--resume", action='store_true',
+                                   help=help_strings["resume"])
+        self.__parser.add_argument("--target", dest="targets",
+                                   action="append", default=None,
+                                   metavar="CLOUD[:REGION]",
+                                   help=help_strings["target"])
+        self.__parser.add_argument("--shard", type=parse_shard, default=None,
+                                   metavar="INDEX/COUNT",
+                                   help=help_strings["shard"])
+        self.__parser.add_argument("--metrics-textfile",
+                                   dest="metrics_textfile", metavar="PATH",
+                                   default=None,
+                                   help=help_strings["metrics_textfile"])
+        self.__parser.add_argument("--metrics-json", dest="metrics_json",
+                                   metavar="PATH", default=None,
+                                   help=help_strings["metrics_json"])
+        self.__parser.add_argument("--auth-cache", dest="auth_cache",
+                                   metavar="PATH", default=None,
+                                   help=help_strings["auth_cache"])
+        self.__parser.add_argument("--dump-inventory", dest="dump_inventory",
+                                   metavar="PATH", default=None,
+                                   help=help_strings["dump_inventory"])
+        self.__parser.add_argument("--from-inventory", dest="from_inventory",
+                                   metavar="PATH", default=None,
+                                   help=help_strings["from_inventory"])
         self.__sub_parsers = self.__parser.add_subparsers(dest="resource")
         self.__sub_parser_set = {}
         self.__args = args
         # Defined after options are parsed
         self.__options = None
+        self.__results = None
         self.__cloud = None
         self.__conn = None
+        self.__inventory = None
+        self.__executor = None
+        self.__rate_control = None
+        self.__ledger = None
+        self.__journal = None
+        self.__metrics = Metrics()
+        self.__conn_lock = Lock()
         self.__log = logging.getLogger("cloud_cleaner")
         self.__log.addHandler(logging.StreamHandler())
 
-    def add_subparser(self, name):
+    def add_subparser(self, name, help_text=None):
         """
         Creates a subparser to match the name given by the user.
-        Returns it to caller
+        Returns it to caller. Asking for the same name again returns the
+        same subparser, and options added to it again replace the old ones,
+        so a resource type can be registered more than once.
 
         :param name: Name of the subparser to create
+        :param help_text: Description of the subparser in the help
         :return: The subparser object
         """
-        sub_parser = self.__sub_parsers.add_parser(name)
-        self.__sub_parser_set[name] = sub_parser
-        return sub_parser
+        if name not in self.__sub_parser_set:
+            kwargs = {} if help_text is None else {"help": help_text}
+            self.__sub_parser_set[name] = self.__sub_parsers.add_parser(
+                name, conflict_handler="resolve", **kwargs)
+        return self.__sub_parser_set[name]
 
     def set_args(self, args):
         """
@@ -92,14 +256,38 @@ class CloudCleanerConfig():  # pylint: disable=R0902
         self.__args = args
         return self
 
+    def select_resource(self):
+        """
+        Find the resource type that the arguments select, before the options
+        of any resource type are registered, so that only the selected type
+        needs to be loaded. The sub-commands must have been added, but the
+        options given to the sub-command are skipped.
+
+        :return: Name of the selected resource type, or None
+        """
+        if wants_help(self.__args):
+            return None
+        self.__register_cloud_options()
+        # The help of a sub-command is only printed once its options are in
+        args = [arg for arg in self.__args if arg not in HELP_OPTIONS]
+        known, _ = self.__parser.parse_known_args(args)
+        return known.resource
+
     def parse_args(self):
         """
         Parse all arguments currently attached to this config object
 
         :return: Parsed arguments
         """
+        if not wants_help(self.__args):
+            self.__register_cloud_options()
         results = self.__parser.parse_args(self.__args)
+        self.__results = results
         self.__options = vars(results)
+        self.__check_offline()
+        self.__check_single_type()
+        self.__check_watch()
+        self.__check_targets()
         # Set logging level based on verbosity
         debug = self.get_arg('verbose')
         if debug == 0:
@@ -110,15 +298,83 @@ class CloudCleanerConfig():  # pylint: disable=R0902
         if debug >= 2:
             self.__log.setLevel(logging.DEBUG)
             self.__log.info("Setting logging level to debug")
-        self.info("Getting cloud connection")
-        self.debug("Parsing cloud connection information")
-        cloud = self.__cloud_config.get_one_cloud(argparse=results)
-        self.__cloud = cloud
-        self.debug("Constructing shade client")
-        conn = openstack.connection.from_config(config=self.__cloud)
-        self.__conn = conn
         return results
 
+    def __check_offline(self):
+        """
+        Reject the options that need a connection on a --from-inventory run,
+        and a --from-inventory file that does not exist.
+
+        :return: None
+        """
+        source = self.get_arg("from_inventory")
+        if source is None:
+            return
+        if not os.path.isfile(source):
+            self.__parser.error("--from-inventory %s is not a file" % source)
+        for option, name in ONLINE_OPTIONS:
+            if self.get_arg(name):
+                self.__parser.error("%s cannot be used with --from-inventory"
+                                    % option)
+
+    def __check_single_type(self):
+        """
+        Reject the options that only work with a single resource type on a
+        run of the group of all of them.
+
+        :return: None
+        """
+        if self.get_resource() != GROUP_RESOURCE:
+            return
+        for option, name in SINGLE_TYPE_OPTIONS:
+            if self.get_arg(name):
+                self.__parser.error("%s cannot be used with %s"
+                                    % (option, GROUP_RESOURCE))
+
+    def __check_watch(self):
+        """
+        Reject the options that only run once on a --watch run, rather than
+        silently running them once and ignoring --watch.
+
+        :return: None
+        """
+        if self.get_arg("watch") is None:
+            return
+        for option, name in RUN_ONCE_OPTIONS:
+            if self.get_arg(name):
+                self.__parser.error("%s cannot be used with --watch" % option)
+
+    def __check_targets(self):
+        """
+        Reject the connection options that would override the cloud and the
+        region of every --target.
+
+        :return: None
+        """
+        if not self.get_targets():
+            return
+        for arg in self.__args:
+            name = arg.partition("=")[0]
+            if name in TARGETED_OPTIONS:
+                self.__parser.error("%s cannot be used with --target; give "
+                                    "each target as CLOUD:REGION" % name)
+
+    def __register_cloud_options(self):
+        """
+        Register the OpenStack connection options, once.
+
+        :return: None
+        """
+        if self.__cloud_config is not None:
+            return
+        # Imported here, as loading openstacksdk dominates the startup time
+        # of the command
+        # pylint: disable=import-outside-toplevel
+        from openstack.config import OpenStackConfig
+        self.__cloud_config = OpenStackConfig()
+        self.__cloud_config.register_argparse_arguments(self.__parser,
+                                                        self.__args)
+
     def get_arg(self, name):
         """
         Fetch the value of one of the command line arguments from the argparser
@@ -140,6 +396,45 @@ class CloudCleanerConfig():  # pylint: disable=R0902
             return None
         return self.__options['resource']
 
+    def get_targets(self):
+        """
+        Get the clouds and regions given with --target.
+
+        :return: List of (cloud, region) tuples, where region may be None
+        """
+        targets = []
+        for target in self.get_arg("targets") or []:
+            cloud, _, region = target.partition(":")
+            targets.append((cloud, region or None))
+        return targets
+
+    def target_args(self, target):
+        """
+        Build the command line arguments that run this same command against a
+        single one of the targets.
+
+        :param target: A (cloud, region) tuple from #get_targets
+        :return: List of command line arguments
+        """
+        cloud, region = target
+        label = target_label(target)
+        args = ["--os-cloud", cloud]
+        if region is not None:
+            args.extend(["--os-region-name", region])
+        remaining = iter(self.__args)
+        for arg in remaining:
+            name, equals, value = arg.partition("=")
+            if name == "--target":
+                if not equals:
+                    next(remaining, None)
+            elif name in PER_TARGET_OPTIONS:
+                if not equals:
+                    value = next(remaining, "")
+                args.extend([name, "%s.%s" % (value, label)])
+            else:
+                args.append(arg)
+        return args
+
     def get_cloud(self):
         """
         Get the cloud that was specified by the command line options. Note that
@@ -148,17 +443,192 @@ class CloudCleanerConfig():  # pylint: disable=R0902
 
         :return: Cloud option parsed, or None
         """
+        self.__connect()
         return self.__cloud
 
     def get_conn(self):
         """
         Fetch the connection object attached to the cloud that has been
-        configured for this run.
+        configured for this run. The connection is only made the first time
+        it is asked for, so runs that never call OpenStack never load the
+        cloud configuration. Note that this should only be called after
+        #parse_args is called, otherwise it will only return None.
 
-        :return: The connection object
+        :return: The connection object, or None
         """
+        self.__connect()
         return self.__conn
 
+    def __connect(self):
+        """
+        Build the cloud configuration and the connection, once.
+
+        :return: None
+        """
+        if self.__options is None or self.get_targets() or \
+                self.get_arg("from_inventory") is not None:
+            # Each target connects from its own process, and runs from an
+            # inventory file do not connect at all
+            return
+        with self.__conn_lock:
+            if self.__conn is not None:
+                return
+            self.info("Getting cloud connection")
+            self.debug("Parsing cloud connection information")
+            cloud = self.__cloud_config.get_one_cloud(argparse=self.__results)
+            self.__cloud = cloud
+            self.debug("Constructing shade client")
+            # pylint: disable=import-outside-toplevel
+            from openstack.connection import from_config
+            conn = from_config(config=self.__cloud)
+            self.__time_auth(conn)
+            self.__cache_auth(conn)
+            self.__conn = conn
+
+    def get_inventory(self):
+        """
+        Fetch the inventory of resources listed during this run. The same
+        inventory is shared by every resource type registered with this
+        config object. The listings are written to the --dump-inventory
+        file, or read from the --from-inventory file, if one is given.
+
+        :return: The inventory object
+        """
+        if self.__inventory is None:
+            dump = None
+            if self.get_arg("dump_inventory"):
+                dump = InventoryWriter(self.get_arg("dump_inventory"))
+            self.__inventory = Inventory(
+                self, dump=dump, source=self.get_arg("from_inventory"))
+        return self.__inventory
+
+    def get_executor(self):
+        """
+        Fetch the executor used to run delete calls, configured from the
+        --concurrency and --max-in-flight options. Note that this should only
+        be called after #parse_args is called.
+
+        :return: The deletion executor
+        """
+        if self.__executor is None:
+            self.__executor = DeletionExecutor(
+                concurrency=self.get_arg("delete_concurrency") or 1,
+                in_flight=self.get_arg("max_in_flight"),
+                metrics=self.__metrics)
+        return self.__executor
+
+    def get_rate_control(self):
+        """
+        Fetch the rate control shared by every call made to OpenStack during
+        this run, configured from the --rate-limit, --max-retries and
+        concurrency options. Note that this should only be called after
+        #parse_args is called.
+
+        :return: The rate control object
+        """
+        if self.__rate_control is None:
+            retries = self.get_arg("max_retries")
+            self.__rate_control = RateControl(
+                rate=self.get_arg("rate_limit"),
+                concurrency=(self.get_arg("max_in_flight") or
+                             self.get_arg("delete_concurrency") or 1),
+                retries=5 if retries is None else retries,
+                metrics=self.__metrics)
+        return self.__rate_control
+
+    def get_ledger(self):
+        """
+        Fetch the ledger of warnings already emailed, if one was configured
+        with the --ledger option. Note that this should only be called after
+        #parse_args is called.
+
+        :return: The notification ledger, or None
+        """
+        if self.__ledger is None and self.get_arg("ledger"):
+            self.__ledger = NotificationLedger(self.get_arg("ledger"))
+        return self.__ledger
+
+    def get_journal(self):
+        """
+        Fetch the journal of deletions, if one was configured with the
+        --journal option. Note that this should only be called after
+        #parse_args is called.
+
+        :return: The deletion journal, or None
+        """
+        if self.__journal is None and self.get_arg("journal"):
+            self.__journal = DeletionJournal(self.get_arg("journal"))
+        return self.__journal
+
+    def close(self):
+        """
+        Close the ledger and the journal, if the run opened them.
+
+        :return: None
+        """
+        if self.__ledger is not None:
+            self.__ledger.close()
+            self.__ledger = None
+        if self.__journal is not None:
+            self.__journal.close()
+
+    def get_metrics(self):
+        """
+        Fetch the metrics collected during this run.
+
+        :return: The metrics object
+        """
+        return self.__metrics
+
+    def write_metrics(self):
+        """
+        Write the metrics collected so far to the files given by
+        --metrics-textfile and --metrics-json, if any.
+
+        :return: None
+        """
+        if self.get_arg("metrics_textfile"):
+            self.__metrics.write_textfile(self.get_arg("metrics_textfile"))
+        if self.get_arg("metrics_json"):
+            self.__metrics.write_json(self.get_arg("metrics_json"))
+
+    def __time_auth(self, conn):
+        """
+        Time each authentication of a connection. The connection only
+        authenticates when it first needs a token, and again whenever the
+        token expires.
+
+        :param conn: The connection
+        :return: None
+        """
+        auth = getattr(conn.session, "auth", None)
+        if auth is not None and hasattr(auth, "get_auth_ref"):
+            auth.get_auth_ref = self.__metrics.timed("auth_seconds",
+                                                     auth.get_auth_ref)
+
+    def __cache_auth(self, conn):
+        """
+        Authenticate a connection from the --auth-cache file, if there is
+        one. Without a usable cached token, authenticate now and cache the
+        new token.
+
+        :param conn: The connection
+        :return: None
+        """
+        path = self.get_arg("auth_cache")
+        auth = getattr(conn.session, "auth", None)
+        if path is None or auth is None:
+            return
+        cache = AuthCache(path)
+        if cache.load(auth):
+            self.debug("Using the cached token from %s" % path)
+            self.__metrics.count("auth_cache", outcome="hit")
+            return
+        self.__metrics.count("auth_cache", outcome="miss")
+        auth.get_access(conn.session)
+        cache.save(auth)
+        self.debug("Cached the new token in %s" % path)
+
     # LOGGING FUNCTIONS
     def info(self, msg, *args):
         """Log at the info level"""
@@ -171,3 +641,32 @@ class CloudCleanerConfig():  # pylint: disable=R0902
     def warning(self, msg, *args):
         """Log at the warning level"""
         self.__log.warning("WARN: %s" % msg, *args)
+
+
+def wants_help(args):
+    """
+    Check whether command line arguments ask for the help of the command
+    itself, rather than of a resource type.
+
+    :param args: The command line arguments
+    :return: True if -h or --help comes before any resource type
+    """
+    for arg in args:
+        if arg in HELP_OPTIONS:
+            return True
+        if not arg.startswith('-'):
+            return False
+    return False
+
+
+def target_label(target):
+    """
+    Name a target of a multi-cloud run, for reports and file names.
+
+    :param target: A (cloud, region) tuple
+    :return: "cloud" or "cloud-region"
+    """
+    cloud, region = target
+    if region is None:
+        return cloud
+    return "%s-%s" % (cloud, region)
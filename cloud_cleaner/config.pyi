@@ -1,5 +1,22 @@
-from argparse import ArgumentParser, _SubParsersAction
+from argparse import ArgumentParser
+from typing import List, Optional, Tuple
 from openstack import Connection
+from cloud_cleaner.executor import DeletionExecutor
+from cloud_cleaner.inventory import Inventory
+from cloud_cleaner.journal import DeletionJournal
+from cloud_cleaner.ledger import NotificationLedger
+from cloud_cleaner.metrics import Metrics
+from cloud_cleaner.throttle import RateControl
+
+
+DATE_FORMAT: str
+DEFAULT_ARGUMENTS: list
+PER_TARGET_OPTIONS: Tuple[str, ...]
+ONLINE_OPTIONS: Tuple[Tuple[str, str], ...]
+TARGETED_OPTIONS: Tuple[str, ...]
+SINGLE_TYPE_OPTIONS: Tuple[Tuple[str, str], ...]
+RUN_ONCE_OPTIONS: Tuple[Tuple[str, str], ...]
+GROUP_RESOURCE: str
 
 
 class CloudCleanerConfig(object):
@@ -7,22 +24,62 @@ class CloudCleanerConfig(object):
                  parser: ArgumentParser = None,
                  args: list = None): ...
 
-    def add_subparser(self, name: str) -> _SubParsersAction: ...
+    def add_subparser(self, name: str,
+                      help_text: Optional[str] = None) -> ArgumentParser: ...
 
     def set_args(self, args: list): ...
 
+    def select_resource(self) -> Optional[str]: ...
+
     def parse_args(self) -> ArgumentParser: ...
 
+    def __check_offline(self): ...
+
+    def __check_single_type(self): ...
+
+    def __check_watch(self): ...
+
+    def __check_targets(self): ...
+
+    def __register_cloud_options(self): ...
+
     def get_arg(self, name: str) -> any: ...
 
     def get_resource(self) -> str: ...
 
+    def get_targets(self) -> List[Tuple[str, Optional[str]]]: ...
+
+    def target_args(self, target: Tuple[str, Optional[str]]) -> List[str]: ...
+
     def get_cloud(self): ...
 
     def get_conn(self) -> Connection: ...
 
+    def get_inventory(self) -> Inventory: ...
+
+    def get_executor(self) -> DeletionExecutor: ...
+
+    def get_rate_control(self) -> RateControl: ...
+
+    def get_ledger(self) -> NotificationLedger: ...
+
+    def get_journal(self) -> DeletionJournal: ...
+
+    def close(self): ...
+
+    def get_metrics(self) -> Metrics: ...
+
+    def write_metrics(self): ...
+
+    def __time_auth(self, conn: Connection): ...
+
+    def __cache_auth(self, conn: Connection): ...
+
     def info(self, msg, *args): ...
 
     def debug(self, msg, *args): ...
 
     def warning(self, msg, *args): ...
+
+
+def target_label(target: Tuple[str, Optional[str]]) -> str: ...
@@ -0,0 +1,104 @@
+"""
+Contains the DeletionExecutor class for running delete calls against
+OpenStack in parallel
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+
+
+class DeletionResult(object):  # pylint: disable=R0205,R0903
+    """
+    The outcome of deleting a single item. "error" holds the exception raised
+    by the delete call, or None if the item was deleted.
+    """
+    def __init__(self, item, error=None):
+        self.item = item
+        self.error = error
+
+    @property
+    def deleted(self):
+        """True if the item was deleted"""
+        return self.error is None
+
+
+class DeletionError(Exception):
+    """
+    Error raised once a pass of deletions is over, if any of them failed.
+    "failed" holds the DeletionResult of each deletion that failed.
+    """
+    def __init__(self, failed, total, noun='resources'):
+        super().__init__("Failed to delete %d of %d %s" %
+                         (len(failed), total, noun))
+        self.failed = failed
+        self.total = total
+
+
+class DeletionExecutor(object):  # pylint: disable=R0205
+    """
+    Runs delete calls on a pool of worker threads. The number of workers is
+    bounded by "concurrency", and the number of calls in flight against any
+    one endpoint (e.g. "compute" or "network") is bounded by "in_flight".
+
+    Results are always reported in the order the items were given, no matter
+    in which order the calls complete, and a concurrency of 1 performs the
+    deletes one at a time in that same order.
+    """
+    def __init__(self, concurrency=1, in_flight=None, metrics=None):
+        self.__concurrency = max(1, int(concurrency))
+        if in_flight is None:
+            in_flight = self.__concurrency
+        self.__in_flight = max(1, int(in_flight))
+        self.__endpoints = {}
+        self.__metrics = metrics
+        self.__lock = Lock()
+
+    def run(self, endpoint, delete, items, on_result=None):
+        """
+        Call "delete" with the id of each of the items.
+
+        :param endpoint: Name of the endpoint the delete calls are made to
+        :param delete: Callable performing the delete of a single item id
+        :param items: The items to delete
+        :param on_result: Callable given each DeletionResult as soon as its
+                          call completes, from the worker thread that made it
+        :return: A list of DeletionResult, in the same order as items
+        """
+        items = list(items)
+        if not items:
+            return []
+        gate = self.__gate(endpoint)
+
+        def _delete(item):
+            with gate:
+                started = time.perf_counter()
+                try:
+                    delete(item.id)
+                    result = DeletionResult(item)
+                except Exception as error:  # pylint: disable=broad-except
+                    result = DeletionResult(item, error)
+                self.__measure(endpoint, result,
+                               time.perf_counter() - started)
+            if on_result is not None:
+                on_result(result)
+            return result
+
+        if self.__concurrency == 1:
+            return [_delete(item) for item in items]
+        workers = min(self.__concurrency, len(items))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(_delete, items))
+
+    def __gate(self, endpoint):
+        with self.__lock:
+            if endpoint not in self.__endpoints:
+                self.__endpoints[endpoint] = BoundedSemaphore(self.__in_flight)
+            return self.__endpoints[endpoint]
+
+    def __measure(self, endpoint, result, seconds):
+        if self.__metrics is None:
+            return
+        self.__metrics.observe('delete_seconds', seconds, endpoint=endpoint)
+        self.__metrics.count('deletes', endpoint=endpoint,
+                             outcome='deleted' if result.deleted
+                             else 'failed')
@@ -0,0 +1,32 @@
+from typing import Any, Callable, Iterable, List
+from cloud_cleaner.metrics import Metrics
+
+
+class DeletionResult(object):
+    def __init__(self, item: Any, error: Exception = None): ...
+
+    @property
+    def deleted(self) -> bool: ...
+
+
+class DeletionError(Exception):
+    failed: List[DeletionResult]
+    total: int
+
+    def __init__(self, failed: List[DeletionResult], total: int,
+                 noun: str = 'resources'): ...
+
+
+class DeletionExecutor(object):
+    def __init__(self, concurrency: int = 1, in_flight: int = None,
+                 metrics: Metrics = None): ...
+
+    def run(self, endpoint: str, delete: Callable[[str], Any],
+            items: Iterable,
+            on_result: Callable[[DeletionResult], Any] = None
+            ) -> List[DeletionResult]: ...
+
+    def __gate(self, endpoint: str): ...
+
+    def __measure(self, endpoint: str, result: DeletionResult,
+                  seconds: float): ...
@@ -0,0 +1,131 @@
+"""
+Contains the Inventory class, a per-run snapshot of the resources listed
+from the OpenStack endpoint
+"""
+from cloud_cleaner.inventory_file import read_inventory
+
+
+class Inventory(object):  # pylint: disable=R0205
+    """
+    Holds one listing of each resource collection for the duration of a run,
+    so the process, clean and email phases of a run all share a single
+    listing. "stream" yields the listing page by page without holding on to
+    it, and "retain" keeps only the items that make it through the caller's
+    filters as the snapshot of the collection. Later passes are served from
+    that snapshot.
+
+    The snapshot is only updated when the caller asks for it: resources that
+    delete items should "discard" them, "merge" stores items that changed,
+    and "refresh" drops a collection so that it will be fetched again on the
+    next request.
+
+    Streamed listings can also be written to an InventoryWriter as they are
+    listed, given as "dump", or read back from such a file, given as
+    "source", in place of listing them from OpenStack.
+    """
+    def __init__(self, config=None, dump=None, source=None):
+        self.__config = config
+        self.__dump = dump
+        self.__source = source
+        self.__collections = {}
+
+    def stream(self, name, pages):
+        """
+        Iterate over the named collection. If a snapshot of it is stored, the
+        snapshot is used. Otherwise the items are streamed from the pages of
+        the listing as they are fetched, and are not stored.
+
+        :param name: Name of the collection, e.g. "servers"
+        :param pages: Callable returning an iterable of pages of the listing
+        :return: Iterator over the items in the collection
+        """
+        if name in self.__collections:
+            self.__debug("Using stored listing of %s" % name)
+            return iter(list(self.__collections[name]))
+        if self.__source is not None:
+            self.__debug("Reading %s from %s" % (name, self.__source))
+            return read_inventory(self.__source, name)
+        return self.__stream(name, pages)
+
+    def retain(self, name, items):
+        """
+        Pass items through unchanged, storing them as the snapshot of the
+        named collection once all of them have been consumed.
+
+        :param name: Name of the collection
+        :param items: Iterable of the items to retain
+        :return: Iterator over the items
+        """
+        kept = []
+        for item in items:
+            kept.append(item)
+            yield item
+        self.__collections[name] = kept
+
+    def merge(self, name, ids, items):
+        """
+        Replace items in the stored snapshot of a collection with their
+        current state, such as the changes listed since the snapshot was
+        taken. Items whose ids are given but are not among the new items are
+        removed.
+
+        :param name: Name of the collection
+        :param ids: The ids of all of the items that changed
+        :param items: The changed items to store
+        :return: None
+        """
+        if name not in self.__collections:
+            return
+        self.discard(name, ids)
+        self.__collections[name].extend(items)
+
+    def discard(self, name, ids):
+        """
+        Remove items from the stored snapshot of a collection, such as after
+        they have been deleted from OpenStack.
+
+        :param name: Name of the collection
+        :param ids: The ids of the items to remove
+        :return: None
+        """
+        if name not in self.__collections:
+            return
+        ids = set(ids)
+        self.__collections[name] = [item for item in self.__collections[name]
+                                    if item.id not in ids]
+
+    def refresh(self, name=None):
+        """
+        Drop the snapshot of a collection, so that the next request for it
+        lists it from OpenStack again.
+
+        :param name: Name of the collection, or None to drop all of them
+        :return: None
+        """
+        if name is None:
+            self.__collections.clear()
+        else:
+            self.__collections.pop(name, None)
+
+    def __contains__(self, name):
+        """
+        :param name: Name of the collection
+        :return: True if a snapshot of the collection is stored
+        """
+        return name in self.__collections
+
+    def __stream(self, name, pages):
+        self.__debug("Listing %s from OpenStack" % name)
+        count = 0
+        for number, page in enumerate(pages(), 1):
+            self.__debug("Fetched page %d of %s, %d items" %
+                         (number, name, len(page)))
+            count += len(page)
+            if self.__dump is not None:
+                self.__dump.write(name, page)
+            yield from page
+        self.__debug("Listed %d %s" % (count, name))
+
+    def __debug(self, msg):
+        if self.__config is not None:
+            self.__config.debug(msg)
@@ -0,0 +1,25 @@
+from typing import Callable, Iterable, Iterator
+from cloud_cleaner.inventory_file import InventoryWriter
+
+
+class Inventory(object):
+    def __init__(self, config: CloudCleanerConfig = None,
+                 dump: InventoryWriter = None, source: str = None): ...
+
+    def stream(self, name: str,
+               pages: Callable[[], Iterable[list]]) -> Iterator: ...
+
+    def retain(self, name: str, items: Iterable) -> Iterator: ...
+
+    def merge(self, name: str, ids: Iterable[str], items: Iterable): ...
+
+    def discard(self, name: str, ids: Iterable[str]): ...
+
+    def refresh(self, name: str = None): ...
+
+    def __contains__(self, name: str) -> bool: ...
+
+    def __stream(self, name: str,
+                 pages: Callable[[], Iterable[list]]) -> Iterator: ...
+
+    def __debug(self, msg: str): ...
@@ -0,0 +1,81 @@
+"""
+Contains the InventoryWriter class and the read_inventory function, which
+store the listings of a run in a file and read them back, so that the
+filters can be run again without a connection to OpenStack
+"""
+import json
+from collections import OrderedDict
+from threading import Lock
+
+
+class InventoryWriter(object):  # pylint: disable=R0205,R0903
+    """
+    Writes the items of listings to a file as they are listed, one JSON
+    object per line (NDJSON). Each line holds the name of the collection the
+    item was listed in and the item as OpenStack returned it, so the
+    listings of several resource types can share a file. The file is
+    emptied when the writer is created.
+    """
+    def __init__(self, path):
+        self.__path = path
+        self.__lock = Lock()
+        with open(path, 'w'):
+            pass
+
+    def write(self, collection, items):
+        """
+        Append items of a collection to the file. Resource types can be
+        listed at the same time, so each batch of items is written whole.
+
+        :param collection: Name of the collection, e.g. "servers"
+        :param items: Iterable of the items, as listed
+        :return: None
+        """
+        lines = [_line(collection, _raw(item)) for item in items]
+        with self.__lock, open(self.__path, 'a') as dump:
+            dump.writelines(lines)
+
+
+def read_inventory(path, collection):
+    """
+    Stream the items of a collection from a file written by InventoryWriter.
+    The file is read a line at a time, so its size does not matter, and
+    lines of other collections are skipped without being parsed.
+
+    :param path: Path of the file
+    :param collection: Name of the collection, e.g. "servers"
+    :return: Generator of the items, whose fields can be read as
+             attributes or as keys, as with openstacksdk resources
+    """
+    # Imported here, as only runs from a file need it, and it loads YAML
+    # pylint: disable=import-outside-toplevel
+    from munch import Munch
+    prefix = '{"collection": %s, ' % json.dumps(collection)
+    with open(path) as dump:
+        for line in dump:
+            if line.startswith(prefix):
+                yield Munch(json.loads(line)['item'])
+
+
+def _line(collection, item):
+    # The collection comes first, so that it can be matched on the start of
+    # the line. Plain dicts do not keep their order before Python 3.6
+    return json.dumps(OrderedDict([('collection', collection),
+                                   ('item', item)]), default=str) + '\n'
+
+
+def _raw(item):
+    """
+    Convert a listed item to a dict of its fields.
+
+    :param item: An openstacksdk resource, or a dict
+    :return: dict of the fields of the item
+    """
+    to_dict = getattr(item, 'to_dict', None)
+    if callable(to_dict) and not isinstance(item, dict):
+        # Leave out the fields that openstacksdk computes, such as the
+        # location, which are the same for every item
+        return to_dict(computed=False)
+    if isinstance(item, dict):
+        return dict(item)
+    return vars(item)
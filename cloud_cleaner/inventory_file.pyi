@@ -0,0 +1,16 @@
+from typing import Any, Dict, Iterable, Iterator
+
+
+class InventoryWriter(object):
+    def __init__(self, path: str): ...
+
+    def write(self, collection: str, items: Iterable[Any]): ...
+
+
+def read_inventory(path: str, collection: str) -> Iterator[Any]: ...
+
+
+def _line(collection: str, item: Dict[str, Any]) -> str: ...
+
+
+def _raw(item: Any) -> Dict[str, Any]: ...
@@ -0,0 +1,138 @@
+"""
+Contains the DeletionJournal class, an append-only on-disk record of the
+deletions intended and completed, from which an interrupted run is resumed
+"""
+import json
+import os
+from collections import OrderedDict
+from threading import Lock
+
+# Number of completed deletions recorded between syncs of the journal
+DEFAULT_SYNC_BATCH = 100
+
+
+class DeletionJournal(object):  # pylint: disable=R0205
+    """
+    Records each deletion a run intends to make before making it, and each
+    deletion as it completes, one JSON record per line. Records are only
+    appended, so a crash can at worst lose the last few lines.
+
+    Intents are synced to disk before any of their deletes are made. The
+    completions are synced in batches, as losing some of them only means
+    that a resumed run deletes those resources again, which OpenStack
+    ignores for resources that are already gone.
+
+    Each run that deletes, other than one that resumes, marks its start in
+    the journal, and only the records after the last start are replayed.
+    Dry runs and runs that only write a plan leave the journal alone.
+    """
+    def __init__(self, path, sync_batch=DEFAULT_SYNC_BATCH):
+        self.__path = path
+        self.__sync_batch = max(1, sync_batch)
+        self.__file = None
+        self.__pending = 0
+        self.__lock = Lock()
+
+    def start(self):
+        """
+        Mark the start of a new run, so that the deletions of earlier runs are
+        no longer outstanding.
+
+        :return: None
+        """
+        self.__append([{'op': 'start'}], sync=True)
+
+    def intend(self, resource, entries):
+        """
+        Record the deletions about to be made, and sync them to disk.
+
+        :param resource: Type name of the resources
+        :param entries: List of dicts of the key attributes of each resource,
+                        including its "id"
+        :return: None
+        """
+        self.__append([{'op': 'intend', 'resource': resource, 'item': entry}
+                       for entry in entries], sync=True)
+
+    def record(self, resource, result):
+        """
+        Record the outcome of a deletion. Safe to call from the worker threads
+        of a DeletionExecutor.
+
+        :param resource: Type name of the resource
+        :param result: The DeletionResult of the deletion
+        :return: None
+        """
+        op = 'done' if result.deleted else 'failed'
+        self.__append([{'op': op, 'resource': resource,
+                        'id': result.item.id}])
+
+    def flush(self):
+        """
+        Sync any records not yet synced to disk.
+
+        :return: None
+        """
+        with self.__lock:
+            self.__sync()
+
+    def close(self):
+        """Sync and close the journal"""
+        with self.__lock:
+            if self.__file is not None:
+                self.__sync()
+                self.__file.close()
+                self.__file = None
+
+    def outstanding(self):
+        """
+        Replay the journal, finding the deletions of the last run that were
+        intended but not completed. Deletions that failed are outstanding.
+
+        :return: OrderedDict of resource type name to a list of the entries
+                 of its outstanding deletions, in the order they were intended
+        """
+        self.flush()
+        pending = OrderedDict()
+        if not os.path.exists(self.__path):
+            return pending
+        with open(self.__path) as journal:
+            for line in journal:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # The last line may be cut short by a crash
+                    continue
+                _replay(pending, record)
+        return OrderedDict((resource, list(items.values()))
+                           for resource, items in pending.items() if items)
+
+    def __append(self, records, sync=False):
+        with self.__lock:
+            if self.__file is None:
+                # Kept open between appends, and closed by #close
+                # pylint: disable=consider-using-with
+                self.__file = open(self.__path, 'a')
+            for record in records:
+                self.__file.write(json.dumps(record, sort_keys=True) + '\n')
+            self.__pending += len(records)
+            if sync or self.__pending >= self.__sync_batch:
+                self.__sync()
+
+    def __sync(self):
+        if self.__file is None or not self.__pending:
+            return
+        self.__file.flush()
+        os.fsync(self.__file.fileno())
+        self.__pending = 0
+
+
+def _replay(pending, record):
+    op = record.get('op')
+    if op == 'start':
+        pending.clear()
+    elif op == 'intend':
+        items = pending.setdefault(record['resource'], OrderedDict())
+        items[record['item']['id']] = record['item']
+    elif op == 'done':
+        pending.get(record['resource'], {}).pop(record['id'], None)
@@ -0,0 +1,28 @@
+from collections import OrderedDict
+from typing import Any, Dict, List
+
+
+DEFAULT_SYNC_BATCH: int
+
+
+class DeletionJournal(object):
+    def __init__(self, path: str, sync_batch: int = ...): ...
+
+    def start(self): ...
+
+    def intend(self, resource: str, entries: List[Dict[str, Any]]): ...
+
+    def record(self, resource: str, result: DeletionResult): ...
+
+    def flush(self): ...
+
+    def close(self): ...
+
+    def outstanding(self) -> OrderedDict: ...
+
+    def __append(self, records: List[Dict[str, Any]], sync: bool = ...): ...
+
+    def __sync(self): ...
+
+
+def _replay(pending: OrderedDict, record: Dict[str, Any]): ...
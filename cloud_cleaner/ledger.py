@@ -0,0 +1,71 @@
+"""
+Contains the NotificationLedger class, an on-disk record of the warnings
+already sent to resource owners
+"""
+from datetime import datetime, timezone
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS notifications (
+    resource_id TEXT NOT NULL,
+    tier INTEGER NOT NULL,
+    notified_at TEXT NOT NULL,
+    PRIMARY KEY (resource_id, tier)
+)
+'''
+
+
+class NotificationLedger(object):  # pylint: disable=R0205
+    """
+    Records which warning tier each resource has been warned about, so that
+    runs repeated from cron only send warnings that are new or escalated.
+    Lookups go through the primary key index on (resource_id, tier).
+    """
+    def __init__(self, path):
+        # Imported here, as only runs with --ledger need it
+        # pylint: disable=import-outside-toplevel
+        import sqlite3
+        self.__db = sqlite3.connect(path)
+        with self.__db:
+            self.__db.execute(SCHEMA)
+
+    def should_notify(self, resource_id, tier):
+        """
+        Check whether a warning needs to be sent for a resource.
+
+        :param resource_id: The id of the resource
+        :param tier: The warning tier the resource has reached
+        :return: True if no warning of this tier or above has been sent
+        """
+        row = self.__db.execute(
+            'SELECT 1 FROM notifications WHERE resource_id = ? AND tier >= ?'
+            ' LIMIT 1', (resource_id, tier)).fetchone()
+        return row is None
+
+    def record(self, notified):
+        """
+        Record warnings that have been sent, in a single transaction.
+
+        :param notified: Iterable of (resource_id, tier) pairs
+        :return: None
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        with self.__db:
+            self.__db.executemany(
+                'INSERT OR REPLACE INTO notifications VALUES (?, ?, ?)',
+                ((resource_id, tier, now) for resource_id, tier in notified))
+
+    def forget(self, resource_ids):
+        """
+        Remove the records of resources, such as after they are deleted.
+
+        :param resource_ids: Iterable of resource ids
+        :return: None
+        """
+        with self.__db:
+            self.__db.executemany(
+                'DELETE FROM notifications WHERE resource_id = ?',
+                ((resource_id,) for resource_id in resource_ids))
+
+    def close(self):
+        """Close the ledger database"""
+        self.__db.close()
@@ -0,0 +1,16 @@
+from typing import Iterable, Tuple
+
+
+SCHEMA: str
+
+
+class NotificationLedger(object):
+    def __init__(self, path: str): ...
+
+    def should_notify(self, resource_id: str, tier: int) -> bool: ...
+
+    def record(self, notified: Iterable[Tuple[str, int]]): ...
+
+    def forget(self, resource_ids: Iterable[str]): ...
+
+    def close(self): ...
@@ -0,0 +1,225 @@
+"""
+Contains the Metrics class, which collects counts and timings of a run and
+exports them as a Prometheus textfile or a JSON summary
+"""
+import json
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+
+PREFIX = 'cloud_cleaner_'
+# Upper bounds, in seconds, of the buckets of every histogram
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0, 60.0)
+
+
+class Metrics(object):  # pylint: disable=R0205
+    """
+    Counters, gauges and histograms, each identified by a name and a set of
+    labels. Every method is safe to call from several threads. Histograms
+    keep a count per bucket rather than the observations themselves, so
+    their size does not depend on the number of observations.
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS, clock=time.perf_counter):
+        self.__buckets = tuple(buckets)
+        self.__clock = clock
+        self.__counters = {}
+        self.__gauges = {}
+        self.__histograms = {}
+        self.__lock = Lock()
+
+    def count(self, name, value=1, **labels):
+        """
+        Add to a counter.
+
+        :param name: Name of the counter
+        :param value: Amount to add
+        :param labels: Labels of the counter
+        :return: None
+        """
+        key = (name, _labels(labels))
+        with self.__lock:
+            self.__counters[key] = self.__counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """
+        Set a gauge.
+
+        :param name: Name of the gauge
+        :param value: The new value
+        :param labels: Labels of the gauge
+        :return: None
+        """
+        with self.__lock:
+            self.__gauges[(name, _labels(labels))] = value
+
+    def observe(self, name, seconds, **labels):
+        """
+        Record a duration in a histogram.
+
+        :param name: Name of the histogram
+        :param seconds: The duration
+        :param labels: Labels of the histogram
+        :return: None
+        """
+        key = (name, _labels(labels))
+        bucket = bisect_left(self.__buckets, seconds)
+        with self.__lock:
+            histogram = self.__histograms.get(key)
+            if histogram is None:
+                # A count per bucket, then one for +Inf, then the sum
+                histogram = [0] * (len(self.__buckets) + 1) + [0.0]
+                self.__histograms[key] = histogram
+            histogram[bucket] += 1
+            histogram[-1] += seconds
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Time the body of a with block in a histogram, whether or not it
+        raises.
+
+        :param name: Name of the histogram
+        :param labels: Labels of the histogram
+        """
+        started = self.__clock()
+        try:
+            yield
+        finally:
+            self.observe(name, self.__clock() - started, **labels)
+
+    def timed(self, name, func, **labels):
+        """
+        Wrap a callable so that every call to it is timed in a histogram.
+
+        :param name: Name of the histogram
+        :param func: The callable to wrap
+        :param labels: Labels of the histogram
+        :return: The wrapped callable
+        """
+        def _timed(*args, **kwargs):
+            with self.timer(name, **labels):
+                return func(*args, **kwargs)
+        return _timed
+
+    def summary(self):
+        """
+        Fetch all of the metrics collected so far. Histogram buckets are
+        cumulative, as in Prometheus.
+
+        :return: dict of "counters", "gauges" and "histograms", each a list
+                 of dicts with the "name" and "labels" of the metric
+        """
+        with self.__lock:
+            counters = sorted(self.__counters.items())
+            gauges = sorted(self.__gauges.items())
+            histograms = sorted((key, list(value)) for key, value
+                                in self.__histograms.items())
+        summary = {'counters': [], 'gauges': [], 'histograms': []}
+        for kind, items in (('counters', counters), ('gauges', gauges)):
+            for (name, labels), value in items:
+                summary[kind].append({'name': name,
+                                      'labels': _strings(labels),
+                                      'value': value})
+        for (name, labels), histogram in histograms:
+            buckets, total = [], 0
+            for bound, count in zip(self.__buckets + ('+Inf',),
+                                    histogram[:-1]):
+                total += count
+                buckets.append([bound, total])
+            summary['histograms'].append({
+                'name': name, 'labels': _strings(labels), 'count': total,
+                'sum': histogram[-1], 'buckets': buckets})
+        return summary
+
+    def prometheus(self):
+        """
+        Render all of the metrics collected so far in the Prometheus text
+        exposition format.
+
+        :return: The text, ending in a newline
+        """
+        summary = self.summary()
+        lines = []
+        typed = set()
+
+        def _type(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append('# TYPE %s%s %s' % (PREFIX, name, kind))
+        for counter in summary['counters']:
+            _type(counter['name'] + '_total', 'counter')
+            lines.append(_sample(counter['name'] + '_total',
+                                 counter['labels'], counter['value']))
+        for gauge in summary['gauges']:
+            _type(gauge['name'], 'gauge')
+            lines.append(_sample(gauge['name'], gauge['labels'],
+                                 gauge['value']))
+        for histogram in summary['histograms']:
+            name, labels = histogram['name'], histogram['labels']
+            _type(name, 'histogram')
+            for bound, count in histogram['buckets']:
+                lines.append(_sample(name + '_bucket',
+                                     dict(labels, le=str(bound)), count))
+            lines.append(_sample(name + '_sum', labels, histogram['sum']))
+            lines.append(_sample(name + '_count', labels,
+                                 histogram['count']))
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path):
+        """
+        Write the metrics to a Prometheus textfile, such as for the textfile
+        collector of the node exporter. The file is replaced in one step, so
+        it is never read half written.
+
+        :param path: Path of the file
+        :return: None
+        """
+        _replace(path, self.prometheus())
+
+    def write_json(self, path):
+        """
+        Write the metrics to a JSON file, as returned by #summary.
+
+        :param path: Path of the file
+        :return: None
+        """
+        _replace(path, json.dumps(self.summary(), indent=2, sort_keys=True))
+
+
+def _labels(labels):
+    if len(labels) < 2:
+        return tuple(labels.items())
+    return tuple(sorted(labels.items()))
+
+
+def _strings(labels):
+    return dict((key, str(value)) for key, value in labels)
+
+
+def _sample(name, labels, value):
+    if labels:
+        rendered = ','.join('%s="%s"' % (key, _escape(label))
+                            for key, label in sorted(labels.items()))
+        return '%s%s{%s} %s' % (PREFIX, name, rendered, _number(value))
+    return '%s%s %s' % (PREFIX, name, _number(value))
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n',
+                                                                   '\\n')
+
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _replace(path, text):
+    partial = path + '.partial'
+    with open(partial, 'w') as metrics_file:
+        metrics_file.write(text)
+    os.replace(partial, path)
@@ -0,0 +1,47 @@
+from typing import Any, Callable, Dict, Iterable, Tuple
+
+
+PREFIX: str
+DEFAULT_BUCKETS: Tuple[float, ...]
+
+
+class Metrics(object):
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS,
+                 clock: Callable[[], float] = ...): ...
+
+    def count(self, name: str, value: float = 1, **labels: Any): ...
+
+    def set(self, name: str, value: float, **labels: Any): ...
+
+    def observe(self, name: str, seconds: float, **labels: Any): ...
+
+    def timer(self, name: str, **labels: Any): ...
+
+    def timed(self, name: str, func: Callable, **labels: Any
+              ) -> Callable: ...
+
+    def summary(self) -> Dict[str, Any]: ...
+
+    def prometheus(self) -> str: ...
+
+    def write_textfile(self, path: str): ...
+
+    def write_json(self, path: str): ...
+
+
+def _labels(labels: Dict[str, Any]) -> Tuple[Tuple[str, str], ...]: ...
+
+
+def _strings(labels: Tuple[Tuple[str, Any], ...]) -> Dict[str, str]: ...
+
+
+def _sample(name: str, labels: Dict[str, str], value: float) -> str: ...
+
+
+def _escape(value: str) -> str: ...
+
+
+def _number(value: float) -> str: ...
+
+
+def _replace(path: str, text: str): ...
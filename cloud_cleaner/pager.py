@@ -0,0 +1,93 @@
+"""
+Contains helpers for listing resources from OpenStack one page at a time
+"""
+from queue import Full, Queue
+from threading import Event, Thread
+
+DEFAULT_PAGE_SIZE = 1000
+DEFAULT_PREFETCH = 1
+# Marks the end of the pages passed from a prefetch thread
+_END = object()
+
+
+def pages(fetch, page_size=DEFAULT_PAGE_SIZE, query=None):
+    """
+    Generate the pages of a listing, using marker/limit pagination. Each page
+    is fetched only when the previous one has been consumed, so only one page
+    of the listing is held in memory at a time.
+
+    The listing ends at the first empty page rather than the first short one,
+    because services cap the page size at their own maximum and return short
+    pages before the end of the listing when page_size is larger than it.
+
+    :param fetch: Callable taking query parameters, including "limit" and
+                  "marker", and returning one page of items
+    :param page_size: Maximum number of items to request per page
+    :param query: Other query parameters to send with every request
+    :return: Generator of lists of items
+    """
+    params = dict(query or {})
+    params['limit'] = page_size
+    while True:
+        page = list(fetch(**params))
+        if not page:
+            return
+        yield page
+        params['marker'] = page[-1].id
+
+
+def prefetch(source, depth=DEFAULT_PREFETCH):
+    """
+    Fetch pages on a background thread, up to "depth" pages ahead of the
+    caller, so that the requests for the next pages overlap with the caller's
+    processing of the current one.
+
+    Marker pagination needs the last item of a page before the next page can
+    be requested, so the pages themselves are still fetched one after the
+    other; it is the fetching and the filtering that run concurrently.
+
+    :param source: Iterable of pages, such as the result of #pages
+    :param depth: Maximum number of pages to fetch ahead. 0 disables the
+                  background thread.
+    :return: Iterator over the pages
+    """
+    if depth < 1:
+        return iter(source)
+    return _prefetch(source, depth)
+
+
+def _prefetch(source, depth):
+    queue = Queue(maxsize=depth)
+    stop = Event()
+
+    def _produce():
+        try:
+            for page in source:
+                if not _put(queue, (page, None), stop):
+                    return
+            _put(queue, (_END, None), stop)
+        except Exception as error:  # pylint: disable=broad-except
+            _put(queue, (_END, error), stop)
+
+    Thread(target=_produce, daemon=True).start()
+    try:
+        while True:
+            page, error = queue.get()
+            if error is not None:
+                raise error
+            if page is _END:
+                return
+            yield page
+    finally:
+        # Let the thread finish if the caller stops early
+        stop.set()
+
+
+def _put(queue, item, stop):
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=0.1)
+            return True
+        except Full:
+            continue
+    return False
@@ -0,0 +1,20 @@
+from queue import Queue
+from threading import Event
+from typing import Any, Callable, Dict, Iterable, Iterator, List
+
+
+DEFAULT_PAGE_SIZE: int
+DEFAULT_PREFETCH: int
+
+
+def pages(fetch: Callable[..., Iterable], page_size: int = ...,
+          query: Dict[str, Any] = None) -> Iterator[List]: ...
+
+
+def prefetch(source: Iterable[List], depth: int = ...) -> Iterator[List]: ...
+
+
+def _prefetch(source: Iterable[List], depth: int) -> Iterator[List]: ...
+
+
+def _put(queue: Queue, item: Any, stop: Event) -> bool: ...
@@ -0,0 +1,60 @@
+"""
+Contains helpers for saving the resources selected by a dry run to a plan
+file, and for reading the plan back so that it can be applied
+"""
+import json
+import os
+from datetime import datetime, timezone
+
+PLAN_VERSION = 1
+
+
+class PlanError(Exception):
+    """Error indicating a plan file cannot be applied"""
+
+
+def write_plan(path, resource, entries, created=None):
+    """
+    Write a plan file. The file is written next to its final path and then
+    renamed over it, so a plan is never left half written.
+
+    :param path: Path of the plan file
+    :param resource: Type name of the resource the plan is for
+    :param entries: List of dicts of the key attributes of each item
+    :param created: When the resources were listed. Defaults to now
+    :return: None
+    """
+    if created is None:
+        created = datetime.now(timezone.utc)
+    # Naive UTC with a "Z", which parse_timestamp reads on every Python
+    # release, with or without datetime.fromisoformat
+    created = created.astimezone(timezone.utc).replace(tzinfo=None)
+    plan = {
+        'version': PLAN_VERSION,
+        'resource': resource,
+        'created': created.isoformat() + 'Z',
+        'items': entries
+    }
+    partial = path + '.partial'
+    with open(partial, 'w') as plan_file:
+        json.dump(plan, plan_file, indent=2, sort_keys=True)
+    os.replace(partial, path)
+
+
+def read_plan(path):
+    """
+    Read a plan file written by #write_plan.
+
+    :param path: Path of the plan file
+    :return: dict with the "resource", "created" and "items" of the plan
+    """
+    with open(path) as plan_file:
+        try:
+            plan = json.load(plan_file)
+        except ValueError as error:
+            raise PlanError("%s is not a plan file: %s" %
+                            (path, error)) from error
+    if not isinstance(plan, dict) or plan.get('version') != PLAN_VERSION:
+        raise PlanError("%s is not a version %d plan file" %
+                        (path, PLAN_VERSION))
+    return plan
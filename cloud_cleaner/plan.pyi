@@ -0,0 +1,16 @@
+from datetime import datetime
+from typing import Any, Dict, List
+
+
+PLAN_VERSION: int
+
+
+class PlanError(Exception):
+    ...
+
+
+def write_plan(path: str, resource: str, entries: List[Dict[str, Any]],
+               created: datetime = None): ...
+
+
+def read_plan(path: str) -> Dict[str, Any]: ...
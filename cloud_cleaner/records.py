@@ -0,0 +1,77 @@
+"""
+Contains the Record class and the record_type function, which build compact
+records of the few fields that cloud-cleaner reads from each listed item
+"""
+
+
+class Record(object):  # pylint: disable=R0205
+    """
+    The fields of one listed item that a resource type reads, without the
+    rest of the item. Listed items carry every field of the API, nested
+    addresses, metadata and flavors included, while a record only holds a
+    slot for each field named by its type, so large listings take a
+    fraction of the memory.
+
+    Fields are read as attributes or as keys, as with openstacksdk resources.
+    Subclasses are made with #record_type.
+    """
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    @classmethod
+    def of(cls, item):
+        """
+        Project a listed item on to a record. Fields the item does not have
+        are None.
+
+        :param item: An openstacksdk resource, a munch, or a record
+        :return: The record
+        """
+        if isinstance(item, cls):
+            return item
+        return cls(*[getattr(item, name, None) for name in cls.__slots__])
+
+    def __getitem__(self, name):
+        if name not in self.__slots__:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and \
+            all(getattr(self, name) == getattr(other, name)
+                for name in self.__slots__)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, ', '.join(
+            '%s=%r' % (name, getattr(self, name)) for name in self.__slots__))
+
+
+def record_type(name, fields):
+    """
+    Make a Record subclass with a slot for each of the given fields.
+
+    :param name: Name of the class
+    :param fields: Names of the fields
+    :return: The class
+    """
+    return type(name, (Record,), {'__slots__': tuple(fields)})
+
+
+def project(record, items):
+    """
+    Project listed items on to records as they are iterated.
+
+    :param record: The Record subclass
+    :param items: Iterable of the listed items
+    :return: Generator of the records
+    """
+    for item in items:
+        yield record.of(item)
@@ -0,0 +1,22 @@
+from typing import Any, Iterable, Iterator, Type
+
+
+class Record(object):
+    def __init__(self, *values: Any): ...
+
+    @classmethod
+    def of(cls, item: Any) -> Record: ...
+
+    def __getitem__(self, name: str) -> Any: ...
+
+    def __eq__(self, other: Any) -> bool: ...
+
+    def __ne__(self, other: Any) -> bool: ...
+
+    def __repr__(self) -> str: ...
+
+
+def record_type(name: str, fields: Iterable[str]) -> Type[Record]: ...
+
+
+def project(record: Type[Record], items: Iterable[Any]) -> Iterator[Record]: ...
@@ -6,16 +6,57 @@ directly outside of test cases. They should be generally regarded as
 singleton classes. These are intended mainly to serve as a namespace for the
 related activity and actions of configuring and processing CLI arguments
 
-Constants: ALL_RESOURCES - a dict with an instance of each of the
-concrete classes. These should be considered singleton objects and their
-instances ought to be acted upon directly, instead of creating new instances
-of their underlying classes.
-"""
-from .server import Server
-from .fip import Fip
+Group Class: group.ResourceGroup - runs several resource types together,
+as the "all" resource type
+
+Constants: ALL_RESOURCES - a mapping with an instance of each of the
+concrete classes, the "all" group of them, and then the resource types that
+other packages declare in the "cloud_cleaner.resources" entry point group.
+These should be considered singleton objects and their instances ought to
+be acted upon directly, instead of creating new instances of their
+underlying classes. Each resource module is only imported once its instance
+is looked up.
 
+ENTRY_POINT_GROUP - the entry point group of resource types from other
+packages. Each entry point names a Resource subclass, and the name of the
+entry point must be the "type_name" of the class.
+"""
+import sys
+from importlib import import_module
+from .registry import ResourceRegistry, load
 
-ALL_RESOURCES = {
-    'server': Server(),
-    'fip': Fip()
+ENTRY_POINT_GROUP = 'cloud_cleaner.resources'
+# Where each class exported by this package is defined
+_EXPORTS = {
+    'Server': '.server',
+    'Fip': '.fip',
+    'ResourceGroup': '.group'
 }
+
+
+def _group():
+    group = getattr(import_module('.group', __name__), 'ResourceGroup')
+    return group([ALL_RESOURCES[name] for name in ALL_RESOURCES
+                  if name != 'all'])
+
+
+ALL_RESOURCES = ResourceRegistry([
+    ('server', load('.server', 'Server'), "Delete old or unwanted servers"),
+    ('fip', load('.fip', 'Fip'), "Release unused floating IPs"),
+    ('all', _group, "Clean every resource type in one run")
+], group=ENTRY_POINT_GROUP)
+
+
+def __getattr__(name):
+    """Import the exported classes when they are first used"""
+    if name not in _EXPORTS:
+        raise AttributeError("module %r has no attribute %r" %
+                             (__name__, name))
+    return getattr(import_module(_EXPORTS[name], __name__), name)
+
+
+if sys.version_info < (3, 7):
+    # Modules cannot define __getattr__ before Python 3.7
+    from .server import Server  # noqa: F401
+    from .fip import Fip  # noqa: F401
+    from .group import ResourceGroup  # noqa: F401
@@ -2,8 +2,20 @@
 Contains the Fip class to process arguments for and results from floating
 IP addresses
 """
-from ipaddress import ip_address, ip_network
-from cloud_cleaner.resources.resource import Resource
+from types import SimpleNamespace
+from cloud_cleaner.records import project, record_type
+from cloud_cleaner.resources.resource import Predicate, Resource, \
+    UnimplementedError
+from cloud_cleaner.subnet_index import SubnetIndex
+
+# Attributes of each floating IP saved to plan files
+PLAN_FIELDS = ('id', 'floating_ip_address', 'fixed_ip_address', 'port_id',
+               'status')
+# The fields of each listed floating IP that are kept: those of the plan
+# files, and whether it is attached, which older SDK releases report
+FipRecord = record_type('FipRecord', PLAN_FIELDS + ('attached',))
+# Number of floating IPs listed by id in each request when applying a plan
+APPLY_BATCH = 100
 
 
 class Fip(Resource):
@@ -12,6 +24,8 @@ class Fip(Resource):
     configured OpenStack endpoint.
     """
     type_name = "fip"
+    # Deleting a server releases its floating IPs
+    depends_on = ("server",)
 
     def __init__(self):
         super().__init__()
@@ -21,68 +35,149 @@ class Fip(Resource):
         super().register(config)
         _desc = "By default, only FIPs not attached are considered. Include "\
                 "this flag to consider ALL fips"
-        self._sub_config.add_argument("--with-attached",
-                                      dest='with_attached',
-                                      help=_desc,
-                                      action='store_true')
+        self._add_argument("--with-attached",
+                           dest='with_attached',
+                           help=_desc,
+                           action='store_true')
         _desc = "Definition of a subnet within which the floating IP address"\
-                " must reside in order to be purged."
-        self._sub_config.add_argument('--floating-subnet',
-                                      dest='floating_subnet',
-                                      help=_desc)
+                " must reside in order to be purged. May be repeated."
+        self._add_argument('--floating-subnet',
+                           dest='floating_subnet',
+                           action='append',
+                           help=_desc)
         _desc = "Definition of a subnet within which the host's primary IP "\
-                "address must reside."
-        self._sub_config.add_argument('--static-subnet',
-                                      dest='static_subnet',
-                                      help=_desc)
+                "address must reside. May be repeated."
+        self._add_argument('--static-subnet',
+                           dest='static_subnet',
+                           action='append',
+                           help=_desc)
 
-    def process(self, deletion):
+    def process(self):
+        self._config.info("Retrieving floating IP list")
         conn = self._get_conn()
-        self._config.info("Connecting to OpenStack to fetch floating IPs")
-        self.__fips = conn.list_floating_ips()
-        self._config.info("Found %d floating IPs" % len(self.__fips))
+        inventory = self._get_inventory()
+        fips = project(FipRecord, inventory.stream('floating_ips', self._pages(
+            lambda **params: conn.network.ips(paginated=False, **params))))
+        plan = self._filter_plan(self.__attached_predicates() +
+                                 self.__address_predicates())
+        self.__fips = self._shard(
+            inventory.retain('floating_ips', plan.run(fips)), 'floating IPs')
+        self._config.info("Found %d floating IPs" % plan.seen)
+        self._report_plan(plan, 'floating IPs')
         self.__debug_fips()
-        self.__filter_attached()
-        self.__filter_by_address()
-        self._config.info("%d floating IPs passed address test" %
-                          len(self.__fips))
 
     def clean(self):
         conn = self._get_conn()
-        for fip in self.__fips:
-            conn.delete_floating_ip(fip.id)
+        deleted_ids = []
+        results = self._delete('network', conn.delete_floating_ip,
+                               self.__fips)
+        for result in results:
+            if result.deleted:
+                deleted_ids.append(result.item.id)
+            else:
+                self._config.warning("Failed to delete %s: %s" %
+                                     (result.item.floating_ip_address,
+                                      result.error))
+        self._get_inventory().discard('floating_ips', deleted_ids)
+        self._check_deleted(results, 'floating IPs')
+
+    def poll(self):
+        """
+        Drop the stored listing of floating IPs, so that the next pass lists
+        all of them again. Neutron cannot list only the floating IPs changed
+        since a given time.
+
+        :return: None
+        """
+        self._get_inventory().refresh('floating_ips')
+
+    def plan_entries(self):
+        """
+        Describe the floating IPs selected by the process stage.
+
+        :return: List of dicts of the key attributes of each floating IP
+        """
+        return [{field: getattr(fip, field, None) for field in PLAN_FIELDS}
+                for fip in self.__fips]
+
+    def apply(self, entries, created):
+        """
+        Select the floating IPs of a plan for the clean stage. The planned
+        floating IPs are listed again by id, a batch at a time, and the ones
+        that no longer exist, changed address or were attached since the
+        plan was made are left out.
+
+        :param entries: The entries of the plan, from #plan_entries
+        :param created: When the plan was listed, as a naive datetime in UTC
+        :return: None
+        """
+        conn = self._get_conn()
+        ids = [entry['id'] for entry in entries]
+        current = {}
+        for start in range(0, len(ids), APPLY_BATCH):
+            batch = ids[start:start + APPLY_BATCH]
+            for fip in conn.network.ips(id=batch):
+                current[fip.id] = fip
+        self.__fips = []
+        for entry in entries:
+            fip = current.get(entry['id'])
+            if fip is None or self.__changed(entry, fip):
+                self._config.warning("%s changed since the plan was made, "
+                                     "skipping it" %
+                                     entry['floating_ip_address'])
+            else:
+                self.__fips.append(fip)
+        self._config.info("%d of %d planned floating IPs unchanged" %
+                          (len(self.__fips), len(entries)))
+
+    def resume(self, entries):
+        """
+        Select the floating IPs left outstanding by an interrupted run for the
+        clean stage.
+
+        :param entries: The entries of the outstanding deletions
+        :return: None
+        """
+        self.__fips = [SimpleNamespace(**entry) for entry in entries]
 
-    def __filter_attached(self):
+    def __changed(self, entry, fip):
+        if fip.floating_ip_address != entry['floating_ip_address']:
+            return True
+        # Only attaching a floating IP could make it no longer eligible
+        return self.__attached(fip) and not entry['port_id']
+
+    def __attached_predicates(self):
         force_attached = self._config.get_arg('with_attached')
-        if not force_attached:
-            self.__fips = list(filter(lambda f: not f.attached, self.__fips))
-            self._config.info("%d floating IPs passed attached test" %
-                              len(self.__fips))
-            self.__debug_fips()
-
-    def __filter_by_address(self):
-        # TODO: Properly wrap conditions where there is an IPv4/6 mismatch
-        # The user can pass in an IPv6 address, and that will result in a type
-        # mismatch if the floating IP is IPv4 (or vice-versa mismatch). This
-        # should be handled by the below code, but it currently is not.
-        #
-        # Define functions to do the filtering
-        floating_subnet = self._config.get_arg('floating_subnet')
-        if floating_subnet is not None:
-            __fips = filter(self.__filter_factory('floating_ip_address',
-                                                  floating_subnet),
-                            self.__fips)
-            self.__fips = list(__fips)
-            self._config.info("%d passed floating_subnet" % len(self.__fips))
-            self.__debug_fips()
-        static_subnet = self._config.get_arg('static_subnet')
-        if static_subnet is not None:
-            __fips = filter(self.__filter_factory('fixed_ip_address',
-                                                  static_subnet),
-                            self.__fips)
-            self.__fips = list(__fips)
-            self._config.info("%d passed static_subnet" % len(self.__fips))
-            self.__debug_fips()
+        if force_attached:
+            return []
+        return [Predicate('attached', lambda fip: not self.__attached(fip),
+                          cost=1.0, selectivity=0.5)]
+
+    def __address_predicates(self):
+        # Parsing an address costs more than checking for a port
+        predicates = []
+        for field, address in (('floating_subnet', 'floating_ip_address'),
+                               ('static_subnet', 'fixed_ip_address')):
+            subnets = self._config.get_arg(field)
+            if subnets:
+                predicates.append(Predicate(
+                    field, self.__filter_factory(address, subnets),
+                    cost=3.0, selectivity=0.5))
+        return predicates
+
+    @staticmethod
+    def __attached(fip):
+        """
+        Check whether a floating IP is attached. Older SDK releases report
+        this directly, newer ones only give the port the address is bound to.
+
+        :param fip: The floating IP to check
+        :return: True if the floating IP is attached
+        """
+        attached = getattr(fip, 'attached', None)
+        if attached is None:
+            attached = getattr(fip, 'port_id', None) is not None
+        return attached
 
     def __debug_fips(self):
         for fip in self.__fips:
@@ -94,17 +189,19 @@ class Fip(Resource):
         pass
 
     @classmethod
-    def __filter_factory(cls, field, network):
+    def __filter_factory(cls, field, networks):
         """
         Creates and returns a function that can be used as the basis of
-        filtering IP addresses based on user input netmasks
+        filtering IP addresses based on user input netmasks. Addresses that
+        are missing, or of the other IP version than all of the netmasks, do
+        not match.
 
         :param field: Name of the API field to test
-        :param network: Netmask to test an address is in
+        :param networks: List of netmasks, one of which an address must be in
         :return: Function to perform the network testing
         """
-        net = ip_network(network)
-        return lambda x: ip_address(x[field]) in net
+        index = SubnetIndex(networks)
+        return lambda x: x[field] in index
 
     def send_emails(self):
         raise UnimplementedError("Unimplemented")
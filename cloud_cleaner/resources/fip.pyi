@@ -1,3 +1,14 @@
+from datetime import datetime
+from typing import Any, Dict, List, Tuple, Type
+from cloud_cleaner.records import Record
+from .resource import Predicate, Resource
+
+
+PLAN_FIELDS: Tuple[str, ...]
+FipRecord: Type[Record]
+APPLY_BATCH: int
+
+
 class Fip(Resource):
     def __init__(self): ...
 
@@ -7,11 +18,24 @@ class Fip(Resource):
 
     def clean(self): ...
 
-    def __filter_attached(self): ...
+    def poll(self): ...
+
+    def plan_entries(self) -> List[Dict[str, Any]]: ...
+
+    def apply(self, entries: List[Dict[str, Any]], created: datetime): ...
+
+    def resume(self, entries: List[Dict[str, Any]]): ...
+
+    def __changed(self, entry: Dict[str, Any], fip: Munch) -> bool: ...
+
+    def __attached_predicates(self) -> List[Predicate]: ...
+
+    def __address_predicates(self) -> List[Predicate]: ...
 
-    def __filter_by_address(self): ...
+    @staticmethod
+    def __attached(fip: Munch) -> bool: ...
 
     def prep_deletion(self): ...
 
     @classmethod
-    def __filter_factory(cls, field: str, network: str): ...
+    def __filter_factory(cls, field: str, networks: List[str]): ...
@@ -0,0 +1,137 @@
+"""
+Contains the ResourceGroup class, which runs every resource type in a
+single invocation
+"""
+from concurrent.futures import ThreadPoolExecutor
+from cloud_cleaner.executor import DeletionError
+from cloud_cleaner.resources.resource import Resource, UnimplementedError
+
+
+class ResourceGroup(Resource):
+    """
+    Processes and cleans all of its member resources over the connection and
+    inventory of a single run. The "all" sub-command accepts the options of
+    every member.
+
+    The members are processed concurrently, as their listings are
+    independent. They are cleaned one at a time, each after the resources it
+    depends on (see Resource.depends_on). A member is processed again before
+    it is cleaned if a resource it depends on was cleaned, as that can free
+    more of it, such as the floating IPs of deleted servers.
+    """
+    type_name = "all"
+
+    def __init__(self, members, **kwargs):
+        super().__init__(**kwargs)
+        self.__members = _ordered(members)
+
+    def register(self, config):
+        """
+        Register the members, then the "all" sub-command, with the options of
+        all of the members. Options shared by several members are only
+        added once.
+
+        :param config: Config object to register resource type with
+        :return: None
+        """
+        super().register(config)
+        added = set()
+        for member in self.__members:
+            member.register(config)
+            for args, kwargs in member.arguments:
+                if added.intersection(args):
+                    continue
+                self._add_argument(*args, **kwargs)
+                added.update(args)
+
+    def prep_deletion(self):
+        """
+        Prepare all of the members for deletion.
+
+        :return: None
+        """
+        for member in self.__members:
+            member.prep_deletion()
+
+    def process(self):
+        """
+        Process all of the members concurrently.
+
+        :return: None
+        """
+        with ThreadPoolExecutor(max_workers=len(self.__members)) as pool:
+            # Consume the results, so that errors are raised here
+            list(pool.map(lambda member: member.process(), self.__members))
+
+    def clean(self):
+        """
+        Clean the members, in the order of their dependencies. A member
+        whose deletions failed does not stop the others from being cleaned.
+
+        :return: None
+        :raises DeletionError: If any of the deletions of any member failed
+        """
+        cleaned = set()
+        failed = []
+        total = 0
+        for member in self.__members:
+            if cleaned.intersection(member.depends_on):
+                self._config.info("Processing %s again" % member.type_name)
+                member.poll()
+                member.prep_deletion()
+                member.process()
+            try:
+                member.clean()
+            except DeletionError as error:
+                self._config.warning(str(error))
+                failed.extend(error.failed)
+                total += error.total
+            cleaned.add(member.type_name)
+        if failed:
+            raise DeletionError(failed, total)
+
+    def poll(self):
+        """
+        Poll all of the members for changes.
+
+        :return: None
+        """
+        for member in self.__members:
+            member.poll()
+
+    def send_emails(self):
+        """
+        Send the warning emails of each member that sends them.
+
+        :return: None
+        """
+        for member in self.__members:
+            try:
+                member.send_emails()
+            except UnimplementedError:
+                self._config.debug("No emails for %s" % member.type_name)
+
+
+def _ordered(members):
+    """
+    Order resources so that each comes after the ones it depends on, keeping
+    the given order otherwise.
+
+    :param members: List of resources
+    :return: The ordered list of resources
+    """
+    names = {member.type_name for member in members}
+    ordered = []
+    done = set()
+    remaining = list(members)
+    while remaining:
+        ready = [member for member in remaining
+                 if names.intersection(member.depends_on) <= done]
+        if not ready:
+            raise ValueError("Circular dependency between %s" %
+                             ", ".join(m.type_name for m in remaining))
+        for member in ready:
+            ordered.append(member)
+            done.add(member.type_name)
+            remaining.remove(member)
+    return ordered
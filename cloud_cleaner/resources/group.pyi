@@ -0,0 +1,21 @@
+from typing import List
+from .resource import Resource
+
+
+class ResourceGroup(Resource):
+    def __init__(self, members: List[Resource], **kwargs): ...
+
+    def register(self, config: CloudCleanerConfig): ...
+
+    def prep_deletion(self): ...
+
+    def process(self): ...
+
+    def clean(self): ...
+
+    def poll(self): ...
+
+    def send_emails(self): ...
+
+
+def _ordered(members: List[Resource]) -> List[Resource]: ...
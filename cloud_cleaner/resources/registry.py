@@ -0,0 +1,130 @@
+"""
+Contains the ResourceRegistry class, the mapping of resource type names to
+the resource instances, which only imports a resource module once its
+resource type is asked for
+"""
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from importlib import import_module
+from threading import RLock
+
+
+class ResourceRegistry(MutableMapping):
+    """
+    Maps resource type names to a single instance of each resource type, in
+    the order the types were added. Each type is given as a factory, and
+    the factory is only called, importing whatever it needs, the first time
+    the type is looked up. Instances can also be set directly.
+
+    Other packages add resource types through the entry point group given
+    as "group", each entry point naming a Resource subclass. The entry
+    points are only searched once all of the names are needed, or a name
+    that is not built in is looked up. A built in type cannot be replaced
+    this way.
+    """
+    def __init__(self, factories=(), group=None):
+        self.__factories = OrderedDict()
+        self.__help = {}
+        self.__instances = {}
+        self.__group = group
+        # Reentrant, as a factory may look up other resource types
+        self.__lock = RLock()
+        for entry in factories:
+            self.__add(*entry)
+
+    def describe(self, name):
+        """
+        Fetch the one line description of a resource type, without loading
+        the type.
+
+        :param name: Name of the resource type
+        :return: The description, or None if it has none
+        """
+        return self.__help.get(name)
+
+    def __add(self, name, factory, help_text=None):
+        self.__factories.setdefault(name, factory)
+        if help_text is not None:
+            self.__help.setdefault(name, help_text)
+
+    def __discover(self):
+        with self.__lock:
+            if self.__group is None:
+                return
+            for entry in plugins(self.__group):
+                self.__add(*entry)
+            self.__group = None
+
+    def __getitem__(self, name):
+        if name not in self.__factories:
+            self.__discover()
+        with self.__lock:
+            if name not in self.__instances:
+                self.__instances[name] = self.__factories[name]()
+            return self.__instances[name]
+
+    def __setitem__(self, name, resource):
+        with self.__lock:
+            self.__factories.setdefault(name, None)
+            self.__instances[name] = resource
+
+    def __delitem__(self, name):
+        self.__discover()
+        with self.__lock:
+            del self.__factories[name]
+            self.__instances.pop(name, None)
+
+    def __iter__(self):
+        self.__discover()
+        return iter(list(self.__factories))
+
+    def __len__(self):
+        self.__discover()
+        return len(self.__factories)
+
+
+def load(module, name):
+    """
+    Build a factory instantiating a class from a module of this package.
+
+    :param module: Name of the module, relative to this package
+    :param name: Name of the class
+    :return: Callable returning a new instance of the class
+    """
+    def _factory():
+        return getattr(import_module(module, __package__), name)()
+    return _factory
+
+
+def plugins(group):
+    """
+    Find the resource types that installed packages declare in an entry
+    point group. Only the metadata of the packages is read; the entry
+    points themselves are loaded by the factories.
+
+    :param group: Name of the entry point group
+    :return: List of (name, factory) tuples
+    """
+    # Imported here, as reading the package metadata is only needed when
+    # the resource types are listed
+    # pylint: disable=import-outside-toplevel
+    try:
+        from importlib.metadata import entry_points
+        found = entry_points()
+        if hasattr(found, 'select'):
+            found = found.select(group=group)
+        else:
+            # Python 3.8 and 3.9 return a dict of the groups
+            found = found.get(group, ())
+    except ImportError:
+        # Python before 3.8
+        from pkg_resources import iter_entry_points
+        found = iter_entry_points(group)
+    return [(entry_point.name, _entry_point_factory(entry_point))
+            for entry_point in found]
+
+
+def _entry_point_factory(entry_point):
+    def _factory():
+        return entry_point.load()()
+    return _factory
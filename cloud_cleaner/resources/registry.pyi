@@ -0,0 +1,34 @@
+from collections.abc import MutableMapping
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+from .resource import Resource
+
+
+class ResourceRegistry(MutableMapping):
+    def __init__(self, factories: Iterable[tuple] = ...,
+                 group: Optional[str] = None): ...
+
+    def describe(self, name: str) -> Optional[str]: ...
+
+    def __add(self, name: str, factory: Callable[[], Resource],
+              help_text: Optional[str] = None): ...
+
+    def __discover(self): ...
+
+    def __getitem__(self, name: str) -> Resource: ...
+
+    def __setitem__(self, name: str, resource: Resource): ...
+
+    def __delitem__(self, name: str): ...
+
+    def __iter__(self) -> Iterator[str]: ...
+
+    def __len__(self) -> int: ...
+
+
+def load(module: str, name: str) -> Callable[[], Resource]: ...
+
+
+def plugins(group: str) -> List[Tuple[str, Callable[[], Resource]]]: ...
+
+
+def _entry_point_factory(entry_point: Any) -> Callable[[], Resource]: ...
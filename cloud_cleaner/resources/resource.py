@@ -1,7 +1,12 @@
 """Contains the Resource base class for CLI processing"""
 import re
-from datetime import datetime, timedelta
-from pytz import utc
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from cloud_cleaner.executor import DeletionError
+from cloud_cleaner.pager import DEFAULT_PAGE_SIZE, DEFAULT_PREFETCH, \
+    pages, prefetch
+from cloud_cleaner.shard import shard_of
 
 
 HOUR = re.compile(r'(\d+)h')
@@ -9,6 +14,11 @@ DAY = re.compile(r'(\d+)d')
 WEEK = re.compile(r'(\d+)w')
 MONTH = re.compile(r'(\d+)m')
 YEAR = re.compile(r'(\d+)y')
+# Formats tried, in order, when datetime.fromisoformat is not available
+TIMESTAMP_FORMATS = ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S',
+                     '%Y-%m-%dT%H:%M:%S.%f%z', '%Y-%m-%dT%H:%M:%S%z')
+# UTC offset with a colon, which %z only accepts from Python 3.7
+OFFSET = re.compile(r'([+-]\d\d):(\d\d)$')
 
 
 # PyLint disabled because removing the (object) call here causes errors in
@@ -30,18 +40,38 @@ class Resource(object):  # pylint: disable=R0205
 
     If the resource you are adding requires any additional options to
     configure its behavior, then overriding the "register" method will allow
-    you to add CLI options to self._sub_config for handling those
-    arguments.
+    you to add CLI options for handling those arguments, with
+    "_add_argument".
+
+    "depends_on" names the resource types whose deletion can free resources
+    of this type. When all types are cleaned together, those are cleaned
+    first.
+
+    Resources filter their listings by declaring a Predicate for each test
+    and running them through a single FilterPlan (see "_filter_plan" and
+    "_report_plan"), rather than making a pass over the listing per test.
     """
     type_name = "resource"
+    depends_on = ()
 
     def __init__(self, **kwargs):
         self._config = None
         self._sub_config = None
-        if 'now' in kwargs.keys():
-            self._now = kwargs['now']
-        else:
-            self._now = datetime.now(utc)
+        self.__arguments = []
+        # Resources live for the whole process, which can run many passes in
+        # watch mode, so the time is only fixed when one is given
+        self.__now = kwargs.get('now')
+
+    @property
+    def _now(self):
+        """
+        The current time, or the time given to the constructor.
+
+        :return: An aware datetime
+        """
+        if self.__now is not None:
+            return self.__now
+        return datetime.now(timezone.utc)
 
     def register(self, config):
         """
@@ -56,6 +86,26 @@ class Resource(object):  # pylint: disable=R0205
         """
         self._config = config
         self._sub_config = config.add_subparser(self.type_name)
+        self.__arguments = []
+
+    @property
+    def arguments(self):
+        """
+        The CLI options added by this resource type.
+
+        :return: List of the (args, kwargs) of each call of #_add_argument
+        """
+        return list(self.__arguments)
+
+    def _add_argument(self, *args, **kwargs):
+        """
+        Add a CLI option to the sub-command of this resource type. Takes the
+        same arguments as ArgumentParser.add_argument.
+
+        :return: The argparse action of the option
+        """
+        self.__arguments.append((args, kwargs))
+        return self._sub_config.add_argument(*args, **kwargs)
 
     def process(self):  # pylint: disable=no-self-use
         """
@@ -69,8 +119,52 @@ class Resource(object):  # pylint: disable=R0205
     def clean(self):  # pylint: disable=no-self-use
         """
         Override this method in base classes in order to perform the actual
-        calls to OpenStack to clean up the processed resources
+        calls to OpenStack to clean up the processed resources. Every
+        deletion is attempted, and DeletionError is raised at the end if any
+        of them failed.
+
+        :return: None
+        """
+        raise UnimplementedError("Must override this method")
+
+    def poll(self):  # pylint: disable=no-self-use
+        """
+        Override this method in base classes in order to bring the stored
+        listing of the resources up to date between the passes of watch
+        mode. The next call of "process" will be served from it.
+
+        :return: None
+        """
+        raise UnimplementedError("Must override this method")
+
+    def plan_entries(self):  # pylint: disable=no-self-use
+        """
+        Override this method in base classes in order to describe the
+        resources selected by the process stage, for saving to a plan file.
+
+        :return: List of dicts of the key attributes of each resource
+        """
+        raise UnimplementedError("Must override this method")
+
+    def apply(self, entries, created):  # pylint: disable=no-self-use
+        """
+        Override this method in base classes in order to select the resources
+        of a plan file for the clean stage, leaving out the ones that changed
+        since the plan was made, without processing the whole listing again.
+
+        :param entries: The entries of the plan, from #plan_entries
+        :param created: When the plan was listed, as a naive datetime in UTC
+        :return: None
+        """
+        raise UnimplementedError("Must override this method")
+
+    def resume(self, entries):  # pylint: disable=no-self-use
+        """
+        Override this method in base classes in order to select the resources
+        left outstanding by an interrupted run for the clean stage. They are
+        deleted without being checked again.
 
+        :param entries: The entries of the outstanding deletions
         :return: None
         """
         raise UnimplementedError("Must override this method")
@@ -111,10 +205,290 @@ class Resource(object):  # pylint: disable=R0205
             return int(match.group(1))
         return 0
 
+    def _cutoff(self, interval):
+        """
+        Compute the time before which a resource must have been created to be
+        older than the given interval. This is computed once per pass, so
+        that each resource only needs to be compared against it.
+
+        :param interval: The timedelta the resource must be older than
+        :return: The cutoff, as a naive datetime in UTC
+        """
+        cutoff = self._now - interval
+        if cutoff.tzinfo is not None:
+            cutoff = cutoff.astimezone(timezone.utc).replace(tzinfo=None)
+        return cutoff
+
     def _get_conn(self):
         if self._config is None:
             return None
-        return self._config.get_conn()
+        # All calls to OpenStack go through the shared rate control
+        return self._config.get_rate_control().wrap(self._config.get_conn())
+
+    def _pages(self, fetch, query=None):
+        """
+        Build a callable producing the pages of a listing, using the page size
+        and prefetch depth configured for this run.
+
+        :param fetch: Callable taking query parameters and returning one page
+        :param query: Other query parameters to send with every request
+        :return: Callable returning a generator of pages
+        """
+        page_size = self._config.get_arg('page_size') or DEFAULT_PAGE_SIZE
+        depth = self._config.get_arg('prefetch')
+        if depth is None:
+            depth = DEFAULT_PREFETCH
+        metrics = self._config.get_metrics()
+
+        def _fetch(**params):
+            with metrics.timer('list_page_seconds', resource=self.type_name):
+                page = list(fetch(**params))
+            metrics.count('listed', len(page), resource=self.type_name)
+            return page
+        return lambda: prefetch(pages(_fetch, page_size, query), depth)
+
+    def _filter_plan(self, predicates):
+        """
+        Compile the predicates for a pass into a FilterPlan.
+
+        :param predicates: Iterable of Predicate objects
+        :return: The FilterPlan
+        """
+        plan = FilterPlan(predicates)
+        self._config.debug("Filter order: %s" % ", ".join(plan.order))
+        return plan
+
+    def _report_plan(self, plan, noun):
+        """
+        Log how many items passed each test of a consumed FilterPlan, and
+        how long each test took over the whole listing.
+
+        :param plan: The FilterPlan
+        :param noun: Plural name of the items, for the log messages
+        :return: None
+        """
+        metrics = self._config.get_metrics()
+        for name, count in plan.passed():
+            seconds = plan.seconds[name]
+            self._config.info("%d %s passed %s test in %.3fs"
+                              % (count, noun, name, seconds))
+            metrics.count('filter_passed', count, resource=self.type_name,
+                          test=name)
+            metrics.count('filter_seconds', seconds, resource=self.type_name,
+                          test=name)
+
+    def _delete(self, endpoint, delete, items):
+        """
+        Delete items through the executor of this run. If a journal is
+        configured, the deletions are recorded in it before they are made,
+        and each is recorded again as it completes.
+
+        :param endpoint: Name of the endpoint the delete calls are made to
+        :param delete: Callable performing the delete of a single item id
+        :param items: The items to delete, which must be the ones described
+                      by #plan_entries
+        :return: A list of DeletionResult, in the same order as items
+        """
+        journal = self._config.get_journal()
+        if journal is None:
+            return self._get_executor().run(endpoint, delete, items)
+        journal.intend(self.type_name, self.plan_entries())
+        try:
+            return self._get_executor().run(
+                endpoint, delete, items,
+                on_result=lambda result: journal.record(self.type_name,
+                                                        result))
+        finally:
+            journal.flush()
+
+    @staticmethod
+    def _check_deleted(results, noun):
+        """
+        Fail the pass if any of its deletions failed. Called once the results
+        of all of the deletions are handled, so that one failure does not
+        stop the others.
+
+        :param results: List of the DeletionResult of each deletion
+        :param noun: Plural name of the items, for the error message
+        :return: None
+        :raises DeletionError: If any of the deletions failed
+        """
+        failed = [result for result in results if not result.deleted]
+        if failed:
+            raise DeletionError(failed, len(results), noun)
+
+    def _shard(self, items, noun):
+        """
+        Keep only the items in the shard given by --shard, and report how
+        many items fell in each shard, so that the balance between the hosts
+        can be checked. The report is printed on dry runs.
+
+        :param items: Iterable of the selected items
+        :param noun: Plural name of the items, for the report
+        :return: List of the items in this shard
+        """
+        shard = self._config.get_arg('shard')
+        if shard is None:
+            return list(items)
+        index, count = shard
+        sizes = [0] * count
+        kept = []
+        for item in items:
+            number = shard_of(item.id, count)
+            sizes[number] += 1
+            if number == index:
+                kept.append(item)
+        report = "Shard sizes of %d %s: %s, cleaning shard %d" % (
+            sum(sizes), noun,
+            ", ".join("%d=%d" % (number, size)
+                      for number, size in enumerate(sizes)), index)
+        if self._config.get_arg('force'):
+            self._config.info(report)
+        else:
+            print(report)
+        return kept
+
+    def _get_inventory(self):
+        if self._config is None:
+            return None
+        return self._config.get_inventory()
+
+    def _get_executor(self):
+        if self._config is None:
+            return None
+        return self._config.get_executor()
+
+
+def parse_timestamp(value):
+    """
+    Parse an ISO 8601 timestamp as returned by the OpenStack APIs. Accepts
+    timestamps with or without microseconds, and with a "Z", a UTC offset or
+    no time zone at all, which OpenStack uses for UTC.
+
+    :param value: The timestamp string
+    :return: The time, as a naive datetime in UTC
+    """
+    if value.endswith('Z'):
+        value = value[:-1]
+    parsed = _fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _strptime_iso(value):
+    # Fallback for Python releases without datetime.fromisoformat
+    value = OFFSET.sub(r'\1\2', value)
+    for date_format in TIMESTAMP_FORMATS:
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+    raise ValueError("Unrecognized timestamp %s" % value)
+
+
+_fromisoformat = getattr(datetime, 'fromisoformat', _strptime_iso)
+
+
+class Predicate(object):  # pylint: disable=R0205,R0903
+    """
+    A named test that items must pass to be selected, along with estimates
+    of how expensive it is and how many items it lets through. The estimates
+    are only used to order the tests of a FilterPlan, so they need only be
+    right relative to the other tests of the same resource.
+    """
+    def __init__(self, name, test, cost=1.0, selectivity=0.5):
+        """
+        :param name: Name of the test, used when reporting its counts
+        :param test: Callable taking an item and returning True to keep it
+        :param cost: Estimated cost of one call of the test
+        :param selectivity: Estimated fraction of the items that pass it
+        """
+        self.name = name
+        self.test = test
+        self.cost = cost
+        self.selectivity = selectivity
+
+    @property
+    def rank(self):
+        """
+        The cost of the test per item it rejects. Running the tests in order
+        of increasing rank minimizes the expected cost of filtering an item.
+
+        :return: The rank of the test
+        """
+        rejects = 1.0 - self.selectivity
+        if rejects <= 0:
+            return float('inf')
+        return self.cost / rejects
+
+
+class FilterPlan(object):  # pylint: disable=R0205
+    """
+    Applies a set of predicates to a listing in a single pass. Each item is
+    run through the predicates in order of their rank, stopping at the first
+    one that rejects it, and the number of items rejected by each predicate
+    and the seconds spent in it are recorded as the listing is consumed.
+    """
+    def __init__(self, predicates=(), clock=time.perf_counter):
+        # sorted is stable, so predicates of equal rank keep their order
+        self.__predicates = sorted(predicates, key=lambda p: p.rank)
+        self.__clock = clock
+        self.seen = 0
+        self.rejected = OrderedDict((predicate.name, 0)
+                                    for predicate in self.__predicates)
+        self.seconds = OrderedDict((predicate.name, 0.0)
+                                   for predicate in self.__predicates)
+
+    @property
+    def order(self):
+        """
+        :return: The names of the predicates, in the order they are run
+        """
+        return [predicate.name for predicate in self.__predicates]
+
+    def run(self, items):
+        """
+        Filter items through the plan. Nothing is counted until the returned
+        iterator is consumed.
+
+        :param items: Iterable of items to filter
+        :return: Iterator over the items that pass all of the predicates
+        """
+        tests = [(predicate.name, predicate.test)
+                 for predicate in self.__predicates]
+        rejected = self.rejected
+        seconds = self.seconds
+        clock = self.__clock
+
+        def _run():
+            for item in items:
+                self.seen += 1
+                for name, test in tests:
+                    started = clock()
+                    kept = test(item)
+                    seconds[name] += clock() - started
+                    if not kept:
+                        rejected[name] += 1
+                        break
+                else:
+                    yield item
+        return _run()
+
+    def passed(self):
+        """
+        Count the items that got past each predicate. As the predicates stop
+        at the first rejection, each count is of the items that passed that
+        predicate and all of the ones run before it.
+
+        :return: List of (predicate name, count), in the order they are run
+        """
+        remaining = self.seen
+        counts = []
+        for name, rejected in self.rejected.items():
+            remaining -= rejected
+            counts.append((name, remaining))
+        return counts
 
 
 class UnimplementedError(Exception):
@@ -1,26 +1,108 @@
-from datetime import timedelta
+from argparse import Action
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, Iterator, List, \
+    Pattern, Tuple
 
 
 class Resource(object):
+    type_name: str
+    depends_on: Tuple[str, ...]
+
     def __init__(self, **kwargs): ...
 
+    @property
+    def _now(self) -> datetime: ...
+
     def register(self, config: CloudCleanerConfig): ...
 
+    @property
+    def arguments(self) -> List[Tuple[tuple, Dict[str, Any]]]: ...
+
+    def _add_argument(self, *args, **kwargs) -> Action: ...
+
     def process(self): ...
 
     def clean(self): ...
 
+    def poll(self): ...
+
+    def plan_entries(self) -> List[Dict[str, Any]]: ...
+
+    def apply(self, entries: List[Dict[str, Any]], created: datetime): ...
+
+    def resume(self, entries: List[Dict[str, Any]]): ...
+
     def parse_interval(self, interval: str) -> timedelta: ...
 
     @classmethod
     def __parse_interval(cls, regex: str, interval: str): ...
 
+    def _cutoff(self, interval: timedelta) -> datetime: ...
+
     def _get_conn(self): ...
 
+    def _pages(self, fetch: Callable[..., Iterable],
+               query: Dict[str, Any] = None) -> Callable[[], Iterator]: ...
+
+    def _filter_plan(self, predicates: Iterable[Predicate]) -> FilterPlan: ...
+
+    def _report_plan(self, plan: FilterPlan, noun: str): ...
+
+    def _delete(self, endpoint: str, delete: Callable[[str], Any],
+                items: List) -> List[DeletionResult]: ...
+
+    @staticmethod
+    def _check_deleted(results: List[DeletionResult], noun: str): ...
+
+    def _shard(self, items: Iterable, noun: str) -> List: ...
+
+    def _get_inventory(self) -> Inventory: ...
+
+    def _get_executor(self) -> DeletionExecutor: ...
+
     def send_emails(self): ...
 
     def prep_deletion(self): ...
 
 
+TIMESTAMP_FORMATS: Tuple[str, ...]
+OFFSET: Pattern
+
+
+def parse_timestamp(value: str) -> datetime: ...
+
+
+def _strptime_iso(value: str) -> datetime: ...
+
+
+class Predicate(object):
+    name: str
+    test: Callable[[Any], bool]
+    cost: float
+    selectivity: float
+
+    def __init__(self, name: str, test: Callable[[Any], bool],
+                 cost: float = ..., selectivity: float = ...): ...
+
+    @property
+    def rank(self) -> float: ...
+
+
+class FilterPlan(object):
+    seen: int
+    rejected: Dict[str, int]
+    seconds: Dict[str, float]
+
+    def __init__(self, predicates: Iterable[Predicate] = ...,
+                 clock: Callable[[], float] = ...): ...
+
+    @property
+    def order(self) -> List[str]: ...
+
+    def run(self, items: Iterable) -> Iterator: ...
+
+    def passed(self) -> List[Tuple[str, int]]: ...
+
+
 class UnimplementedError(Exception):
     ...
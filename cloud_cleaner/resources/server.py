@@ -1,12 +1,27 @@
 """Contains implementation of the Server class"""
 import re
-import smtplib
-from datetime import datetime
-from pytz import utc
-from cloud_cleaner.config import DATE_FORMAT
-from cloud_cleaner.resources.resource import Resource
+from collections import OrderedDict
+from datetime import timedelta
+from types import SimpleNamespace
+from cloud_cleaner.records import project, record_type
+from cloud_cleaner.resources.resource import Predicate, Resource, \
+    parse_timestamp
 from cloud_cleaner.string_matcher import StringMatcher
 
+# Name regexes made only of these characters mean the same thing to Python
+# and to the regex engine of the Nova database, so they can be pushed down
+PUSHABLE_NAME = re.compile(r'[\w\s.*+?|()\[\]{},:/=@^$-]*$')
+QUERY_DATE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+# Fractions of the age at which owners are warned, and the tier of each
+# warning, highest tier first
+WARNING_TIERS = ((0.75, 2), (0.5, 1))
+# How far back past the last listing each poll of watch mode looks
+POLL_OVERLAP = timedelta(minutes=1)
+# Attributes of each server saved to plan files
+PLAN_FIELDS = ('id', 'name', 'user_id', 'status', 'launched_at')
+# The fields of each listed server that are kept, which are the same ones
+ServerRecord = record_type('ServerRecord', PLAN_FIELDS)
+
 
 class Server(Resource):
     """
@@ -18,12 +33,12 @@ class Server(Resource):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.__targets = []
-        self._interval = None
         # Default objects that pass through all instances without filtering
         self.__skip_name = StringMatcher(False)
         self.__name = StringMatcher(True)
-        self.__deleted_ids = []
+        self.__deleted_ids = set()
         self.__deletion = False
+        self.__listed_at = None
 
     def register(self, config):
         """
@@ -32,45 +47,187 @@ class Server(Resource):
         """
         super().register(config)
         _desc = "Regex to match the name of the servers"
-        self._sub_config.add_argument("--name", "-n", help=_desc)
+        self._add_argument("--name", "-n", help=_desc)
         _desc = "Regex to match for servers to ignore"
-        self._sub_config.add_argument("--skip-name", "-s", dest="skip_name",
-                                      help=_desc)
+        self._add_argument("--skip-name", "-s", dest="skip_name",
+                           help=_desc)
         _desc = "Minimum age (1d, 2w, 6m, 1y)"
-        self._sub_config.add_argument("--age", "-a", help=_desc)
+        self._add_argument("--age", "-a", help=_desc)
+        _desc = "Ask Nova to apply the age filter while listing servers. " \
+                "Nova filters on the last time a server changed, so " \
+                "servers changed recently are not considered for deletion"
+        self._add_argument("--server-side-age",
+                           dest="server_side_age",
+                           action="store_true", help=_desc)
 
     def process(self):
         """
         Fetches the list of servers and processes them to filter out which
-        ones ought to actually be deleted.
+        ones ought to actually be deleted. The listing is streamed one page at
+        a time through the filters, and only the servers that pass them are
+        kept.
 
         :return: None
         """
-        conn = self._get_conn()
-        self._config.info("Connecting to OpenStack to retrieve server list")
+        self._config.info("Retrieving server list")
         self.__age = self._config.get_arg('age')
-        self.__targets = conn.list_servers()
-        if not self.__deletion:
-            if self.__age is not None:
-                self._interval = self.parse_interval(self.__age)
-                self._interval = self._interval / 2
-            server_accum = []
-            # We only want to look over servers which have not been deleted
-            for server in conn.list_servers():
-                if server.id not in self.__deleted_ids:
-                    server_accum.append(server)
-            self.__targets = server_accum
-        self._config.info("Found %d servers" % len(self.__targets))
+        interval = None
+        if self.__age is not None:
+            interval = self.parse_interval(self.__age)
+        # Servers past half of the age are warned, and those past all of it
+        # are deleted
+        warning = interval / 2 if interval is not None else None
+        conn = self._get_conn()
+        query = self.__query()
+        self._config.debug("Server-side filters: %s" % (query,))
+        inventory = self._get_inventory()
+        if 'servers' not in inventory:
+            self.__listed_at = self._now
+        servers = project(ServerRecord,
+                          inventory.stream('servers',
+                                           self.__pages(conn, query)))
+        names = self.__name_predicates(query)
+        ages = self.__age_predicates('age', warning, query)
+        if self._config.get_arg('watch') is not None:
+            # Later polls only list the servers that changed, while the ones
+            # that did not still grow older, so every server that passes the
+            # name test is kept
+            plans = [self._filter_plan(names), self._filter_plan(ages)]
+        else:
+            plans = [self._filter_plan(names + ages)]
+        # Every pass of this run selects from the servers that got past the
+        # first plan, so only those are kept for the later passes
+        servers = inventory.retain('servers',
+                                   plans[0].run(self.__live(servers)))
+        if len(plans) > 1:
+            servers = plans[1].run(servers)
+        if self.__deletion:
+            plans.append(self._filter_plan(
+                self.__age_predicates('deletion age', interval, {})))
+            servers = plans[-1].run(servers)
+        self.__targets = self._shard(servers, 'servers')
+        self._config.info("Found %d servers" % plans[0].seen)
+        for plan in plans:
+            self._report_plan(plan, 'servers')
         self.__debug_targets()
-        # Process for time
-        self.__process_dates()
-        self._config.info("%d servers passed age test" % len(self.__targets))
-        # Process for name
-        self.__process_names()
-        self._config.info("%d servers passed name test" % len(self.__targets))
         # We are now done with deletion(aside from the cleaning itself)
         self.__deletion = False
 
+    def poll(self):
+        """
+        Bring the stored listing of servers up to date, by listing only the
+        servers that changed since the last listing. Changed servers are run
+        through the name test again, and deleted ones are dropped. If nothing
+        is stored, the next pass lists all of the servers instead.
+
+        :return: None
+        """
+        inventory = self._get_inventory()
+        if self.__listed_at is None or 'servers' not in inventory:
+            return
+        query = self.__query()
+        # Overlap the polls a little, so that servers changed while the last
+        # one was running are not missed
+        since = self.__listed_at - POLL_OVERLAP
+        query['changes_since'] = since.strftime(QUERY_DATE_FORMAT)
+        self.__listed_at = self._now
+        conn = self._get_conn()
+        changed = [ServerRecord.of(server)
+                   for page in self.__pages(conn, query)() for server in page]
+        plan = self._filter_plan(self.__name_predicates(query))
+        kept = list(plan.run(self.__live(changed)))
+        self._config.info("%d servers changed, %d of them kept" %
+                          (len(changed), len(kept)))
+        inventory.merge('servers', [server.id for server in changed], kept)
+
+    def plan_entries(self):
+        """
+        Describe the servers selected by the process stage.
+
+        :return: List of dicts of the key attributes of each server
+        """
+        return [{field: getattr(server, field, None)
+                 for field in PLAN_FIELDS} for server in self.__targets]
+
+    def apply(self, entries, created):
+        """
+        Select the servers of a plan for the clean stage. The servers changed
+        since the plan was listed are found with a single listing filtered on
+        changes-since, and are left out: they may have been renamed, rebuilt
+        or deleted, and would need to be processed again.
+
+        :param entries: The entries of the plan, from #plan_entries
+        :param created: When the plan was listed, as a naive datetime in UTC
+        :return: None
+        """
+        conn = self._get_conn()
+        since = created - POLL_OVERLAP
+        query = {'changes_since': since.strftime(QUERY_DATE_FORMAT)}
+        changed = {server.id for page in self.__pages(conn, query)()
+                   for server in page}
+        self.__targets = []
+        for entry in entries:
+            if entry['id'] in changed:
+                self._config.warning("%s changed since the plan was made, "
+                                     "skipping it" % entry['name'])
+            else:
+                self.__targets.append(SimpleNamespace(**entry))
+        self._config.info("%d of %d planned servers unchanged" %
+                          (len(self.__targets), len(entries)))
+
+    def resume(self, entries):
+        """
+        Select the servers left outstanding by an interrupted run for the
+        clean stage.
+
+        :param entries: The entries of the outstanding deletions
+        :return: None
+        """
+        self.__targets = [SimpleNamespace(**entry) for entry in entries]
+
+    def __pages(self, conn, query):
+        return self._pages(
+            lambda **params: conn.compute.servers(details=True,
+                                                  paginated=False,
+                                                  **params),
+            query)
+
+    def __live(self, servers):
+        # We only want to look over servers which have not been deleted. Nova
+        # also lists deleted servers when filtering on changes-before or
+        # changes-since
+        return (server for server in servers
+                if server.id not in self.__deleted_ids and
+                getattr(server, 'status', None) != 'DELETED')
+
+    def __query(self):
+        """
+        Build the filters that Nova can apply itself while listing servers.
+        Each one only narrows the listing: the age and name predicates are
+        still applied to what comes back, so the selection is the same as
+        filtering the full listing.
+
+        :return: dict of query parameters for the server listing
+        """
+        query = {}
+        name = self._config.get_arg('name')
+        if name is not None and PUSHABLE_NAME.match(name) and \
+                '(?' not in name:
+            # Nova searches anywhere in the name, where re.match is anchored
+            # at the start of the name
+            query['name'] = '^(%s)' % name
+        # Watch mode only lists changed servers after the first listing, so
+        # servers left out of it would never be seen
+        if self.__age is not None and \
+                self._config.get_arg('server_side_age') and \
+                self._config.get_arg('watch') is None:
+            # The warning pass uses half of the age, so list every server
+            # either pass could select
+            interval = self.parse_interval(self.__age) / 2
+            cutoff = self._now - interval
+            query['changes_before'] = cutoff.strftime(QUERY_DATE_FORMAT)
+        return query
+
     def __debug_targets(self):
         for target in self.__targets:
             self._config.debug("   *** " + target.name)
@@ -84,88 +241,181 @@ class Server(Resource):
         """
         conn = self._get_conn()
         self._config.info("Deleting %d servers" % len(self.__targets))
-        for target in self.__targets:
-            self._config.debug("Deleting %s" % target.id)
-            self.__deleted_ids.append(target.id)
-            conn.delete_server(target.id)
-            print("Deleted %s" % target.name)
+        results = self._delete('compute', conn.delete_server, self.__targets)
+        deleted_ids = []
+        for result in results:
+            if result.deleted:
+                deleted_ids.append(result.item.id)
+                print("Deleted %s" % result.item.name)
+            else:
+                self._config.warning("Failed to delete %s: %s" %
+                                     (result.item.name, result.error))
+        # Deleted servers no longer exist, so drop them from the listing that
+        # the warning pass will be served from
+        self.__deleted_ids.update(deleted_ids)
+        self._get_inventory().discard('servers', deleted_ids)
+        ledger = self._config.get_ledger()
+        if ledger is not None:
+            ledger.forget(deleted_ids)
+        self._check_deleted(results, 'servers')
 
-    def __process_dates(self):
+    def __age_predicates(self, name, interval, query):
         """
-        Process out all the items from this system that are not targeted based
-        on the age of the server
+        Build the test of a server's age.
 
-        :return: None
+        :param name: Name of the test
+        :param interval: Minimum age of the targeted servers, or None
+        :param query: The filters Nova applies to the listing
+        :return: List of the predicates to apply
         """
-        if self._interval is not None:
-            # interval has been set, meaning that we are using a different
-            # time then the one directly fed as an argument
-            self._config.debug("Working with age %s" % (self._interval,))
-            self.__targets = list(filter(self.__right_age, self.__targets))
-            self._config.debug("Parsed ages, servers remaining: ")
-            self.__debug_targets()
-            self._interval = None
-        elif self.__age is not None:
-            self._config.debug("Parsing dates")
-            self._interval = self.parse_interval(self.__age)
-            self._config.debug("Working with age %s" % (self._interval,))
-            self.__targets = list(filter(self.__right_age, self.__targets))
-            self._config.debug("Parsed ages, servers remaining: ")
-            self.__debug_targets()
-        else:
+        if interval is None:
             self._config.debug("No age provided")
+            return []
+        self._config.debug("Working with age %s" % (interval,))
+        cutoff = self._cutoff(interval)
+        # Parsing the launch time costs more than matching a name. Nova only
+        # lists old enough servers when it filters on changes-before
+        selectivity = 0.9 if 'changes_before' in query else 0.5
+        return [Predicate(name, lambda server: self.__right_age(server,
+                                                                cutoff),
+                          cost=2.0, selectivity=selectivity)]
+
+    def __name_predicates(self, query):
+        """
+        Build the test of a server's name.
 
-    def __process_names(self):
+        :param query: The filters Nova applies to the listing
+        :return: List of the predicates to apply
+        """
         skip_name = self._config.get_arg("skip_name")
         if skip_name is not None:
             self.__skip_name = re.compile(skip_name)
         name = self._config.get_arg('name')
         if name is not None:
             self.__name = re.compile(name)
-        if name is not None or skip_name is not None:
-            self._config.debug("Parsing names")
-            self.__targets = list(filter(self.__right_name, self.__targets))
-            self._config.debug("Parsed names, servers remaining: ")
-            self.__debug_targets()
-        else:
+        if name is None and skip_name is None:
             self._config.debug("No name restrictions provided")
+            return []
+        self._config.debug("Parsing names")
+        # Servers listed with a name filter mostly match already, and only
+        # the skip name can reject them
+        selectivity = 0.9 if 'name' in query else 0.5
+        return [Predicate('name', self.__right_name, cost=1.0,
+                          selectivity=selectivity)]
 
     def __right_name(self, target):
         return not self.__skip_name.match(target.name) and \
                self.__name.match(target.name)
 
-    def __right_age(self, target):
-        system_age = datetime.strptime(target.launched_at, DATE_FORMAT)
-        system_age = system_age.replace(tzinfo=utc)
-        return self._now > (system_age + self._interval)
+    @staticmethod
+    def __right_age(target, cutoff):
+        # Servers that have not launched yet have no age
+        if not target.launched_at:
+            return False
+        return parse_timestamp(target.launched_at) < cutoff
 
     def send_emails(self):
         """
         Sends warning emails to the owners of all flagged servers, if they have
         an email to send to. Email settings depend on input args to the script.
 
+        Each owner is looked up once and sent a single message listing all of
+        their flagged servers, and all of the messages are sent over one SMTP
+        session. If a ledger is configured, servers whose owners have already
+        been warned at their current tier are left out.
+
         :return: None
         """
+        conn = self._get_conn()
+        ledger = self._config.get_ledger()
+        messages = []
+        for user_id, servers in self.__pending_by_user(ledger).items():
+            user = conn.get_user_by_id(user_id, False)
+            # Cannot send an email to a user with no email
+            if user is not None and user.email is not None:
+                messages.append((user.email, self.__message(user, servers),
+                                 [(s.id, tier) for s, tier in servers]))
+        self.__send(messages, ledger)
+
+    def __pending_by_user(self, ledger):
+        """
+        Group the flagged servers that need a warning by the user associated
+        with them.
+
+        :param ledger: Ledger of warnings already sent, or None
+        :return: OrderedDict of user id to list of (server, tier)
+        """
+        servers_by_user = OrderedDict()
+        for server in self.__targets:
+            tier = self.__tier(server)
+            if ledger is not None and not ledger.should_notify(server.id,
+                                                               tier):
+                self._config.debug("Already warned about %s" % server.name)
+                continue
+            servers_by_user.setdefault(server.user_id, []).append(
+                (server, tier))
+        return servers_by_user
+
+    def __send(self, messages, ledger):
+        """
+        Send all of the messages over a single SMTP session. Each message is
+        recorded in the ledger as soon as it is sent, so that the messages
+        sent before an error are not sent again by the next run.
+
+        :param messages: List of (receiver, message, notified)
+        :param ledger: Ledger to record the messages sent in, or None
+        :return: None
+        """
+        if not messages:
+            return
+        self._config.info("Emailing %d users" % len(messages))
         sender = self._config.get_arg("sender")
         smtp_name = self._config.get_arg("smtpN")
         port = self._config.get_arg("smtpP")
-        conn = self._get_conn()
-        # Loop over flagged servers to send emails to the users associated with
-        # them.
-        for server in self.__targets:
-            user = conn.get_user_by_id(server.user_id, False)
-            # Cannot send an email to a user with no email
-            if user.email is not None:
-                skip_name = self._config.get_arg("skip_name")
-                receiver = user.email
-                message = '''{user}, \n Your server, {server} may be deleted
-                    when its age reaches {age} if you do not change the name
-                    of the server to include {skip} at the start of
-                    the name. '''
-                message = message.format(user=user.name, server=server.name,
-                                         age=self.__age, skip=skip_name)
-                with smtplib.SMTP(smtp_name, port) as email:
-                    email.sendmail(sender, receiver, message)
+        # Imported here, as only runs that send email need it
+        import smtplib  # pylint: disable=import-outside-toplevel
+        metrics = self._config.get_metrics()
+        with smtplib.SMTP(smtp_name, port) as email:
+            for receiver, message, notified in messages:
+                try:
+                    with metrics.timer('email_send_seconds'):
+                        email.sendmail(sender, receiver, message)
+                    if ledger is not None:
+                        ledger.record(notified)
+                    metrics.count('emails', outcome='sent')
+                except smtplib.SMTPRecipientsRefused as error:
+                    metrics.count('emails', outcome='refused')
+                    self._config.warning("Could not email %s: %s" %
+                                         (receiver, error))
+
+    def __tier(self, server):
+        """
+        Find the warning tier a flagged server has reached: the highest tier
+        whose fraction of the age the server is older than.
+
+        :param server: The flagged server
+        :return: The tier number
+        """
+        if self.__age is None:
+            return 1
+        interval = self.parse_interval(self.__age)
+        for fraction, tier in WARNING_TIERS:
+            if self.__right_age(server, self._cutoff(interval * fraction)):
+                return tier
+        return 1
+
+    def __message(self, user, servers):
+        skip_name = self._config.get_arg("skip_name")
+        message = '''{user}, \n Your servers listed below may be deleted
+            when their age reaches {age} if you do not change the name
+            of each server to include {skip} at the start of
+            the name.\n\n'''
+        message = message.format(user=user.name, age=self.__age,
+                                 skip=skip_name)
+        return message + "".join(
+            "    %s%s\n" % (server.name,
+                            " (final warning)" if tier > 1 else "")
+            for server, tier in servers)
 
     def prep_deletion(self):
         """
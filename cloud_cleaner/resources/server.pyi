@@ -1,4 +1,17 @@
-from .resource import Resource
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, \
+    Pattern, Tuple, Type
+from cloud_cleaner.ledger import NotificationLedger
+from cloud_cleaner.records import Record
+from .resource import Predicate, Resource
+
+
+PUSHABLE_NAME: Pattern
+QUERY_DATE_FORMAT: str
+WARNING_TIERS: Tuple[Tuple[float, int], ...]
+POLL_OVERLAP: timedelta
+PLAN_FIELDS: Tuple[str, ...]
+ServerRecord: Type[Record]
 
 
 class Server(Resource):
@@ -6,18 +19,48 @@ class Server(Resource):
 
     def register(self, config: CloudCleanerConfig): ...
 
-    def process(self, deletion: bool): ...
+    def process(self): ...
+
+    def poll(self): ...
+
+    def plan_entries(self) -> List[Dict[str, Any]]: ...
+
+    def apply(self, entries: List[Dict[str, Any]], created: datetime): ...
+
+    def resume(self, entries: List[Dict[str, Any]]): ...
+
+    def __pages(self, conn: Connection,
+                query: Dict[str, str]) -> Callable[[], Iterator]: ...
+
+    def __live(self, servers: Iterable[Munch]) -> Iterator[Munch]: ...
+
+    def __query(self) -> dict: ...
 
     def clean(self): ...
 
-    def __process_dates(self): ...
+    def __age_predicates(self, name: str, interval: Optional[timedelta],
+                         query: Dict[str, str]) -> List[Predicate]: ...
 
-    def __process_names(self): ...
+    def __name_predicates(self,
+                          query: Dict[str, str]) -> List[Predicate]: ...
 
     def __right_name(self, target: Munch) -> bool: ...
 
-    def __right_age(self, target: Munch) -> bool: ...
+    @staticmethod
+    def __right_age(target: Munch, cutoff: datetime) -> bool: ...
 
     def send_emails(self): ...
 
+    def __pending_by_user(
+            self, ledger: NotificationLedger
+    ) -> Dict[str, List[Tuple[Munch, int]]]: ...
+
+    def __send(self, messages: List[tuple],
+               ledger: Optional[NotificationLedger]): ...
+
+    def __tier(self, server: Munch) -> int: ...
+
+    def __message(self, user: Munch,
+                  servers: List[Tuple[Munch, int]]) -> str: ...
+
     def prep_deletion(self): ...
@@ -0,0 +1,39 @@
+"""
+Contains helpers for splitting the resources to clean between several hosts
+"""
+from argparse import ArgumentTypeError
+from hashlib import sha256
+
+
+def parse_shard(value):
+    """
+    Parse a shard given as INDEX/COUNT on the command line, where INDEX
+    counts from 0.
+
+    :param value: The command line value
+    :return: Tuple of (index, count)
+    """
+    index, _, count = value.partition('/')
+    try:
+        index, count = int(index), int(count)
+    except ValueError as error:
+        raise ArgumentTypeError("shard must be INDEX/COUNT, not %s" %
+                                value) from error
+    if count < 1 or not 0 <= index < count:
+        raise ArgumentTypeError("shard index must be from 0 to COUNT-1")
+    return index, count
+
+
+def shard_of(resource_id, count):
+    """
+    Find the shard a resource belongs to. The shard only depends on the id,
+    so every host computes the same one without coordinating. A
+    cryptographic hash is used as it spreads even short or sequential ids
+    evenly between the shards.
+
+    :param resource_id: The id of the resource
+    :param count: The number of shards
+    :return: The index of the shard
+    """
+    digest = sha256(resource_id.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % count
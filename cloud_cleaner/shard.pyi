@@ -0,0 +1,7 @@
+from typing import Tuple
+
+
+def parse_shard(value: str) -> Tuple[int, int]: ...
+
+
+def shard_of(resource_id: str, count: int) -> int: ...
@@ -0,0 +1,70 @@
+"""
+Contains the SubnetIndex class, for testing addresses against many subnets
+"""
+from bisect import bisect_right
+from functools import lru_cache
+from ipaddress import ip_address, ip_network
+
+
+class SubnetIndex(object):  # pylint: disable=R0205,R0903
+    """
+    A set of subnets, stored per IP version as sorted, non-overlapping ranges
+    of integer addresses. Testing whether an address is in any of the
+    subnets is a binary search of the ranges of its own version, so an
+    address of the other version is simply not in the index.
+    """
+    def __init__(self, networks):
+        """
+        :param networks: Iterable of subnet definitions, such as "10.0.0.0/8"
+        """
+        ranges = {4: [], 6: []}
+        for network in networks:
+            net = ip_network(network)
+            ranges[net.version].append((int(net.network_address),
+                                        int(net.broadcast_address)))
+        self.__starts = {}
+        self.__ends = {}
+        for version, spans in ranges.items():
+            starts, ends = [], []
+            for start, end in sorted(spans):
+                # Merge ranges that overlap or touch, so that only the range
+                # starting just before an address needs to be checked
+                if ends and start <= ends[-1] + 1:
+                    ends[-1] = max(ends[-1], end)
+                else:
+                    starts.append(start)
+                    ends.append(end)
+            self.__starts[version] = starts
+            self.__ends[version] = ends
+
+    def __contains__(self, address):
+        """
+        Check whether an address is in any of the subnets.
+
+        :param address: String form of the address, or None
+        :return: True if the address is in one of the subnets
+        """
+        parsed = parse_address(address)
+        if parsed is None:
+            return False
+        version, value = parsed
+        index = bisect_right(self.__starts[version], value) - 1
+        return index >= 0 and value <= self.__ends[version][index]
+
+
+@lru_cache(maxsize=65536)
+def parse_address(address):
+    """
+    Parse an address into its version and integer value. Results are cached,
+    as the same addresses are tested on every pass of a run.
+
+    :param address: String form of the address, or None
+    :return: Tuple of (version, value), or None if it is not an address
+    """
+    if address is None:
+        return None
+    try:
+        parsed = ip_address(address)
+    except ValueError:
+        return None
+    return parsed.version, int(parsed)
@@ -0,0 +1,10 @@
+from typing import Iterable, Optional, Tuple
+
+
+class SubnetIndex(object):
+    def __init__(self, networks: Iterable[str]): ...
+
+    def __contains__(self, address: Optional[str]) -> bool: ...
+
+
+def parse_address(address: Optional[str]) -> Optional[Tuple[int, int]]: ...
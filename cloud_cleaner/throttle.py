@@ -0,0 +1,285 @@
+"""
+Contains the rate control components that every call to OpenStack goes
+through: a token bucket per service, an AIMD concurrency controller per
+service and a retry loop with exponential backoff for throttled calls.
+"""
+import random
+import time
+from threading import Condition, Lock
+from types import GeneratorType
+
+# HTTP status codes OpenStack services use to ask a client to slow down
+THROTTLE_CODES = (429, 503)
+
+# Maps fragments of connection method names to the service they call
+SERVICES = (
+    ('server', 'compute'),
+    ('floating_ip', 'network'),
+    ('user', 'identity'),
+)
+# Service proxies on the connection, e.g. conn.compute.servers()
+PROXIES = ('compute', 'network', 'identity')
+
+
+class TokenBucket(object):  # pylint: disable=R0205,R0903
+    """
+    Limits calls to "rate" per second, allowing bursts of up to "burst"
+    calls. A caller that finds the bucket empty reserves the next token and
+    sleeps until it is due.
+    """
+    def __init__(self, rate, burst=None, clock=time.monotonic,
+                 sleep=time.sleep):
+        self.__rate = float(rate)
+        self.__burst = float(burst if burst is not None else max(1.0, rate))
+        self.__tokens = self.__burst
+        self.__clock = clock
+        self.__sleep = sleep
+        self.__stamp = clock()
+        self.__lock = Lock()
+
+    def acquire(self):
+        """
+        Take a token from the bucket, sleeping until one is available.
+
+        :return: The number of seconds spent waiting
+        """
+        with self.__lock:
+            now = self.__clock()
+            self.__tokens = min(self.__burst, self.__tokens +
+                                (now - self.__stamp) * self.__rate)
+            self.__stamp = now
+            self.__tokens -= 1
+            wait = -self.__tokens / self.__rate if self.__tokens < 0 else 0
+        if wait > 0:
+            self.__sleep(wait)
+        return wait
+
+
+class AimdController(object):  # pylint: disable=R0205
+    """
+    Bounds the number of calls in flight against a service. The limit grows
+    additively while calls succeed and is halved each time the service
+    throttles a call.
+    """
+    def __init__(self, maximum, minimum=1):
+        self.__maximum = float(max(1, maximum))
+        self.__minimum = float(max(1, minimum))
+        self.__limit = self.__maximum
+        self.__in_flight = 0
+        self.__cond = Condition()
+
+    @property
+    def limit(self):
+        """The current number of calls allowed in flight"""
+        return int(self.__limit)
+
+    def acquire(self):
+        """Wait until a call is allowed to start"""
+        with self.__cond:
+            while self.__in_flight >= int(self.__limit):
+                self.__cond.wait()
+            self.__in_flight += 1
+
+    def release(self, throttled=False):
+        """
+        Record that a call has finished.
+
+        :param throttled: True if the service throttled the call
+        :return: None
+        """
+        with self.__cond:
+            self.__in_flight -= 1
+            if throttled:
+                self.__limit = max(self.__minimum, self.__limit / 2)
+            else:
+                self.__limit = min(self.__maximum,
+                                   self.__limit + 1 / self.__limit)
+            self.__cond.notify_all()
+
+
+class RateControl(object):  # pylint: disable=R0205,R0902
+    """
+    Shared rate control for all calls made to OpenStack during a run. Calls
+    are grouped by service, and each service gets its own token bucket (if a
+    rate is given) and concurrency controller. Calls the service throttles
+    are retried with exponential backoff and full jitter.
+    """
+    def __init__(self, rate=None, concurrency=1, retries=5, backoff=0.5,
+                 max_backoff=30.0, sleep=time.sleep, metrics=None):
+        # pylint: disable=R0913
+        self.__rate = rate
+        self.__concurrency = concurrency
+        self.__retries = retries
+        self.__backoff = backoff
+        self.__max_backoff = max_backoff
+        self.__sleep = sleep
+        self.__metrics = metrics
+        self.__buckets = {}
+        self.__controllers = {}
+        self.__counters = {'calls': 0, 'throttles': 0, 'retries': 0,
+                           'failures': 0}
+        self.__lock = Lock()
+
+    def wrap(self, conn):
+        """
+        Wrap a connection so that every call made through it goes through
+        this rate control.
+
+        :param conn: The connection to wrap
+        :return: The wrapped connection, or None if conn is None
+        """
+        if conn is None:
+            return None
+        return ThrottledConnection(conn, self)
+
+    def call(self, service, func, *args, **kwargs):
+        """
+        Call func, retrying it while the service throttles it.
+
+        :param service: Name of the service the call is made to
+        :param func: The callable to call
+        :return: The return value of func
+        """
+        bucket, controller = self.__service(service)
+        attempt = 0
+        while True:
+            if bucket is not None:
+                bucket.acquire()
+            controller.acquire()
+            throttled = False
+            outcome = 'error'
+            started = time.perf_counter()
+            try:
+                self.__count('calls')
+                result = func(*args, **kwargs)
+                if isinstance(result, GeneratorType):
+                    # Consume listings here, so that their requests are also
+                    # covered by the retry loop
+                    result = list(result)
+                outcome = 'ok'
+                return result
+            except Exception as error:  # pylint: disable=broad-except
+                throttled = is_throttle(error)
+                if not throttled:
+                    raise
+                outcome = 'throttled'
+                self.__count('throttles')
+                if attempt >= self.__retries:
+                    self.__count('failures')
+                    raise
+                wait = self.__delay(attempt, error)
+            finally:
+                controller.release(throttled)
+                self.__measure(service, outcome,
+                               time.perf_counter() - started)
+            self.__count('retries')
+            self.__sleep(wait)
+            attempt += 1
+
+    def counters(self):
+        """
+        Fetch the counters for all the calls made so far.
+
+        :return: dict of counter name to value
+        """
+        with self.__lock:
+            return dict(self.__counters)
+
+    def limits(self):
+        """
+        Fetch the current concurrency limit of each service.
+
+        :return: dict of service name to limit
+        """
+        with self.__lock:
+            return dict((name, controller.limit)
+                        for name, controller in self.__controllers.items())
+
+    def __delay(self, attempt, error):
+        delay = min(self.__max_backoff, self.__backoff * 2 ** attempt)
+        delay = random.uniform(0, delay)
+        return max(delay, retry_after(error))
+
+    def __measure(self, service, outcome, seconds):
+        if self.__metrics is not None:
+            self.__metrics.observe('api_call_seconds', seconds,
+                                   service=service)
+            self.__metrics.count('api_calls', service=service,
+                                 outcome=outcome)
+
+    def __count(self, name):
+        with self.__lock:
+            self.__counters[name] += 1
+
+    def __service(self, service):
+        with self.__lock:
+            if service not in self.__controllers:
+                if self.__rate:
+                    self.__buckets[service] = TokenBucket(
+                        self.__rate, sleep=self.__sleep)
+                self.__controllers[service] = AimdController(
+                    self.__concurrency)
+            return (self.__buckets.get(service),
+                    self.__controllers[service])
+
+
+class ThrottledConnection(object):  # pylint: disable=R0205,R0903
+    """
+    Proxy for a connection object. Calls to methods that reach a known
+    service, and to the methods of the service proxies, are made through
+    the rate control. Everything else is passed straight through.
+    """
+    def __init__(self, conn, control, service=None):
+        self.__conn = conn
+        self.__control = control
+        self.__service = service
+
+    def __getattr__(self, name):
+        attr = getattr(self.__conn, name)
+        if self.__service is None and name in PROXIES:
+            return ThrottledConnection(attr, self.__control, name)
+        service = self.__service or service_for(name)
+        if service is None or not callable(attr):
+            return attr
+
+        def _call(*args, **kwargs):
+            return self.__control.call(service, attr, *args, **kwargs)
+        return _call
+
+
+def service_for(name):
+    """
+    Find the service that a connection method calls.
+
+    :param name: Name of the connection method
+    :return: The service name, or None if it is not known
+    """
+    for fragment, service in SERVICES:
+        if fragment in name:
+            return service
+    return None
+
+
+def is_throttle(error):
+    """
+    Check whether an exception means that the service throttled the call.
+
+    :param error: The exception raised by the call
+    :return: True if the call should be retried
+    """
+    return getattr(error, 'status_code', None) in THROTTLE_CODES
+
+
+def retry_after(error):
+    """
+    Read the Retry-After header from the response attached to an error.
+
+    :param error: The exception raised by the call
+    :return: Number of seconds to wait, or 0 if none was given
+    """
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After', 0))
+    except (TypeError, ValueError):
+        return 0
@@ -0,0 +1,67 @@
+from typing import Any, Callable, Dict, Optional, Tuple
+from cloud_cleaner.metrics import Metrics
+
+
+THROTTLE_CODES: Tuple[int, ...]
+SERVICES: Tuple[Tuple[str, str], ...]
+PROXIES: Tuple[str, ...]
+
+
+class TokenBucket(object):
+    def __init__(self, rate: float, burst: float = None,
+                 clock: Callable[[], float] = ...,
+                 sleep: Callable[[float], Any] = ...): ...
+
+    def acquire(self) -> float: ...
+
+
+class AimdController(object):
+    def __init__(self, maximum: int, minimum: int = 1): ...
+
+    @property
+    def limit(self) -> int: ...
+
+    def acquire(self): ...
+
+    def release(self, throttled: bool = False): ...
+
+
+class RateControl(object):
+    def __init__(self, rate: float = None, concurrency: int = 1,
+                 retries: int = 5, backoff: float = 0.5,
+                 max_backoff: float = 30.0,
+                 sleep: Callable[[float], Any] = ...,
+                 metrics: Metrics = None): ...
+
+    def wrap(self, conn: Any) -> Optional[ThrottledConnection]: ...
+
+    def call(self, service: str, func: Callable, *args, **kwargs) -> Any: ...
+
+    def counters(self) -> Dict[str, int]: ...
+
+    def limits(self) -> Dict[str, int]: ...
+
+    def __delay(self, attempt: int, error: Exception) -> float: ...
+
+    def __measure(self, service: str, outcome: str, seconds: float): ...
+
+    def __count(self, name: str): ...
+
+    def __service(self, service: str) -> Tuple[TokenBucket,
+                                                AimdController]: ...
+
+
+class ThrottledConnection(object):
+    def __init__(self, conn: Any, control: RateControl,
+                 service: str = None): ...
+
+    def __getattr__(self, name: str) -> Any: ...
+
+
+def service_for(name: str) -> Optional[str]: ...
+
+
+def is_throttle(error: Exception) -> bool: ...
+
+
+def retry_after(error: Exception) -> float: ...
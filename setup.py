@@ -28,8 +28,7 @@ setup(
     ],
     install_requires=[
         'openstacksdk',
-        'munch',
-        'pytz'
+        'munch'
     ],
     extras_require={
         ":python_version<'3.3'": [
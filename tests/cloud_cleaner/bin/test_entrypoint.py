@@ -1,15 +1,39 @@
+import json
+from datetime import datetime
 from sys import version_info
 from unittest import TestCase
 try:
-    from unittest.mock import Mock
+    from unittest.mock import Mock, call, patch
 except ImportError:
-    from mock import Mock
+    from mock import Mock, call, patch
 from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from os import path
+from shutil import rmtree
+from tempfile import mkdtemp
 from keystoneauth1.exceptions.auth_plugins import MissingRequiredOptions
-from cloud_cleaner.bin.entrypoint import cloud_clean
+from cloud_cleaner.bin.entrypoint import cloud_clean, fan_out
 from cloud_cleaner import config as config_module
 from cloud_cleaner.config import CloudCleanerConfig
-from cloud_cleaner.resources import ALL_RESOURCES
+from cloud_cleaner.executor import DeletionError
+from cloud_cleaner.resources import ALL_RESOURCES, Server
+from cloud_cleaner.resources.registry import ResourceRegistry
+from cloud_cleaner.resources.resource import Resource, _strptime_iso
+from cloud_cleaner.plan import PlanError, read_plan, write_plan
+
+
+class Volume(Resource):
+    type_name = "volume"
+
+    def register(self, config):
+        super().register(config)
+        self._add_argument("--size")
+
+    def process(self):
+        pass
+
+    def clean(self):
+        pass
 
 
 class TestEntrypoint(TestCase):
@@ -43,3 +67,273 @@ class TestEntrypoint(TestCase):
         cloud_clean(args=["--os-auth-url", "http://no.com", "-f", "server"])
         self.assertEqual(1, len(ALL_RESOURCES["server"].process.mock_calls))
         self.assertEqual(1, len(ALL_RESOURCES["server"].clean.mock_calls))
+
+    @patch("cloud_cleaner.resources.registry.plugins")
+    def test_plugin(self, plugins):
+        server = Mock(return_value=Server())
+        plugins.return_value = [("volume", Volume)]
+        registry = ResourceRegistry([("server", server)], group="plugins")
+        config = CloudCleanerConfig(args=[])
+        with patch("cloud_cleaner.bin.entrypoint.ALL_RESOURCES", registry):
+            cloud_clean(args=["--os-auth-url", "http://no.com", "volume",
+                              "--size", "10"], config=config)
+        self.assertEqual("10", config.get_arg("size"))
+        # Only the selected resource type is loaded
+        self.assertEqual(0, server.call_count)
+
+    def test_watch(self):
+        server = ALL_RESOURCES["server"]
+        server.process = Mock(side_effect=[RuntimeError("down"), None, None])
+        server.clean = Mock()
+        server.poll = Mock()
+        sleep = Mock(side_effect=[None, None, KeyboardInterrupt])
+        config = CloudCleanerConfig(args=[])
+        cloud_clean(args=["--os-auth-url", "http://no.com", "--watch", "30",
+                          "-f", "server"], config=config, sleep=sleep)
+        # The failed first run does not stop the watch
+        self.assertEqual(3, server.process.call_count)
+        self.assertEqual(2, server.clean.call_count)
+        self.assertEqual(2, server.poll.call_count)
+        self.assertEqual(3, sleep.call_count)
+        for wait in sleep.call_args_list:
+            self.assertTrue(0 <= wait[0][0] <= 30)
+
+    def test_metrics_files(self):
+        workdir = mkdtemp()
+        self.addCleanup(rmtree, workdir)
+        textfile = path.join(workdir, "cloud_cleaner.prom")
+        json_file = path.join(workdir, "metrics.json")
+        server = ALL_RESOURCES["server"]
+        server.process = Mock(side_effect=[RuntimeError("down"), None, None])
+        server.clean = Mock()
+        server.poll = Mock()
+        sleep = Mock(side_effect=[None, None, KeyboardInterrupt])
+        config = CloudCleanerConfig(args=[])
+        cloud_clean(args=["--os-auth-url", "http://no.com", "--watch", "30",
+                          "--metrics-textfile", textfile,
+                          "--metrics-json", json_file, "-f", "server"],
+                    config=config, sleep=sleep)
+        with open(json_file) as metrics_file:
+            summary = json.load(metrics_file)
+        runs = dict((c["labels"]["outcome"], c["value"])
+                    for c in summary["counters"] if c["name"] == "runs")
+        self.assertEqual({"ok": 2, "failed": 1}, runs)
+        phases = dict((h["labels"]["phase"], h["count"])
+                      for h in summary["histograms"]
+                      if h["name"] == "phase_seconds")
+        self.assertEqual({"process": 3, "clean": 2, "poll": 2}, phases)
+        with open(textfile) as metrics_file:
+            self.assertIn('cloud_cleaner_runs_total{outcome="failed"} 1\n',
+                          metrics_file.read())
+
+    def test_plan_out_and_apply(self):
+        workdir = mkdtemp()
+        self.addCleanup(rmtree, workdir)
+        plan_path = path.join(workdir, 'plan.json')
+        server = Server()
+        server.process = Mock()
+        server.clean = Mock()
+        server.plan_entries = Mock(return_value=[{'id': '1', 'name': 'a'}])
+        server.apply = Mock()
+        with patch.dict(ALL_RESOURCES, {'server': server}):
+            cloud_clean(args=["--os-auth-url", "http://no.com", "-f",
+                              "--plan-out", plan_path, "server"],
+                        config=CloudCleanerConfig(args=[]))
+            # A plan is only written, even with --force
+            self.assertEqual(1, server.process.call_count)
+            self.assertEqual(0, server.clean.call_count)
+            cloud_clean(args=["--os-auth-url", "http://no.com",
+                              "--apply", plan_path],
+                        config=CloudCleanerConfig(args=[]))
+        server.apply.assert_called_once()
+        self.assertEqual([{'id': '1', 'name': 'a'}],
+                         server.apply.call_args[0][0])
+        self.assertEqual(1, server.clean.call_count)
+
+    def test_apply_written_plan(self):
+        workdir = mkdtemp()
+        self.addCleanup(rmtree, workdir)
+        conn = Mock()
+        conn.compute.servers = Mock(return_value=[])
+        # The timestamp parsing of Python releases without fromisoformat
+        with patch.dict(ALL_RESOURCES, {'server': Server()}), \
+                patch('cloud_cleaner.resources.resource._fromisoformat',
+                      _strptime_iso):
+            config = CloudCleanerConfig(args=[])
+            config.get_conn = Mock(return_value=conn)
+            cloud_clean(args=["--os-auth-url", "http://no.com",
+                              "--apply", self.__plan(workdir)],
+                        config=config)
+        self.assertEqual([call('1'), call('2')],
+                         conn.delete_server.call_args_list)
+
+    def test_apply_other_resource(self):
+        workdir = mkdtemp()
+        self.addCleanup(rmtree, workdir)
+        plan_path = path.join(workdir, 'plan.json')
+        write_plan(plan_path, 'fip', [])
+        with self.assertRaises(PlanError):
+            cloud_clean(args=["--os-auth-url", "http://no.com",
+                              "--apply", plan_path, "server"],
+                        config=CloudCleanerConfig(args=[]))
+
+    def test_resume(self):
+        workdir = mkdtemp()
+        self.addCleanup(rmtree, workdir)
+        journal_path = path.join(workdir, 'journal')
+        conn = Mock()
+        conn.compute.servers = Mock(return_value=[])
+        conn.delete_server = Mock(side_effect=[None, RuntimeError("gone")])
+        server = Server()
+        with patch.dict(ALL_RESOURCES, {'server': server}):
+            config = CloudCleanerConfig(args=[])
+            config.get_conn = Mock(return_value=conn)
+            # The run fails, as a deletion failed
+            with self.assertRaises(DeletionError):
+                cloud_clean(args=["--os-auth-url", "http://no.com",
+                                  "--journal", journal_path, "--apply",
+                                  self.__plan(workdir), "server"],
+                            config=config)
+            self.assertEqual(2, conn.delete_server.call_count)
+            # The failed deletion of server 2 is still outstanding
+            conn.delete_server = Mock()
+            config = CloudCleanerConfig(args=[])
+            config.get_conn = Mock(return_value=conn)
+            cloud_clean(args=["--os-auth-url", "http://no.com", "--journal",
+                              journal_path, "--resume"], config=config)
+            conn.delete_server.assert_called_once_with('2')
+            conn.delete_server = Mock()
+            cloud_clean(args=["--os-auth-url", "http://no.com", "--journal",
+                              journal_path, "--resume"],
+                        config=CloudCleanerConfig(args=[]))
+            conn.delete_server.assert_not_called()
+
+    def test_dry_run_keeps_outstanding(self):
+        workdir = mkdtemp()
+        self.addCleanup(rmtree, workdir)
+        journal_path = path.join(workdir, 'journal')
+        # A run that was interrupted before it deleted server 1
+        with open(journal_path, 'w') as journal:
+            for record in ({'op': 'start'},
+                           {'op': 'intend', 'resource': 'server',
+                            'item': {'id': '1', 'name': 'server-1',
+                                     'user_id': 'a', 'status': 'ACTIVE',
+                                     'launched_at': None}}):
+                journal.write(json.dumps(record) + '\n')
+        conn = Mock()
+        conn.compute.servers = Mock(return_value=[])
+        server = Server()
+        with patch.dict(ALL_RESOURCES, {'server': server}):
+            for args in (["server"],
+                         ["--plan-out", path.join(workdir, 'out.json'),
+                          "server"]):
+                config = CloudCleanerConfig(args=[])
+                config.get_conn = Mock(return_value=conn)
+                cloud_clean(args=["--os-auth-url", "http://no.com",
+                                  "--journal", journal_path] + args,
+                            config=config)
+            config = CloudCleanerConfig(args=[])
+            config.get_conn = Mock(return_value=conn)
+            cloud_clean(args=["--os-auth-url", "http://no.com", "--journal",
+                              journal_path, "--resume"], config=config)
+        conn.delete_server.assert_called_once_with('1')
+
+    def test_resume_without_journal(self):
+        with self.assertRaises(SystemExit):
+            cloud_clean(args=["--os-auth-url", "http://no.com", "--resume"],
+                        config=CloudCleanerConfig(args=[]))
+
+    @staticmethod
+    def __plan(workdir):
+        plan_path = path.join(workdir, 'plan.json')
+        write_plan(plan_path, 'server', [
+            {'id': '1', 'name': 'server-1', 'user_id': 'a',
+             'status': 'ACTIVE', 'launched_at': None},
+            {'id': '2', 'name': 'server-2', 'user_id': 'a',
+             'status': 'ACTIVE', 'launched_at': None}])
+        return plan_path
+
+    def test_auth_cache(self):
+        workdir = mkdtemp()
+        self.addCleanup(rmtree, workdir)
+        cache = path.join(workdir, "auth.json")
+        # Imported here, so that the other tests do not need the HTTP fake
+        # pylint: disable=import-outside-toplevel
+        from tests.fake_openstack import FakeOpenStack, fake_cloud
+        with fake_cloud(FakeOpenStack()) as service:
+            for _ in range(3):
+                with patch.dict(ALL_RESOURCES, {"server": Server()}):
+                    cloud_clean(args=["--os-cloud", "fake", "--auth-cache",
+                                      cache, "server"],
+                                config=CloudCleanerConfig(args=[]))
+        # Authenticated by the first run, and the token reused after that
+        self.assertEqual(1, service.calls["POST issue_token"])
+        self.assertEqual(3, service.calls["GET list_servers"])
+
+    def test_dump_and_replay(self):
+        workdir = mkdtemp()
+        self.addCleanup(rmtree, workdir)
+        dump = path.join(workdir, "servers.ndjson")
+        plans = [path.join(workdir, "live.json"),
+                 path.join(workdir, "replayed.json")]
+        now = datetime.utcnow()
+        # pylint: disable=import-outside-toplevel
+        from tests.fake_openstack import FakeOpenStack, fake_cloud, \
+            fake_server
+        with fake_cloud(FakeOpenStack(
+                servers=[fake_server(i, now) for i in range(30)])) as service:
+            with patch.dict(ALL_RESOURCES, {"server": Server()}):
+                cloud_clean(args=["--os-cloud", "fake", "--dump-inventory",
+                                  dump, "--plan-out", plans[0], "server",
+                                  "--age", "1d", "--skip-name", "pet-"],
+                            config=CloudCleanerConfig(args=[]))
+        listed = service.calls["GET list_servers"]
+        with patch.dict(ALL_RESOURCES, {"server": Server()}):
+            cloud_clean(args=["--from-inventory", dump, "--plan-out",
+                              plans[1], "server", "--age", "1d",
+                              "--skip-name", "pet-"],
+                        config=CloudCleanerConfig(args=[]))
+        live, replayed = [read_plan(plan)["items"] for plan in plans]
+        # Servers 24 to 29 are a day old, and none of them is a pet
+        self.assertEqual(6, len(live))
+        self.assertEqual(live, replayed)
+        self.assertEqual(listed, service.calls["GET list_servers"])
+
+    def test_replay_missing_file(self):
+        workdir = mkdtemp()
+        self.addCleanup(rmtree, workdir)
+        with self.assertRaises(SystemExit):
+            cloud_clean(args=["--from-inventory",
+                              path.join(workdir, "servers.ndjson"),
+                              "server"], config=CloudCleanerConfig(args=[]))
+
+    def test_replay_cannot_delete(self):
+        workdir = mkdtemp()
+        self.addCleanup(rmtree, workdir)
+        dump = path.join(workdir, "servers.ndjson")
+        open(dump, "w").close()
+        with self.assertRaises(SystemExit):
+            cloud_clean(args=["--from-inventory", dump, "-f", "server"],
+                        config=CloudCleanerConfig(args=[]))
+
+    def test_single_type_options(self):
+        for args in (["--plan-out", "plan.json"], ["--apply", "plan.json"],
+                     ["--journal", "journal", "--resume"]):
+            with self.assertRaises(SystemExit):
+                cloud_clean(args=["--os-auth-url", "http://no.com"] + args +
+                            ["all"], config=CloudCleanerConfig(args=[]))
+
+    def test_fan_out(self):
+        server = Server()
+        server.process = Mock()
+        with patch.dict(ALL_RESOURCES, {'server': server}):
+            config = CloudCleanerConfig(args=["--target", "default",
+                                              "--target", "nosuch",
+                                              "server"])
+            for resource in ALL_RESOURCES.values():
+                resource.register(config)
+            config.parse_args()
+            status = fan_out(config, ThreadPoolExecutor(max_workers=1))
+        # The missing cloud fails without stopping the other one
+        self.assertEqual(1, status)
+        self.assertEqual(1, server.process.call_count)
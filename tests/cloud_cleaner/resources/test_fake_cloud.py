@@ -0,0 +1,96 @@
+from datetime import datetime
+from unittest import TestCase
+from cloud_cleaner.config import CloudCleanerConfig
+from cloud_cleaner.executor import DeletionError
+from cloud_cleaner.resources import Fip, Server
+from tests.fake_openstack import FakeOpenStack, fake_cloud, fake_fip, \
+    fake_server, fake_user
+
+
+# Server N was launched N hours ago
+SERVERS = 64
+FIPS = 50
+
+
+class TestFakeCloud(TestCase):
+    """
+    Runs the resources against the fake OpenStack service over HTTP, through
+    the "fake" cloud of fake_cloud
+    """
+    def setUp(self):
+        now = datetime.utcnow()
+        cloud = fake_cloud(FakeOpenStack(
+            servers=[fake_server(i, now) for i in range(SERVERS)],
+            floating_ips=[fake_fip(i) for i in range(FIPS)],
+            users=[fake_user(i) for i in range(10)]))
+        self.service = cloud.__enter__()
+        self.addCleanup(cloud.__exit__, None, None, None)
+
+    def __run(self, resource, *args):
+        config = CloudCleanerConfig(args=['--os-cloud', 'fake',
+                                          '--page-size', '10'] + list(args))
+        resource.register(config)
+        config.parse_args()
+        resource.prep_deletion()
+        resource.process()
+        resource.clean()
+        return config
+
+    def test_server(self):
+        self.__run(Server(), '--concurrency', '4', 'server', '--age', '1d',
+                   '--skip-name', 'pet-')
+        # 40 servers are over a day old, 4 of which are pets
+        self.assertEqual(SERVERS - 36, len(self.service.servers))
+        self.assertEqual(36, self.service.calls['DELETE delete_server'])
+        # Listed 10 at a time
+        self.assertGreaterEqual(self.service.calls['GET list_servers'], 7)
+
+    def test_metrics(self):
+        config = self.__run(Server(), 'server', '--age', '1d')
+        summary = config.get_metrics().summary()
+        counters = dict(((c['name'],) + tuple(sorted(c['labels'].items())),
+                         c['value']) for c in summary['counters'])
+        histograms = dict((h['name'], h['count'])
+                          for h in summary['histograms'])
+        # Authenticated once, on the first call
+        self.assertEqual(1, histograms['auth_seconds'])
+        self.assertEqual(SERVERS, counters[('listed',
+                                            ('resource', 'server'))])
+        # Seven pages of 10, then an empty one
+        self.assertEqual(8, histograms['list_page_seconds'])
+        self.assertEqual(40, counters[('deletes', ('endpoint', 'compute'),
+                                       ('outcome', 'deleted'))])
+        self.assertEqual(40, histograms['delete_seconds'])
+        # 52 servers are old enough to be warned about, 40 to be deleted
+        self.assertEqual(52, counters[('filter_passed',
+                                       ('resource', 'server'),
+                                       ('test', 'age'))])
+        self.assertEqual(40, counters[('filter_passed',
+                                       ('resource', 'server'),
+                                       ('test', 'deletion age'))])
+        self.assertGreater(counters[('filter_seconds',
+                                     ('resource', 'server'),
+                                     ('test', 'age'))], 0)
+
+    def test_fip(self):
+        self.__run(Fip(), 'fip')
+        # Every other floating IP is attached
+        self.assertEqual(FIPS // 2, len(self.service.floating_ips))
+
+    def test_throttled(self):
+        self.service.throttle_rate = 0.1
+        self.__run(Fip(), '--max-retries', '10', 'fip')
+        self.assertEqual(FIPS // 2, len(self.service.floating_ips))
+
+    def test_errors(self):
+        fip = Fip()
+        config = CloudCleanerConfig(args=['--os-cloud', 'fake', 'fip'])
+        fip.register(config)
+        config.parse_args()
+        fip.process()
+        self.service.error_rate = 0.3
+        with self.assertRaises(DeletionError):
+            fip.clean()
+        # Failed deletes are warned about, and the rest go ahead
+        self.assertLess(len(self.service.floating_ips), FIPS)
+        self.assertGreater(len(self.service.floating_ips), FIPS // 2)
@@ -8,6 +8,7 @@ from munch import munchify
 
 from cloud_cleaner.config import CloudCleanerConfig
 from cloud_cleaner.resources.fip import Fip
+from tests.fakes import paged
 
 
 FLOATING_IPS = [
@@ -56,12 +57,28 @@ FLOATING_IPS = [
         'status': 'DOWN'
     })
 ]
+FLOATING_IPS_V6 = FLOATING_IPS + [
+    munchify({
+        'attached': False,
+        'fixed_ip_address': 'fd00::30',
+        'floating_ip_address': '2001:db8::30',
+        'id': '30',
+        'status': 'DOWN'
+    }),
+    munchify({
+        'attached': False,
+        'fixed_ip_address': None,
+        'floating_ip_address': '2001:db8::31',
+        'id': '31',
+        'status': 'DOWN'
+    })
+]
 
 
 class TestFip(TestCase):
-    def __test_with_calls(self, args, calls):
+    def __test_with_calls(self, args, calls, fips=None):
         conn = Mock()
-        conn.list_floating_ips = Mock(return_value=FLOATING_IPS)
+        conn.network.ips = Mock(side_effect=paged(fips or FLOATING_IPS))
         conn.delete_floating_ip = Mock()
         calls = [call(i) for i in calls]
         config = CloudCleanerConfig(args=args)
@@ -118,3 +135,47 @@ class TestFip(TestCase):
                 '192.168.0.0/16']
         calls = ['20', '22']
         self.__test_with_calls(args, calls)
+
+    def test_delete_by_many_subnets(self):
+        args = ['--os-auth-url', 'http://no.com', 'fip', '--floating-subnet',
+                '10.0.0.21/32', '--floating-subnet', '8.0.0.0/8',
+                '--floating-subnet', '2001:db8::31/128']
+        calls = ['21', '22', '31']
+        self.__test_with_calls(args, calls, FLOATING_IPS_V6)
+
+    def test_mixed_ip_versions(self):
+        args = ['--os-auth-url', 'http://no.com', 'fip', '--floating-subnet',
+                '10.0.0.0/8', '--static-subnet', '192.168.0.0/16']
+        calls = ['20']
+        self.__test_with_calls(args, calls, FLOATING_IPS_V6)
+        args = ['--os-auth-url', 'http://no.com', 'fip', '--static-subnet',
+                'fd00::/8']
+        calls = ['30']
+        self.__test_with_calls(args, calls, FLOATING_IPS_V6)
+
+    def test_plan_and_apply(self):
+        conn = Mock()
+        conn.network.ips = Mock(side_effect=paged(FLOATING_IPS))
+        conn.delete_floating_ip = Mock()
+        config = CloudCleanerConfig(args=['--os-auth-url', 'http://no.com',
+                                          'fip'])
+        config.get_conn = Mock(return_value=conn)
+        fip = Fip()
+        fip.register(config)
+        config.parse_args()
+        fip.process()
+        entries = fip.plan_entries()
+        self.assertEqual(['20', '21', '22'], [e['id'] for e in entries])
+        self.assertIsNone(entries[0]['port_id'])
+        # 21 was attached and 22 released after the plan was made
+        attached = munchify(dict(FLOATING_IPS[4], attached=True))
+        conn.network.ips = Mock(return_value=[FLOATING_IPS[3], attached])
+        config = CloudCleanerConfig(args=['--os-auth-url', 'http://no.com'])
+        config.get_conn = Mock(return_value=conn)
+        fip = Fip()
+        fip.register(config)
+        config.parse_args()
+        fip.apply(entries, None)
+        fip.clean()
+        conn.network.ips.assert_called_once_with(id=['20', '21', '22'])
+        self.assertEqual(conn.delete_floating_ip.call_args_list, [call('20')])
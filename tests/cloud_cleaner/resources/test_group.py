@@ -0,0 +1,106 @@
+from threading import Barrier
+from unittest import TestCase
+try:
+    from unittest.mock import Mock, call
+except ImportError:
+    from mock import Mock, call
+from cloud_cleaner.config import CloudCleanerConfig
+from cloud_cleaner.executor import DeletionError
+from cloud_cleaner.resources import Fip, ResourceGroup, Server
+from cloud_cleaner.resources.group import _ordered
+from cloud_cleaner.resources.resource import UnimplementedError
+from tests.cloud_cleaner.resources.test_fip import FLOATING_IPS
+from tests.cloud_cleaner.resources.test_server import CURRENT_TIME, \
+    SAMPLE_SERVERS
+from tests.fakes import paged
+
+
+def member(name, depends_on=(), calls=None):
+    resource = Mock()
+    resource.type_name = name
+    resource.depends_on = depends_on
+    resource.arguments = []
+    if calls is not None:
+        for method in ('poll', 'prep_deletion', 'process', 'clean'):
+            getattr(resource, method).side_effect = \
+                lambda method=method: calls.append((name, method))
+    return resource
+
+
+class TestResourceGroup(TestCase):
+    def test_dependency_order(self):
+        fip = member('fip', ('server',))
+        server = member('server')
+        other = member('other')
+        self.assertEqual([server, other, fip],
+                         _ordered([fip, server, other]))
+        with self.assertRaises(ValueError):
+            _ordered([member('a', ('b',)), member('b', ('a',))])
+
+    def test_process_concurrently(self):
+        barrier = Barrier(2, timeout=5)
+        first = member('first')
+        second = member('second')
+        # Each process call waits for the other to start
+        first.process.side_effect = barrier.wait
+        second.process.side_effect = barrier.wait
+        ResourceGroup([first, second]).process()
+        first.process.assert_called_once_with()
+        second.process.assert_called_once_with()
+
+    def test_clean_in_order(self):
+        calls = []
+        group = ResourceGroup([member('fip', ('server',), calls),
+                               member('server', (), calls)])
+        group.register(Mock())
+        group.clean()
+        # The floating IPs are processed again once servers are deleted
+        self.assertEqual([('server', 'clean'), ('fip', 'poll'),
+                          ('fip', 'prep_deletion'), ('fip', 'process'),
+                          ('fip', 'clean')], calls)
+
+    def test_clean_failures(self):
+        server = member('server')
+        fip = member('fip', ('server',))
+        server.clean.side_effect = DeletionError([Mock()], 3, 'servers')
+        fip.clean.side_effect = DeletionError([Mock(), Mock()], 4, 'fips')
+        group = ResourceGroup([server, fip])
+        group.register(Mock())
+        with self.assertRaises(DeletionError) as raised:
+            group.clean()
+        # The floating IPs are still cleaned after servers failed to delete
+        fip.clean.assert_called_once_with()
+        self.assertEqual(3, len(raised.exception.failed))
+        self.assertEqual(7, raised.exception.total)
+
+    def test_send_emails(self):
+        server = member('server')
+        fip = member('fip')
+        fip.send_emails.side_effect = UnimplementedError()
+        group = ResourceGroup([server, fip])
+        group.register(Mock())
+        group.send_emails()
+        server.send_emails.assert_called_once_with()
+
+    def test_all(self):
+        conn = Mock()
+        conn.compute.servers = Mock(side_effect=paged(SAMPLE_SERVERS))
+        conn.network.ips = Mock(side_effect=paged(FLOATING_IPS))
+        config = CloudCleanerConfig(args=["--os-auth-url", "http://no.com",
+                                          "all", "--age", "3d",
+                                          "--floating-subnet", "10.0.0.0/8"])
+        config.get_conn = Mock(return_value=conn)
+        server = Server(now=CURRENT_TIME)
+        fip = Fip()
+        group = ResourceGroup([fip, server])
+        # Registers the members too
+        group.register(config)
+        config.parse_args()
+        self.assertEqual('all', config.get_resource())
+        group.prep_deletion()
+        group.process()
+        group.clean()
+        self.assertEqual(conn.delete_server.call_args_list,
+                         [call('3'), call('4'), call('5'), call('6')])
+        self.assertEqual(conn.delete_floating_ip.call_args_list,
+                         [call('20'), call('21')])
@@ -0,0 +1,41 @@
+from unittest import TestCase
+try:
+    from unittest.mock import Mock, patch
+except ImportError:
+    from mock import Mock, patch
+from cloud_cleaner.resources.registry import ResourceRegistry, load, plugins
+from cloud_cleaner.resources.server import Server
+
+
+class TestResourceRegistry(TestCase):
+    def test_lazy(self):
+        factory = Mock(return_value="instance")
+        registry = ResourceRegistry([("item", factory, "An item")])
+        self.assertEqual(["item"], list(registry))
+        self.assertEqual("An item", registry.describe("item"))
+        self.assertEqual(0, factory.call_count)
+        self.assertEqual("instance", registry["item"])
+        self.assertEqual("instance", registry["item"])
+        self.assertEqual(1, factory.call_count)
+        with self.assertRaises(KeyError):
+            registry["missing"]  # pylint: disable=pointless-statement
+
+    def test_load(self):
+        self.assertIsInstance(load(".server", "Server")(), Server)
+
+    @patch("cloud_cleaner.resources.registry.plugins")
+    def test_plugins(self, found):
+        builtin = Mock(return_value="builtin")
+        volume = Mock(return_value="volume")
+        found.return_value = [("volume", volume), ("item", Mock())]
+        registry = ResourceRegistry([("item", builtin)], group="group")
+        # Built in types are looked up without searching the entry points
+        self.assertEqual("builtin", registry["item"])
+        self.assertEqual(0, found.call_count)
+        self.assertEqual("volume", registry["volume"])
+        self.assertEqual(["item", "volume"], list(registry))
+        self.assertIsNone(registry.describe("volume"))
+        found.assert_called_once_with("group")
+
+    def test_no_plugins(self):
+        self.assertEqual([], plugins("cloud_cleaner.no_such_group"))
@@ -1,5 +1,13 @@
+from datetime import datetime, timedelta, timezone
+from time import sleep
 from unittest import TestCase
-from cloud_cleaner.resources.resource import Resource, UnimplementedError
+try:
+    from unittest.mock import Mock, patch
+except ImportError:
+    from mock import Mock, patch
+from cloud_cleaner.config import DATE_FORMAT
+from cloud_cleaner.resources.resource import FilterPlan, Predicate, \
+    Resource, UnimplementedError, _strptime_iso, parse_timestamp
 
 
 class TestResource(TestCase):
@@ -9,3 +17,96 @@ class TestResource(TestCase):
             resource.process()
         with self.assertRaises(UnimplementedError):
             resource.clean()
+
+    def test_now_is_not_frozen(self):
+        before = datetime.now(timezone.utc)
+        resource = Resource()
+        sleep(0.01)
+        self.assertGreater(resource._now, before + timedelta(milliseconds=5))
+        fixed = datetime(2018, 2, 23, 16, tzinfo=timezone.utc)
+        self.assertEqual(fixed, Resource(now=fixed)._now)
+
+    def test_parse_timestamp(self):
+        expected = datetime(2018, 2, 23, 16, 0, 0)
+        for value in ('2018-02-23T16:00:00.000000', '2018-02-23T16:00:00',
+                      '2018-02-23T16:00:00Z', '2018-02-23T16:00:00.000000Z',
+                      '2018-02-23T17:00:00+01:00',
+                      '2018-02-23T16:00:00.000000+00:00',
+                      '2018-02-23T14:30:00-01:30'):
+            self.assertEqual(expected, parse_timestamp(value), value)
+        self.assertEqual(datetime(2018, 2, 23, 16, 0, 0, 500000),
+                         parse_timestamp('2018-02-23T16:00:00.500000'))
+
+    def test_parse_timestamp_fallback(self):
+        # The parsing of Python releases without datetime.fromisoformat
+        with patch('cloud_cleaner.resources.resource._fromisoformat',
+                   _strptime_iso):
+            self.test_parse_timestamp()
+        self.assertEqual(datetime(2018, 2, 23, 17, tzinfo=timezone(
+            timedelta(hours=1))), _strptime_iso('2018-02-23T17:00:00+01:00'))
+        with self.assertRaises(ValueError):
+            _strptime_iso('2018-02-23 16:00')
+
+    def test_cutoff(self):
+        now = datetime(2018, 2, 23, 16, tzinfo=timezone.utc)
+        resource = Resource(now=now)
+        self.assertEqual(datetime(2018, 2, 20, 16),
+                         resource._cutoff(timedelta(days=3)))
+
+    def test_cutoff_matches_strptime(self):
+        now = datetime(2018, 2, 23, 16, tzinfo=timezone.utc)
+        interval = timedelta(days=3)
+        start = datetime(2018, 2, 19)
+        records = [(start + timedelta(minutes=7 * i)).strftime(DATE_FORMAT)
+                   for i in range(1000)]
+        cutoff = Resource(now=now)._cutoff(interval)
+        # The cutoff selects what parsing each record and adding the
+        # interval to it did; benchmarks/bench_timestamps.py times the two
+        self.assertEqual(
+            [now > datetime.strptime(r, DATE_FORMAT).replace(
+                tzinfo=timezone.utc) + interval for r in records],
+            [parse_timestamp(r) < cutoff for r in records])
+
+
+class TestFilterPlan(TestCase):
+    def test_orders_by_cost_and_selectivity(self):
+        plan = FilterPlan([
+            Predicate('slow', bool, cost=5.0, selectivity=0.5),
+            Predicate('fast', bool, cost=1.0, selectivity=0.5),
+            Predicate('picky', bool, cost=2.0, selectivity=0.1),
+            Predicate('lenient', bool, cost=1.0, selectivity=1.0)])
+        self.assertEqual(['fast', 'picky', 'slow', 'lenient'], plan.order)
+
+    def test_single_short_circuiting_pass(self):
+        even = Mock(side_effect=lambda i: i % 2 == 0)
+        small = Mock(side_effect=lambda i: i < 6)
+        plan = FilterPlan([Predicate('even', even, cost=1.0),
+                           Predicate('small', small, cost=2.0)])
+        self.assertEqual([0, 2, 4], list(plan.run(range(10))))
+        self.assertEqual(10, even.call_count)
+        # Odd numbers never reach the second test
+        self.assertEqual(5, small.call_count)
+        self.assertEqual(10, plan.seen)
+        self.assertEqual({'even': 5, 'small': 2}, dict(plan.rejected))
+        self.assertEqual([('even', 5), ('small', 3)], plan.passed())
+
+    def test_times_each_predicate(self):
+        # Every test takes one tick of the clock
+        clock = Mock(side_effect=range(100))
+        plan = FilterPlan([Predicate('even', lambda i: i % 2 == 0, cost=1.0),
+                           Predicate('small', lambda i: i < 6, cost=2.0)],
+                          clock=clock)
+        self.assertEqual([0, 2, 4], list(plan.run(range(10))))
+        self.assertEqual({'even': 10.0, 'small': 5.0}, dict(plan.seconds))
+
+    def test_counts_only_when_consumed(self):
+        plan = FilterPlan([Predicate('none', lambda i: False)])
+        items = plan.run(range(3))
+        self.assertEqual(0, plan.seen)
+        self.assertEqual([], list(items))
+        self.assertEqual([('none', 0)], plan.passed())
+
+    def test_empty_plan(self):
+        plan = FilterPlan()
+        self.assertEqual([1, 2], list(plan.run([1, 2])))
+        self.assertEqual([], plan.passed())
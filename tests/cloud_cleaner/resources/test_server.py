@@ -1,72 +1,83 @@
+import smtplib
 from argparse import ArgumentParser
+from os import path
+from shutil import rmtree
+from tempfile import mkdtemp
 from unittest import TestCase
 try:
-    from unittest.mock import Mock, call
+    from unittest.mock import MagicMock, Mock, call, patch
 except ImportError:
-    from mock import Mock, call
-from datetime import datetime
+    from mock import MagicMock, Mock, call, patch
+from datetime import datetime, timedelta, timezone
 from munch import munchify
-from pytz import utc
 from cloud_cleaner.config import CloudCleanerConfig, DATE_FORMAT
+from cloud_cleaner.executor import DeletionError
 from cloud_cleaner.resources import Server
+from tests.fakes import FakeSmtpServer, paged
 
 
-CURRENT_TIME = datetime.strptime('2018-02-23T16:00:00Z', DATE_FORMAT)
-CURRENT_TIME = CURRENT_TIME.replace(tzinfo=utc)
+CURRENT_TIME = datetime.strptime('2018-02-23T16:00:00.000000', DATE_FORMAT)
+CURRENT_TIME = CURRENT_TIME.replace(tzinfo=timezone.utc)
 SAMPLE_USER = munchify({'email':  None, 'name': 'test-user'})
 SAMPLE_SERVERS = [
     # Server still being built out by OpenStack, should remain
     munchify({
         'id':  '1',
         'name': 'test-server-1',
+        'user_id': 'test-user',
         'power_state': 0,
         'status': 'BUILD',
-        'created': '2018-02-23T16:00:00Z',
+        'launched_at': '2018-02-23T16:00:00.000000',
         'updated': '2018-02-23T16:05:00Z'
     }),
     # A 3 day old server that should not be deleted (exactly 3d)
     munchify({
         'id': '2',
         'name': 'test-server-2',
+        'user_id': 'test-user',
         'power_state': 1,
         'status': 'ACTIVE',
-        'created': '2018-02-20T16:00:00Z',
+        'launched_at': '2018-02-20T16:00:00.000000',
         'updated': '2018-02-28T00:00:00Z'
     }),
     # A much older server that definitely should be deleted
     munchify({
         'id': '3',
         'name': 'test-server-3',
+        'user_id': 'test-user',
         'power_state': 0,
         'status': 'ACTIVE',
-        'created': '2017-12-31T12:00:00Z',
+        'launched_at': '2017-12-31T12:00:00.000000',
         'updated': '2018-01-31T12:00:00Z'
     }),
     # An older, errored server that should be deleted in some cases
     munchify({
         'id': '4',
         'name': 'server-pet-4',
+        'user_id': 'user-a',
         'power_state': 1,
         'status': 'ERROR',
-        'created': '2018-01-31T08:00:00Z',
+        'launched_at': '2018-01-31T08:00:00.000000',
         'updated': '2018-02-23T12:00:00Z'
     }),
     # A new server that should be deleted (1 second over the 3d threshhold)
     munchify({
         'id': '5',
         'name': 'derp-server-5',
+        'user_id': 'user-b',
         'power_state': 0,
         'status': 'ACTIVE',
-        'created': '2018-02-20T15:59:59Z',
+        'launched_at': '2018-02-20T15:59:59.000000',
         'updated': '2018-02-22T04:17:42Z'
     }),
     # A pet server that should remain
     munchify({
         'id': '6',
         'name': 'pet-server-6',
+        'user_id': 'user-a',
         'power_state': 1,
         'status': 'ACTIVE',
-        'created': '2016-01-01T01:00:00Z',
+        'launched_at': '2016-01-01T01:00:00.000000',
         'updated': '2018-01-01T02:07:34Z',
     })
 ]
@@ -75,43 +86,46 @@ SAMPLE_SERVERS = [
 class ServerTest(TestCase):
     def __test_with_call_order(self, args, calls):
         conn = Mock()
-        conn.list_servers = Mock(return_value=SAMPLE_SERVERS)
+        conn.compute.servers = Mock(side_effect=paged(SAMPLE_SERVERS))
         conn.delete_server = Mock()
         config = CloudCleanerConfig(args=args)
         config.get_conn = Mock(return_value=conn)
-        calls = [call(c) for c in calls]
+        if calls is not None:
+            calls = [call(c) for c in calls]
         server = Server(now=CURRENT_TIME)
         server.register(config)
         config.parse_args()
         server.prep_deletion()
         server.process()
         server.clean()
-        self.assertEqual(conn.delete_server.call_args_list, calls)
+        if calls is not None:
+            self.assertEqual(conn.delete_server.call_args_list, calls)
+        return conn
 
     def test_email_with_calls(self):
         conn = Mock()
-        conn.list_servers = Mock(return_value=SAMPLE_SERVERS)
+        conn.compute.servers = Mock(side_effect=paged(SAMPLE_SERVERS))
         conn.get_user_by_id = Mock(return_value=SAMPLE_USER)
         conn.delete_server = Mock()
         config = CloudCleanerConfig(args=["--os-auth-url", "http://no.com",
                                           "server", "--age", "4d",
                                           "--skip-name", "test-.*"])
         config.get_conn = Mock(return_value=conn)
-        calls = ['4', '5']
+        calls = ['4', '5', '6']
         calls = [call(c) for c in calls]
         server = Server(now=CURRENT_TIME)
-        server.send_emails() = Mock()
         server.register(config)
         config.parse_args()
         server.process()
         server.send_emails()
+        # Servers 4 and 6 belong to the same user, who is looked up once
         self.assertEqual(conn.get_user_by_id.call_count, 2)
         server.clean()
         self.assertEqual(conn.delete_server.call_args_list, calls)
 
     def test_email_with_delete(self):
         conn = Mock()
-        conn.list_servers = Mock(return_value=SAMPLE_SERVERS)
+        conn.compute.servers = Mock(side_effect=paged(SAMPLE_SERVERS))
         conn.get_user_by_id = Mock(return_value=SAMPLE_USER)
         conn.delete_server = Mock()
         config = CloudCleanerConfig(args=["--os-auth-url", "http://no.com",
@@ -119,7 +133,6 @@ class ServerTest(TestCase):
                                           "--skip-name", "test-.*"])
         config.get_conn = Mock(return_value=conn)
         server = Server(now=CURRENT_TIME)
-        server.send_emails() = Mock()
         server.register(config)
         config.parse_args()
         server.prep_deletion()
@@ -127,11 +140,324 @@ class ServerTest(TestCase):
         server.clean()
         server.process()
         server.send_emails()
-        # Only server 4 should be deleted. As in the test above, servers 4 and
-        # 5 fit the criteria, but this time around server 5 should be deleted,
-        # and thus not considered for an email warning, whereas for server 4
-        # nothing should change. 
+        # Servers 4 and 6 are past the full age and are deleted. Server 5 is
+        # past half of the age, so it is the only one left to be warned. The
+        # warning pass is served from the same listing as the deletion pass.
         self.assertEqual(conn.get_user_by_id.call_count, 1)
+        listings = [c for c in conn.compute.servers.call_args_list
+                    if 'marker' not in c[1]]
+        self.assertEqual(1, len(listings))
+
+    def test_email_digest(self):
+        users = {
+            'user-a': munchify({'email': 'a@example.com', 'name': 'A'}),
+            'user-b': munchify({'email': 'b@example.com', 'name': 'B'}),
+        }
+        conn = Mock()
+        conn.compute.servers = Mock(side_effect=paged(SAMPLE_SERVERS))
+        conn.get_user_by_id = Mock(side_effect=lambda i, _: users[i])
+        with FakeSmtpServer(refuse=['b@example.com']) as smtp:
+            config = CloudCleanerConfig(args=[
+                "--os-auth-url", "http://no.com", "--email",
+                "--sender", "cleaner@example.com", "--smtpN", "127.0.0.1",
+                "--smtpP", str(smtp.port), "server", "--age", "4d",
+                "--skip-name", "test-.*"])
+            config.get_conn = Mock(return_value=conn)
+            server = Server(now=CURRENT_TIME)
+            server.register(config)
+            config.parse_args()
+            server.process()
+            server.send_emails()
+        # One session, one message per user and the refused user skipped
+        self.assertEqual(1, smtp.connections)
+        self.assertEqual(1, len(smtp.messages))
+        sender, receivers, message = smtp.messages[0]
+        self.assertEqual('cleaner@example.com', sender)
+        self.assertEqual(['a@example.com'], receivers)
+        self.assertIn('server-pet-4', message)
+        self.assertIn('pet-server-6', message)
+        self.assertNotIn('derp-server-5', message)
+
+    def test_email_ledger(self):
+        users = {
+            'user-a': munchify({'email': 'a@example.com', 'name': 'A'}),
+            'user-b': munchify({'email': 'b@example.com', 'name': 'B'}),
+        }
+        directory = mkdtemp()
+        self.addCleanup(rmtree, directory)
+        ledger = path.join(directory, 'ledger.db')
+
+        def _run(now, session=None):
+            conn = Mock()
+            conn.compute.servers = Mock(side_effect=paged(SAMPLE_SERVERS))
+            conn.get_user_by_id = Mock(side_effect=lambda i, _: users[i])
+            with FakeSmtpServer() as smtp:
+                config = CloudCleanerConfig(args=[
+                    "--os-auth-url", "http://no.com", "--email",
+                    "--ledger", ledger, "--smtpN", "127.0.0.1", "--smtpP",
+                    str(smtp.port), "server", "--age", "4d", "--skip-name",
+                    "test-.*"])
+                config.get_conn = Mock(return_value=conn)
+                server = Server(now=now)
+                server.register(config)
+                config.parse_args()
+                server.process()
+                try:
+                    if session is None:
+                        server.send_emails()
+                    else:
+                        with patch('smtplib.SMTP', return_value=session):
+                            server.send_emails()
+                finally:
+                    config.close()
+            return conn, smtp
+        # The session drops after the first of the two messages
+        session = MagicMock()
+        session.__enter__.return_value = session
+        session.sendmail.side_effect = [
+            {}, smtplib.SMTPServerDisconnected("dropped")]
+        with self.assertRaises(smtplib.SMTPServerDisconnected):
+            _run(CURRENT_TIME - timedelta(days=1), session)
+        # A day earlier server 5 is only past half of the age. The message
+        # sent before the session dropped is not sent again
+        conn, smtp = _run(CURRENT_TIME - timedelta(days=1))
+        self.assertEqual(1, len(smtp.messages))
+        self.assertEqual([session.sendmail.call_args_list[1][0][1]],
+                         smtp.messages[0][1])
+        # Nothing has changed, so nobody is warned again
+        conn, smtp = _run(CURRENT_TIME - timedelta(days=1))
+        self.assertEqual(0, len(smtp.messages))
+        self.assertEqual(0, conn.get_user_by_id.call_count)
+        # Server 5 has now escalated to a final warning
+        conn, smtp = _run(CURRENT_TIME)
+        self.assertEqual(1, len(smtp.messages))
+        self.assertEqual(['b@example.com'], smtp.messages[0][1])
+        self.assertIn('derp-server-5 (final warning)', smtp.messages[0][2])
+
+    def test_no_email_no_session(self):
+        conn = Mock()
+        conn.compute.servers = Mock(side_effect=paged(SAMPLE_SERVERS))
+        conn.get_user_by_id = Mock(return_value=SAMPLE_USER)
+        config = CloudCleanerConfig(args=["--os-auth-url", "http://no.com",
+                                          "--smtpN", "127.0.0.1", "--smtpP",
+                                          "1", "server", "--age", "4d"])
+        config.get_conn = Mock(return_value=conn)
+        server = Server(now=CURRENT_TIME)
+        server.register(config)
+        config.parse_args()
+        server.process()
+        # Nothing listens on port 1, so this would fail if a session opened
+        server.send_emails()
+
+    def test_parallel_delete_with_failure(self):
+        conn = Mock()
+        conn.compute.servers = Mock(side_effect=paged(SAMPLE_SERVERS))
+        conn.get_user_by_id = Mock(return_value=SAMPLE_USER)
+        conn.delete_server = Mock(side_effect=lambda i: i == '4' and 1 / 0)
+        config = CloudCleanerConfig(args=["--os-auth-url", "http://no.com",
+                                          "--concurrency", "4",
+                                          "server", "--age", "4d",
+                                          "--skip-name", "test-.*"])
+        config.get_conn = Mock(return_value=conn)
+        server = Server(now=CURRENT_TIME)
+        server.register(config)
+        config.parse_args()
+        server.prep_deletion()
+        server.process()
+        with self.assertRaises(DeletionError) as raised:
+            server.clean()
+        self.assertEqual(['4'], [result.item.id
+                                 for result in raised.exception.failed])
+        self.assertEqual(sorted(conn.delete_server.call_args_list),
+                         [call('4'), call('6')])
+        server.process()
+        server.send_emails()
+        # Server 4 failed to delete, so it is warned along with server 5
+        self.assertEqual(conn.get_user_by_id.call_count, 2)
+
+    def __query_for(self, args):
+        conn = Mock()
+        conn.compute.servers = Mock(side_effect=paged(SAMPLE_SERVERS))
+        config = CloudCleanerConfig(args=args)
+        config.get_conn = Mock(return_value=conn)
+        server = Server(now=CURRENT_TIME)
+        server.register(config)
+        config.parse_args()
+        server.process()
+        query = conn.compute.servers.call_args_list[0][1]
+        self.assertTrue(query.pop('details'))
+        self.assertFalse(query.pop('paginated'))
+        self.assertEqual(1000, query.pop('limit'))
+        return query
+
+    def test_name_pushed_down(self):
+        query = self.__query_for(["--os-auth-url", "http://no.com", "server",
+                                  "--name", "test-.*", "--skip-name",
+                                  ".*-2"])
+        self.assertEqual({'name': '^(test-.*)'}, query)
+
+    def test_complex_name_not_pushed_down(self):
+        query = self.__query_for(["--os-auth-url", "http://no.com", "server",
+                                  "--name", r"test-\d+", "--age", "3d"])
+        self.assertEqual({}, query)
+
+    def test_age_pushed_down(self):
+        query = self.__query_for(["--os-auth-url", "http://no.com", "server",
+                                  "--age", "4d", "--server-side-age"])
+        # Half of the age, so that the warning pass is also covered
+        self.assertEqual({'changes_before': '2018-02-21T16:00:00Z'}, query)
+
+    def test_deleted_servers_ignored(self):
+        deleted = munchify({'id': '7', 'name': 'test-server-7',
+                            'user_id': 'test-user', 'status': 'DELETED',
+                            'launched_at': '2017-01-01T00:00:00.000000'})
+        conn = Mock()
+        conn.compute.servers = Mock(
+            side_effect=paged(SAMPLE_SERVERS + [deleted]))
+        conn.delete_server = Mock()
+        config = CloudCleanerConfig(args=["--os-auth-url", "http://no.com",
+                                          "server", "--age", "3d",
+                                          "--server-side-age"])
+        config.get_conn = Mock(return_value=conn)
+        server = Server(now=CURRENT_TIME)
+        server.register(config)
+        config.parse_args()
+        server.prep_deletion()
+        server.process()
+        server.clean()
+        self.assertEqual(conn.delete_server.call_args_list,
+                         [call('3'), call('4'), call('5'), call('6')])
+
+    def test_small_pages(self):
+        args = ["--os-auth-url", "http://no.com", "--page-size", "2",
+                "server", "--age", "3d"]
+        conn = self.__test_with_call_order(args, ['3', '4', '5', '6'])
+        self.assertEqual(4, conn.compute.servers.call_count)
+
+    def test_only_candidates_kept(self):
+        conn = Mock()
+        conn.compute.servers = Mock(side_effect=paged(SAMPLE_SERVERS))
+        config = CloudCleanerConfig(args=["--os-auth-url", "http://no.com",
+                                          "server", "--age", "4d"])
+        config.get_conn = Mock(return_value=conn)
+        server = Server(now=CURRENT_TIME)
+        server.register(config)
+        config.parse_args()
+        server.process()
+        kept = config.get_inventory().stream('servers', None)
+        self.assertEqual(['2', '3', '4', '5', '6'], [s.id for s in kept])
+
+    def test_unlaunched_server_not_deleted(self):
+        building = munchify({'id': '7', 'name': 'test-server-7',
+                             'user_id': 'test-user', 'status': 'BUILD',
+                             'launched_at': None})
+        conn = Mock()
+        conn.compute.servers = Mock(
+            side_effect=paged(SAMPLE_SERVERS + [building]))
+        conn.delete_server = Mock()
+        config = CloudCleanerConfig(args=["--os-auth-url", "http://no.com",
+                                          "server", "--age", "3d"])
+        config.get_conn = Mock(return_value=conn)
+        server = Server(now=CURRENT_TIME)
+        server.register(config)
+        config.parse_args()
+        server.prep_deletion()
+        server.process()
+        server.clean()
+        self.assertEqual(conn.delete_server.call_args_list,
+                         [call('3'), call('4'), call('5'), call('6')])
+
+    def test_watch_polls_changes(self):
+        listing = paged(SAMPLE_SERVERS)
+        changes = paged([
+            munchify(dict(SAMPLE_SERVERS[1], status='DELETED')),
+            munchify(dict(SAMPLE_SERVERS[5], name='old-server-6')),
+            munchify({'id': '8', 'name': 'test-server-8',
+                      'user_id': 'test-user', 'status': 'ACTIVE',
+                      'launched_at': '2017-06-01T00:00:00.000000'})])
+
+        def _servers(**params):
+            if 'changes_since' in params:
+                return changes(**params)
+            return listing(**params)
+        conn = Mock()
+        conn.compute.servers = Mock(side_effect=_servers)
+        conn.delete_server = Mock()
+        config = CloudCleanerConfig(args=["--os-auth-url", "http://no.com",
+                                          "--watch", "60", "server",
+                                          "--age", "3d", "--skip-name",
+                                          "pet-", "--server-side-age"])
+        config.get_conn = Mock(return_value=conn)
+        server = Server(now=CURRENT_TIME)
+        server.register(config)
+        config.parse_args()
+        server.prep_deletion()
+        server.process()
+        server.clean()
+        server.poll()
+        server.prep_deletion()
+        server.process()
+        server.clean()
+        self.assertEqual(conn.delete_server.call_args_list,
+                         [call('3'), call('4'), call('5'), call('6'),
+                          call('8')])
+        queries = [c[1] for c in conn.compute.servers.call_args_list]
+        # Only the first listing is full, and it cannot be limited by age
+        self.assertNotIn('changes_before', queries[0])
+        self.assertEqual(['2018-02-23T15:59:00Z'],
+                         [q['changes_since'] for q in queries
+                          if 'changes_since' in q and 'marker' not in q])
+        self.assertEqual(1, len([q for q in queries
+                                 if 'marker' not in q and
+                                 'changes_since' not in q]))
+        kept = config.get_inventory().stream('servers', None)
+        self.assertEqual(['1'], [s.id for s in kept])
+
+    def test_plan_and_apply(self):
+        conn = Mock()
+        conn.compute.servers = Mock(side_effect=paged(SAMPLE_SERVERS))
+        conn.delete_server = Mock()
+        config = CloudCleanerConfig(args=["--os-auth-url", "http://no.com",
+                                          "server", "--age", "3d"])
+        config.get_conn = Mock(return_value=conn)
+        server = Server(now=CURRENT_TIME)
+        server.register(config)
+        config.parse_args()
+        server.prep_deletion()
+        server.process()
+        entries = server.plan_entries()
+        self.assertEqual(['3', '4', '5', '6'], [e['id'] for e in entries])
+        self.assertEqual({'id': '4', 'name': 'server-pet-4',
+                          'user_id': 'user-a', 'status': 'ERROR',
+                          'launched_at': '2018-01-31T08:00:00.000000'},
+                         entries[1])
+        # Server 5 was renamed after the plan was made
+        conn.compute.servers = Mock(side_effect=paged(
+            [munchify(dict(SAMPLE_SERVERS[4], name='keep-5'))]))
+        config = CloudCleanerConfig(args=["--os-auth-url", "http://no.com"])
+        config.get_conn = Mock(return_value=conn)
+        server = Server(now=CURRENT_TIME)
+        server.register(config)
+        config.parse_args()
+        server.apply(entries, datetime(2018, 2, 23, 16))
+        server.clean()
+        self.assertEqual(conn.delete_server.call_args_list,
+                         [call('3'), call('4'), call('6')])
+        query = conn.compute.servers.call_args_list[0][1]
+        self.assertEqual('2018-02-23T15:59:00Z', query['changes_since'])
+
+    def test_shards(self):
+        deleted = []
+        for index in range(3):
+            conn = self.__test_with_call_order(
+                ["--os-auth-url", "http://no.com", "--shard",
+                 "%d/3" % index, "server", "--age", "3d"], None)
+            deleted.append([c[0][0] for c in
+                            conn.delete_server.call_args_list])
+        # Every server is deleted by exactly one of the shards
+        self.assertEqual(['3', '4', '5', '6'],
+                         sorted(sum(deleted, [])))
+        self.assertTrue(all(len(shard) < 4 for shard in deleted))
 
     def test_init_with_name(self):  # pylint: disable=no-self-use
         parser = ArgumentParser()
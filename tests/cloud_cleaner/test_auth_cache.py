@@ -0,0 +1,71 @@
+import json
+import os
+import stat
+from datetime import datetime, timedelta
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+from keystoneauth1.identity import v3
+from cloud_cleaner.auth_cache import AuthCache
+
+
+def plugin(username="user"):
+    return v3.Password(auth_url="http://no.com/v3", username=username,
+                       password="secret", project_name="project",
+                       user_domain_id="default",
+                       project_domain_id="default")
+
+
+def authenticated(expires_in, username="user"):
+    auth = plugin(username)
+    expires = datetime.utcnow() + timedelta(seconds=expires_in)
+    auth.set_auth_state(json.dumps({"auth_token": "token-%s" % username,
+                                    "body": {"token": {
+                                        "methods": ["password"],
+                                        "expires_at": expires.isoformat() +
+                                        "Z",
+                                        "catalog": []}}}))
+    return auth
+
+
+class TestAuthCache(TestCase):
+    def setUp(self):
+        self.tmp = mkdtemp()
+        self.path = os.path.join(self.tmp, "auth.json")
+
+    def tearDown(self):
+        rmtree(self.tmp)
+
+    def test_save_and_load(self):
+        AuthCache(self.path).save(authenticated(3600))
+        AuthCache(self.path).save(authenticated(3600, "other"))
+        self.assertEqual(stat.S_IRUSR | stat.S_IWUSR,
+                         stat.S_IMODE(os.stat(self.path).st_mode))
+        self.assertEqual(["auth.json"], os.listdir(self.tmp))
+        auth = plugin()
+        self.assertTrue(AuthCache(self.path).load(auth))
+        self.assertEqual("token-user", auth.auth_ref.auth_token)
+        # Each set of credentials has a token of its own
+        self.assertFalse(AuthCache(self.path).load(plugin("nobody")))
+
+    def test_expiring(self):
+        AuthCache(self.path).save(authenticated(60))
+        auth = plugin()
+        self.assertFalse(AuthCache(self.path).load(auth))
+        self.assertIsNone(auth.auth_ref)
+        self.assertTrue(AuthCache(self.path, margin=30).load(plugin()))
+
+    def test_open_to_others(self):
+        AuthCache(self.path).save(authenticated(3600))
+        os.chmod(self.path, 0o644)
+        self.assertFalse(AuthCache(self.path).load(plugin()))
+
+    def test_missing_or_corrupt(self):
+        self.assertFalse(AuthCache(self.path).load(plugin()))
+        with open(self.path, "w") as cache_file:
+            cache_file.write("{not json")
+        os.chmod(self.path, 0o600)
+        self.assertFalse(AuthCache(self.path).load(plugin()))
+        # A corrupt file is replaced by the next save
+        AuthCache(self.path).save(authenticated(3600))
+        self.assertTrue(AuthCache(self.path).load(plugin()))
@@ -1,8 +1,14 @@
+import subprocess
+import sys
 from unittest import TestCase
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
 from argparse import ArgumentParser
 from logging import getLogger, WARNING, INFO, DEBUG
 from openstack import OpenStackCloud
-from cloud_cleaner.config import CloudCleanerConfig
+from cloud_cleaner.config import CloudCleanerConfig, help_strings
 from cloud_cleaner.resources import ALL_RESOURCES
 
 
@@ -43,6 +49,36 @@ class TestConfig(TestCase):
         conn = config.get_conn()
         self.assertIsInstance(conn, OpenStackCloud)
 
+    def test_connects_when_needed(self):
+        args = ["--os-auth-url", "http://no.com", "server"]
+        config = CloudCleanerConfig(args=args)
+        ALL_RESOURCES["server"].register(config)
+        with patch("openstack.connection.from_config") as from_config:
+            config.parse_args()
+            self.assertEqual(0, from_config.call_count)
+            conn = config.get_conn()
+            self.assertIs(conn, config.get_conn())
+            self.assertIsNotNone(config.get_cloud())
+        self.assertEqual(1, from_config.call_count)
+
+    def test_import_is_lazy(self):
+        code = ("import sys\n"
+                "from cloud_cleaner.bin.entrypoint import cloud_clean\n"
+                "try:\n"
+                "    cloud_clean(['--help'])\n"
+                "except SystemExit:\n"
+                "    pass\n"
+                "print('loaded: ' + ' '.join(sorted(\n"
+                "    m for m in sys.modules\n"
+                "    if m.split('.')[0] in ('openstack', 'pytz', 'smtplib',\n"
+                "                           'munch', 'sqlite3') or\n"
+                "    m == 'concurrent.futures.process'\n"
+                ")))\n")
+        output = subprocess.check_output([sys.executable, "-c", code])
+        # Nothing that only a connection, an email, a ledger, a replay or
+        # --target needs is imported
+        self.assertEqual(b"loaded: ", output.split(b"\n")[-2])
+
     def test_verbose_two(self):
         args = ["--os-auth-url", "http://no.com", "-vv", "server"]
         config = CloudCleanerConfig(args=args)
@@ -50,3 +86,50 @@ class TestConfig(TestCase):
         config.parse_args()
         log = getLogger("cloud_cleaner")
         self.assertEqual(log.getEffectiveLevel(), DEBUG)
+
+    def test_targets(self):
+        args = ["--target", "east", "-v", "--target=west:RegionTwo",
+                "--ledger", "ledger.db", "--journal=journal", "server",
+                "--age", "3d"]
+        config = CloudCleanerConfig(args=args)
+        ALL_RESOURCES["server"].register(config)
+        config.parse_args()
+        self.assertEqual([("east", None), ("west", "RegionTwo")],
+                         config.get_targets())
+        # No connection is made for the targets themselves
+        self.assertIsNone(config.get_conn())
+        self.assertEqual(["--os-cloud", "west", "--os-region-name",
+                          "RegionTwo", "-v", "--ledger",
+                          "ledger.db.west-RegionTwo", "--journal",
+                          "journal.west-RegionTwo", "server", "--age", "3d"],
+                         config.target_args(("west", "RegionTwo")))
+        self.assertEqual("east", config.target_args(("east", None))[1])
+
+    def test_no_abbreviations(self):
+        config = CloudCleanerConfig(args=["--target", "east", "--jour",
+                                          "journal", "server"])
+        ALL_RESOURCES["server"].register(config)
+        # Every target would share the journal
+        with self.assertRaises(SystemExit):
+            config.parse_args()
+        self.assertIn("--auth-cache", help_strings["target"])
+
+    def test_targets_with_cloud(self):
+        for args in (["--os-cloud", "default"],
+                     ["--os-region-name=RegionTwo"]):
+            config = CloudCleanerConfig(args=args + ["--target", "west",
+                                                     "server"])
+            ALL_RESOURCES["server"].register(config)
+            # Would override the cloud or region of every target
+            with self.assertRaises(SystemExit):
+                config.parse_args()
+
+    def test_watch_runs_once(self):
+        for args in (["--apply", "plan.json"],
+                     ["--journal", "journal", "--resume"]):
+            config = CloudCleanerConfig(args=["--watch", "60"] + args +
+                                        ["server"])
+            ALL_RESOURCES["server"].register(config)
+            # Would run once and silently ignore --watch
+            with self.assertRaises(SystemExit):
+                config.parse_args()
@@ -0,0 +1,90 @@
+from threading import Lock
+from time import sleep
+from unittest import TestCase
+from munch import munchify
+from cloud_cleaner.executor import DeletionExecutor
+from cloud_cleaner.metrics import Metrics
+
+
+ITEMS = [munchify({'id': str(i)}) for i in range(20)]
+
+
+class InFlightCounter(object):  # pylint: disable=R0205
+    def __init__(self, fail=()):
+        self.__lock = Lock()
+        self.__current = 0
+        self.peak = 0
+        self.calls = []
+        self.__fail = fail
+
+    def __call__(self, item_id):
+        with self.__lock:
+            self.__current += 1
+            self.peak = max(self.peak, self.__current)
+            self.calls.append(item_id)
+        sleep(0.005)
+        with self.__lock:
+            self.__current -= 1
+        if item_id in self.__fail:
+            raise ValueError(item_id)
+
+
+class TestDeletionExecutor(TestCase):
+    def test_sequential_order(self):
+        delete = InFlightCounter()
+        results = DeletionExecutor().run('compute', delete, ITEMS)
+        self.assertEqual([i.id for i in ITEMS], delete.calls)
+        self.assertEqual(ITEMS, [r.item for r in results])
+        self.assertEqual(1, delete.peak)
+
+    def test_parallel_results_in_order(self):
+        delete = InFlightCounter()
+        executor = DeletionExecutor(concurrency=8)
+        results = executor.run('compute', delete, ITEMS)
+        self.assertEqual(ITEMS, [r.item for r in results])
+        self.assertEqual(sorted(i.id for i in ITEMS), sorted(delete.calls))
+        self.assertTrue(all(r.deleted for r in results))
+
+    def test_in_flight_cap(self):
+        delete = InFlightCounter()
+        executor = DeletionExecutor(concurrency=8, in_flight=3)
+        executor.run('compute', delete, ITEMS)
+        self.assertLessEqual(delete.peak, 3)
+
+    def test_errors_reported_per_item(self):
+        delete = InFlightCounter(fail=('3', '7'))
+        results = DeletionExecutor(concurrency=4).run('network', delete,
+                                                      ITEMS)
+        failed = [r.item.id for r in results if not r.deleted]
+        self.assertEqual(['3', '7'], failed)
+        self.assertIsInstance(results[3].error, ValueError)
+
+    def test_on_result(self):
+        delete = InFlightCounter(fail=('5',))
+        seen = []
+        lock = Lock()
+
+        def _on_result(result):
+            with lock:
+                seen.append((result.item.id, result.deleted))
+        DeletionExecutor(concurrency=4).run('compute', delete, ITEMS,
+                                            on_result=_on_result)
+        self.assertEqual(sorted((i.id, i.id != '5') for i in ITEMS),
+                         sorted(seen))
+
+    def test_metrics(self):
+        metrics = Metrics()
+        delete = InFlightCounter(fail=('5',))
+        DeletionExecutor(concurrency=4, metrics=metrics).run(
+            'compute', delete, ITEMS)
+        summary = metrics.summary()
+        self.assertEqual(
+            [({'endpoint': 'compute', 'outcome': 'deleted'}, 19),
+             ({'endpoint': 'compute', 'outcome': 'failed'}, 1)],
+            [(c['labels'], c['value']) for c in summary['counters']])
+        histogram, = summary['histograms']
+        self.assertEqual('delete_seconds', histogram['name'])
+        self.assertEqual(20, histogram['count'])
+
+    def test_empty(self):
+        self.assertEqual([], DeletionExecutor().run('compute', None, []))
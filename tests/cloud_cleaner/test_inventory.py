@@ -0,0 +1,86 @@
+from unittest import TestCase
+try:
+    from unittest.mock import Mock
+except ImportError:
+    from mock import Mock
+from os import path
+from shutil import rmtree
+from tempfile import mkdtemp
+from munch import munchify
+from cloud_cleaner.inventory import Inventory
+from cloud_cleaner.inventory_file import InventoryWriter
+
+
+ITEMS = [munchify({'id': str(i)}) for i in range(4)]
+
+
+def retained(inventory, pages):
+    return list(inventory.retain('items', inventory.stream('items', pages)))
+
+
+class TestInventory(TestCase):
+    def test_discard(self):
+        pages = Mock(return_value=[ITEMS])
+        inventory = Inventory()
+        inventory.discard('items', ['1'])
+        retained(inventory, pages)
+        inventory.discard('items', ['1', '3'])
+        self.assertEqual(['0', '2'],
+                         [i.id for i in retained(inventory, pages)])
+        self.assertEqual(1, pages.call_count)
+
+    def test_refresh(self):
+        pages = Mock(return_value=[ITEMS])
+        inventory = Inventory()
+        retained(inventory, pages)
+        inventory.refresh('items')
+        retained(inventory, pages)
+        inventory.refresh()
+        retained(inventory, pages)
+        self.assertEqual(3, pages.call_count)
+
+    def test_stream_and_retain(self):
+        pages = Mock(return_value=[ITEMS[:2], ITEMS[2:]])
+        inventory = Inventory()
+        kept = inventory.retain('items', (i for i in inventory.stream(
+            'items', pages) if i.id != '2'))
+        self.assertEqual(['0', '1', '3'], [i.id for i in kept])
+        # Later passes are served from what was retained
+        self.assertEqual(['0', '1', '3'],
+                         [i.id for i in inventory.stream('items', pages)])
+        self.assertEqual(1, pages.call_count)
+
+    def test_stream_without_retain(self):
+        pages = Mock(return_value=[ITEMS])
+        inventory = Inventory()
+        list(inventory.stream('items', pages))
+        list(inventory.stream('items', pages))
+        self.assertEqual(2, pages.call_count)
+
+    def test_merge(self):
+        pages = Mock(return_value=[ITEMS])
+        inventory = Inventory()
+        changed = munchify({'id': '1', 'name': 'changed'})
+        # Nothing is stored to merge into yet
+        inventory.merge('items', ['1'], [changed])
+        self.assertNotIn('items', inventory)
+        retained(inventory, pages)
+        self.assertIn('items', inventory)
+        inventory.merge('items', ['1', '2', '5'], [changed])
+        merged = retained(inventory, pages)
+        self.assertEqual(['0', '3', '1'], [i.id for i in merged])
+        self.assertEqual('changed', merged[-1].name)
+        self.assertEqual(1, pages.call_count)
+
+    def test_dump_and_source(self):
+        workdir = mkdtemp()
+        self.addCleanup(rmtree, workdir)
+        dump = path.join(workdir, 'inventory.ndjson')
+        inventory = Inventory(dump=InventoryWriter(dump))
+        listed = list(inventory.stream('items',
+                                       lambda: [ITEMS[:2], ITEMS[2:]]))
+        self.assertEqual(ITEMS, listed)
+        pages = Mock()
+        replayed = Inventory(source=dump).stream('items', pages)
+        self.assertEqual(ITEMS, list(replayed))
+        self.assertEqual(0, pages.call_count)
@@ -0,0 +1,48 @@
+import json
+from os import path
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+from munch import munchify
+from openstack.compute.v2.server import Server
+from cloud_cleaner.inventory_file import InventoryWriter, read_inventory
+
+
+class TestInventoryFile(TestCase):
+    def setUp(self):
+        self.tmp = mkdtemp()
+        self.path = path.join(self.tmp, "inventory.ndjson")
+
+    def tearDown(self):
+        rmtree(self.tmp)
+
+    def test_round_trip(self):
+        writer = InventoryWriter(self.path)
+        writer.write("servers", [Server(id="1", name="a", status="ACTIVE")])
+        writer.write("floating_ips", [munchify({"id": "2", "port_id": None})])
+        writer.write("servers", [munchify({"id": "3", "name": "b"})])
+        servers = list(read_inventory(self.path, "servers"))
+        self.assertEqual(["1", "3"], [server.id for server in servers])
+        # Fields are read as attributes or as keys
+        self.assertEqual("a", servers[0].name)
+        self.assertEqual("ACTIVE", servers[0]["status"])
+        fip, = read_inventory(self.path, "floating_ips")
+        self.assertIsNone(fip.port_id)
+        self.assertEqual([], list(read_inventory(self.path, "volumes")))
+
+    def test_raw_listing(self):
+        InventoryWriter(self.path).write("servers", [Server(id="1")])
+        with open(self.path) as dump:
+            text = dump.readline()
+        # The collection is matched on the start of the line
+        self.assertTrue(text.startswith('{"collection": "servers", '))
+        line = json.loads(text)
+        self.assertEqual("servers", line["collection"])
+        self.assertEqual("1", line["item"]["id"])
+        self.assertIn("launched_at", line["item"])
+
+    def test_emptied(self):
+        InventoryWriter(self.path).write("servers", [{"id": "1"}])
+        InventoryWriter(self.path).write("servers", [{"id": "2"}])
+        self.assertEqual(["2"], [server.id for server
+                                 in read_inventory(self.path, "servers")])
@@ -0,0 +1,78 @@
+from os import path
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+from munch import munchify
+from cloud_cleaner.executor import DeletionResult
+from cloud_cleaner.journal import DeletionJournal
+
+
+ENTRIES = [{'id': str(i), 'name': 'server-%d' % i} for i in range(4)]
+
+
+def result(item_id, error=None):
+    return DeletionResult(munchify({'id': item_id}), error)
+
+
+class TestDeletionJournal(TestCase):
+    def setUp(self):
+        self.__dir = mkdtemp()
+        self.__path = path.join(self.__dir, 'journal')
+
+    def tearDown(self):
+        rmtree(self.__dir)
+
+    def test_outstanding(self):
+        journal = DeletionJournal(self.__path)
+        journal.start()
+        journal.intend('server', ENTRIES)
+        journal.record('server', result('0'))
+        journal.record('server', result('2', ValueError('busy')))
+        journal.close()
+        # A new journal object sees what the interrupted run left behind
+        outstanding = DeletionJournal(self.__path).outstanding()
+        self.assertEqual(['server'], list(outstanding))
+        self.assertEqual(['1', '2', '3'],
+                         [e['id'] for e in outstanding['server']])
+        self.assertEqual('server-1', outstanding['server'][0]['name'])
+
+    def test_start_clears_earlier_runs(self):
+        journal = DeletionJournal(self.__path)
+        journal.start()
+        journal.intend('server', ENTRIES)
+        journal.start()
+        journal.intend('fip', [{'id': 'f'}])
+        self.assertEqual({'fip': [{'id': 'f'}]},
+                         dict(journal.outstanding()))
+        journal.record('fip', result('f'))
+        self.assertEqual({}, dict(journal.outstanding()))
+        journal.close()
+
+    def test_torn_last_line(self):
+        journal = DeletionJournal(self.__path)
+        journal.intend('server', ENTRIES[:2])
+        journal.close()
+        with open(self.__path, 'a') as journal_file:
+            journal_file.write('{"op": "done", "reso')
+        self.assertEqual(['0', '1'],
+                         [e['id'] for e in DeletionJournal(
+                             self.__path).outstanding()['server']])
+
+    def test_missing_journal(self):
+        self.assertEqual({}, dict(DeletionJournal(self.__path).outstanding()))
+
+    def test_sync_batches(self):
+        with patch('cloud_cleaner.journal.os.fsync') as fsync:
+            journal = DeletionJournal(self.__path, sync_batch=3)
+            journal.intend('server', ENTRIES)
+            # Intents are synced before any deletion is made
+            self.assertEqual(1, fsync.call_count)
+            for entry in ENTRIES:
+                journal.record('server', result(entry['id']))
+            self.assertEqual(2, fsync.call_count)
+            journal.close()
+            self.assertEqual(3, fsync.call_count)
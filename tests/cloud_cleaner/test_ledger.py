@@ -0,0 +1,39 @@
+from os import path
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+from cloud_cleaner.ledger import NotificationLedger
+
+
+class TestLedger(TestCase):
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.path = path.join(self.directory, 'ledger.db')
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def test_new_and_escalated(self):
+        ledger = NotificationLedger(self.path)
+        self.assertTrue(ledger.should_notify('1', 1))
+        ledger.record([('1', 1)])
+        self.assertFalse(ledger.should_notify('1', 1))
+        self.assertTrue(ledger.should_notify('1', 2))
+        ledger.record([('1', 2)])
+        # A lower tier than the one already sent is not sent again
+        self.assertFalse(ledger.should_notify('1', 1))
+
+    def test_persists(self):
+        ledger = NotificationLedger(self.path)
+        ledger.record([('1', 1), ('2', 1)])
+        ledger.close()
+        ledger = NotificationLedger(self.path)
+        self.assertFalse(ledger.should_notify('2', 1))
+        self.assertTrue(ledger.should_notify('3', 1))
+
+    def test_forget(self):
+        ledger = NotificationLedger(self.path)
+        ledger.record([('1', 1), ('2', 1)])
+        ledger.forget(['1'])
+        self.assertTrue(ledger.should_notify('1', 1))
+        self.assertFalse(ledger.should_notify('2', 1))
@@ -0,0 +1,94 @@
+import json
+from os import listdir, path
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+from cloud_cleaner.metrics import Metrics
+
+
+class FakeClock(object):  # pylint: disable=R0205
+    def __init__(self, *times):
+        self.__times = list(times)
+
+    def __call__(self):
+        return self.__times.pop(0)
+
+
+class TestMetrics(TestCase):
+    def setUp(self):
+        self.tmp = mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.tmp)
+
+    def test_count_and_set(self):
+        metrics = Metrics()
+        metrics.count('deletes', endpoint='compute')
+        metrics.count('deletes', 2, endpoint='compute')
+        metrics.count('deletes', endpoint='network')
+        metrics.set('last_run_timestamp_seconds', 5)
+        summary = metrics.summary()
+        self.assertEqual(
+            [{'name': 'deletes', 'labels': {'endpoint': 'compute'},
+              'value': 3},
+             {'name': 'deletes', 'labels': {'endpoint': 'network'},
+              'value': 1}], summary['counters'])
+        self.assertEqual([{'name': 'last_run_timestamp_seconds',
+                           'labels': {}, 'value': 5}], summary['gauges'])
+
+    def test_histogram(self):
+        metrics = Metrics(buckets=(0.1, 1.0),
+                          clock=FakeClock(0.0, 0.5, 1.0, 3.0))
+        metrics.observe('delete_seconds', 0.05)
+        with metrics.timer('delete_seconds'):
+            pass
+        timed = metrics.timed('delete_seconds', lambda: 'done')
+        self.assertEqual('done', timed())
+        histogram, = metrics.summary()['histograms']
+        self.assertEqual(3, histogram['count'])
+        self.assertAlmostEqual(2.55, histogram['sum'])
+        self.assertEqual([[0.1, 1], [1.0, 2], ['+Inf', 3]],
+                         histogram['buckets'])
+
+    def test_timer_raises(self):
+        metrics = Metrics(clock=FakeClock(0.0, 1.0))
+        with self.assertRaises(RuntimeError):
+            with metrics.timer('phase_seconds', phase='clean'):
+                raise RuntimeError('failed')
+        self.assertEqual(1, metrics.summary()['histograms'][0]['count'])
+
+    def test_prometheus(self):
+        metrics = Metrics(buckets=(1.0,))
+        metrics.count('api_calls', service='compute', outcome='ok')
+        metrics.set('last_run_timestamp_seconds', 10)
+        metrics.observe('auth_seconds', 0.5)
+        self.assertEqual(
+            '# TYPE cloud_cleaner_api_calls_total counter\n'
+            'cloud_cleaner_api_calls_total{outcome="ok",service="compute"} 1\n'
+            '# TYPE cloud_cleaner_last_run_timestamp_seconds gauge\n'
+            'cloud_cleaner_last_run_timestamp_seconds 10\n'
+            '# TYPE cloud_cleaner_auth_seconds histogram\n'
+            'cloud_cleaner_auth_seconds_bucket{le="1.0"} 1\n'
+            'cloud_cleaner_auth_seconds_bucket{le="+Inf"} 1\n'
+            'cloud_cleaner_auth_seconds_sum 0.5\n'
+            'cloud_cleaner_auth_seconds_count 1\n', metrics.prometheus())
+
+    def test_escaped_labels(self):
+        metrics = Metrics()
+        metrics.count('filter_passed', test='name "x"\\y')
+        self.assertIn('{test="name \\"x\\"\\\\y"}', metrics.prometheus())
+
+    def test_write(self):
+        metrics = Metrics()
+        metrics.count('runs', outcome='ok')
+        textfile = path.join(self.tmp, 'cloud_cleaner.prom')
+        json_file = path.join(self.tmp, 'metrics.json')
+        metrics.write_textfile(textfile)
+        metrics.write_json(json_file)
+        with open(textfile) as metrics_file:
+            self.assertEqual(metrics.prometheus(), metrics_file.read())
+        with open(json_file) as metrics_file:
+            self.assertEqual(metrics.summary(), json.load(metrics_file))
+        # Nothing is left behind from writing the files
+        self.assertEqual(['cloud_cleaner.prom', 'metrics.json'],
+                         sorted(listdir(self.tmp)))
@@ -0,0 +1,82 @@
+from threading import Event
+from unittest import TestCase
+try:
+    from unittest.mock import Mock
+except ImportError:
+    from mock import Mock
+from munch import munchify
+from cloud_cleaner.pager import pages, prefetch
+from tests.fakes import paged
+
+
+ITEMS = [munchify({'id': str(i)}) for i in range(7)]
+
+
+class TestPager(TestCase):
+    def test_pages(self):
+        fetch = Mock(side_effect=paged(ITEMS))
+        result = [[i.id for i in page]
+                  for page in pages(fetch, 3, {'name': 'x'})]
+        self.assertEqual([['0', '1', '2'], ['3', '4', '5'], ['6']], result)
+        # The listing ends with an empty page
+        self.assertEqual(4, fetch.call_count)
+        self.assertEqual({'name': 'x', 'limit': 3},
+                         fetch.call_args_list[0][1])
+        self.assertEqual({'name': 'x', 'limit': 3, 'marker': '2'},
+                         fetch.call_args_list[1][1])
+
+    def test_short_pages_continue(self):
+        # Services cap the page size, which must not end the listing early
+        fetch = Mock(side_effect=paged(ITEMS))
+        result = [len(page) for page in pages(
+            lambda **q: fetch(**dict(q, limit=2)), 5)]
+        self.assertEqual([2, 2, 2, 1], result)
+
+    def test_lazy(self):
+        fetch = Mock(side_effect=paged(ITEMS))
+        generator = pages(fetch, 3)
+        self.assertEqual(0, fetch.call_count)
+        next(generator)
+        self.assertEqual(1, fetch.call_count)
+
+
+class TestPrefetch(TestCase):
+    def test_same_pages(self):
+        fetch = Mock(side_effect=paged(ITEMS))
+        result = [[i.id for i in page]
+                  for page in prefetch(pages(fetch, 2), 3)]
+        self.assertEqual([['0', '1'], ['2', '3'], ['4', '5'], ['6']], result)
+
+    def test_disabled(self):
+        source = iter([[1], [2]])
+        self.assertIs(source, prefetch(source, 0))
+
+    def test_fetches_ahead(self):
+        second = Event()
+
+        def _source():
+            yield [1]
+            second.set()
+            yield [2]
+        generator = prefetch(_source(), 1)
+        self.assertEqual([1], next(generator))
+        # The next page is fetched while the caller works on this one
+        self.assertTrue(second.wait(5))
+        self.assertEqual([[2]], list(generator))
+
+    def test_errors_raised(self):
+        def _source():
+            yield [1]
+            raise ValueError()
+        generator = prefetch(_source(), 2)
+        self.assertEqual([1], next(generator))
+        with self.assertRaises(ValueError):
+            next(generator)
+
+    def test_stop_early(self):
+        fetch = Mock(side_effect=paged(ITEMS))
+        generator = prefetch(pages(fetch, 1), 1)
+        next(generator)
+        generator.close()
+        # The thread stops rather than listing everything
+        self.assertLess(fetch.call_count, len(ITEMS))
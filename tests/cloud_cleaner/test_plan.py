@@ -0,0 +1,35 @@
+from datetime import datetime, timezone
+from os import path
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+from cloud_cleaner.plan import PlanError, read_plan, write_plan
+
+
+class TestPlan(TestCase):
+    def setUp(self):
+        self.__dir = mkdtemp()
+        self.__path = path.join(self.__dir, 'plan.json')
+
+    def tearDown(self):
+        rmtree(self.__dir)
+
+    def test_round_trip(self):
+        entries = [{'id': '1', 'name': 'a'}, {'id': '2', 'name': 'b'}]
+        created = datetime(2018, 2, 23, 16, tzinfo=timezone.utc)
+        write_plan(self.__path, 'server', entries, created)
+        plan = read_plan(self.__path)
+        self.assertEqual('server', plan['resource'])
+        self.assertEqual(entries, plan['items'])
+        self.assertEqual('2018-02-23T16:00:00Z', plan['created'])
+        self.assertFalse(path.exists(self.__path + '.partial'))
+
+    def test_not_a_plan(self):
+        with open(self.__path, 'w') as plan_file:
+            plan_file.write('{"resource": "server"}')
+        with self.assertRaises(PlanError):
+            read_plan(self.__path)
+        with open(self.__path, 'w') as plan_file:
+            plan_file.write('not json')
+        with self.assertRaises(PlanError):
+            read_plan(self.__path)
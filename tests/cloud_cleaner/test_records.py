@@ -0,0 +1,38 @@
+from unittest import TestCase
+from munch import munchify
+from openstack.compute.v2.server import Server
+from cloud_cleaner.records import project, record_type
+from cloud_cleaner.resources.fip import FipRecord
+from cloud_cleaner.resources.server import ServerRecord
+
+
+class TestRecords(TestCase):
+    def test_of_resource(self):
+        record = ServerRecord.of(Server(id="1", name="a", status="ACTIVE",
+                                        metadata={"a": "b"}))
+        self.assertEqual("1", record.id)
+        self.assertEqual("a", record["name"])
+        self.assertIsNone(record.launched_at)
+        self.assertRaises(KeyError, lambda: record["metadata"])
+        self.assertFalse(hasattr(record, "__dict__"))
+        self.assertIs(record, ServerRecord.of(record))
+
+    def test_of_munch(self):
+        record = FipRecord.of(munchify({"id": "2", "port_id": None,
+                                        "attached": True}))
+        self.assertEqual("2", record["id"])
+        self.assertTrue(record.attached)
+        self.assertIsNone(record.floating_ip_address)
+
+    def test_equality(self):
+        pair = record_type("Pair", ("a", "b"))
+        self.assertEqual(pair(1, 2), pair.of(munchify({"a": 1, "b": 2})))
+        self.assertNotEqual(pair(1, 2), pair(1, 3))
+        self.assertNotEqual(pair(1, 2), record_type("Pair", ("a", "b"))(1, 2))
+        self.assertEqual("Pair(a=1, b=2)", repr(pair(1, 2)))
+
+    def test_project(self):
+        pair = record_type("Pair", ("a", "b"))
+        records = project(pair, iter([munchify({"a": 1}),
+                                      munchify({"b": 2})]))
+        self.assertEqual([pair(1, None), pair(None, 2)], list(records))
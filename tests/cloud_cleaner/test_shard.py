@@ -0,0 +1,27 @@
+from argparse import ArgumentTypeError
+from hashlib import md5
+from unittest import TestCase
+from uuid import UUID
+from cloud_cleaner.shard import parse_shard, shard_of
+
+
+class TestShard(TestCase):
+    def test_parse_shard(self):
+        self.assertEqual((0, 4), parse_shard('0/4'))
+        self.assertEqual((3, 4), parse_shard('3/4'))
+        for value in ('4/4', '-1/4', '0/0', '1', 'a/b'):
+            with self.assertRaises(ArgumentTypeError):
+                parse_shard(value)
+
+    def test_stable(self):
+        # The shard of an id must never change between hosts or releases
+        self.assertEqual(1, shard_of('3', 2))
+        self.assertEqual(shard_of('abc', 7), shard_of(u'abc', 7))
+
+    def test_balanced(self):
+        sizes = [0] * 4
+        for number in range(4000):
+            resource_id = UUID(bytes=md5(str(number).encode()).digest())
+            sizes[shard_of(str(resource_id), 4)] += 1
+        for size in sizes:
+            self.assertTrue(900 < size < 1100, sizes)
@@ -0,0 +1,43 @@
+from unittest import TestCase
+from cloud_cleaner.subnet_index import SubnetIndex, parse_address
+
+
+class TestSubnetIndex(TestCase):
+    def test_membership(self):
+        index = SubnetIndex(['10.0.0.0/24', '192.168.0.0/16', '10.0.2.0/24'])
+        for address in ('10.0.0.0', '10.0.0.255', '10.0.2.7',
+                        '192.168.255.255'):
+            self.assertIn(address, index)
+        for address in ('9.255.255.255', '10.0.1.0', '10.0.3.0',
+                        '192.169.0.0', '8.8.8.8'):
+            self.assertNotIn(address, index)
+
+    def test_overlapping_and_adjacent_subnets(self):
+        index = SubnetIndex(['10.0.0.0/8', '10.1.0.0/16', '11.0.0.0/8'])
+        self.assertIn('10.1.2.3', index)
+        self.assertIn('11.255.0.1', index)
+        self.assertNotIn('12.0.0.0', index)
+
+    def test_mixed_versions(self):
+        index = SubnetIndex(['10.0.0.0/8', '2001:db8::/32'])
+        self.assertIn('10.1.1.1', index)
+        self.assertIn('2001:db8::1', index)
+        self.assertNotIn('2001:db9::1', index)
+        # 10.0.0.1 as an integer is well inside a /8 of IPv6 space, but the
+        # versions are kept apart
+        self.assertNotIn('::a00:1', index)
+        self.assertNotIn('10.0.0.1', SubnetIndex(['::/8']))
+        self.assertNotIn('2001:db8::1', SubnetIndex(['0.0.0.0/0']))
+
+    def test_not_addresses(self):
+        index = SubnetIndex(['0.0.0.0/0'])
+        self.assertNotIn(None, index)
+        self.assertNotIn('not-an-address', index)
+        self.assertIsNone(parse_address(None))
+
+    def test_empty_index(self):
+        self.assertNotIn('10.0.0.1', SubnetIndex([]))
+
+    def test_bad_subnet(self):
+        with self.assertRaises(ValueError):
+            SubnetIndex(['10.0.0.1/8'])
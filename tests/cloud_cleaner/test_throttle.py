@@ -0,0 +1,133 @@
+from unittest import TestCase
+try:
+    from unittest.mock import Mock
+except ImportError:
+    from mock import Mock
+from munch import munchify
+from cloud_cleaner.metrics import Metrics
+from cloud_cleaner.throttle import AimdController, RateControl, \
+    TokenBucket, service_for
+
+
+class Throttled(Exception):
+    def __init__(self, status_code=429, retry_after=None):
+        super().__init__(status_code)
+        self.status_code = status_code
+        headers = {}
+        if retry_after is not None:
+            headers['Retry-After'] = str(retry_after)
+        self.response = munchify({'headers': headers})
+
+
+class FakeClock(object):  # pylint: disable=R0205
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestTokenBucket(TestCase):
+    def test_rate(self):
+        clock = FakeClock()
+        bucket = TokenBucket(10, burst=2, clock=clock, sleep=clock.sleep)
+        for _ in range(12):
+            bucket.acquire()
+        # Two calls come from the burst, the other ten wait 0.1s each
+        self.assertAlmostEqual(1.0, clock.now)
+
+
+class TestAimdController(TestCase):
+    def test_increase_and_decrease(self):
+        controller = AimdController(8)
+        self.assertEqual(8, controller.limit)
+        controller.acquire()
+        controller.release(throttled=True)
+        self.assertEqual(4, controller.limit)
+        controller.acquire()
+        controller.release(throttled=True)
+        self.assertEqual(2, controller.limit)
+        for _ in range(10):
+            controller.acquire()
+            controller.release()
+        self.assertGreater(controller.limit, 2)
+        self.assertLessEqual(controller.limit, 8)
+
+
+class TestRateControl(TestCase):
+    def test_retries_throttled_calls(self):
+        sleep = Mock()
+        control = RateControl(retries=3, sleep=sleep)
+        func = Mock(side_effect=[Throttled(429), Throttled(503), 'done'])
+        self.assertEqual('done', control.call('compute', func, '1'))
+        self.assertEqual(3, func.call_count)
+        self.assertEqual(2, sleep.call_count)
+        counters = control.counters()
+        self.assertEqual(2, counters['throttles'])
+        self.assertEqual(2, counters['retries'])
+        self.assertEqual(0, counters['failures'])
+
+    def test_metrics(self):
+        metrics = Metrics()
+        control = RateControl(retries=3, sleep=Mock(), metrics=metrics)
+        func = Mock(side_effect=[Throttled(429), 'done', ValueError()])
+        control.call('compute', func)
+        with self.assertRaises(ValueError):
+            control.call('network', func)
+        summary = metrics.summary()
+        self.assertEqual(
+            [({'outcome': 'error', 'service': 'network'}, 1),
+             ({'outcome': 'ok', 'service': 'compute'}, 1),
+             ({'outcome': 'throttled', 'service': 'compute'}, 1)],
+            [(c['labels'], c['value']) for c in summary['counters']])
+        self.assertEqual([2, 1], [h['count'] for h in
+                                  summary['histograms']])
+
+    def test_gives_up(self):
+        control = RateControl(retries=1, sleep=Mock())
+        func = Mock(side_effect=Throttled())
+        with self.assertRaises(Throttled):
+            control.call('compute', func)
+        self.assertEqual(2, func.call_count)
+        self.assertEqual(1, control.counters()['failures'])
+
+    def test_other_errors_not_retried(self):
+        control = RateControl(sleep=Mock())
+        func = Mock(side_effect=ValueError())
+        with self.assertRaises(ValueError):
+            control.call('network', func)
+        self.assertEqual(1, func.call_count)
+        self.assertEqual(0, control.counters()['retries'])
+
+    def test_retry_after(self):
+        sleep = Mock()
+        control = RateControl(backoff=0.001, sleep=sleep)
+        func = Mock(side_effect=[Throttled(retry_after=7), None])
+        control.call('compute', func)
+        sleep.assert_called_once_with(7.0)
+
+    def test_throttle_lowers_limit(self):
+        control = RateControl(concurrency=8, sleep=Mock())
+        func = Mock(side_effect=[Throttled(), None])
+        control.call('compute', func)
+        self.assertEqual(4, control.limits()['compute'])
+
+    def test_wrapped_connection(self):
+        conn = Mock()
+        conn.delete_server = Mock(side_effect=[Throttled(), None])
+        conn.compute.servers = Mock(return_value=(i for i in [1, 2]))
+        control = RateControl(sleep=Mock())
+        wrapped = control.wrap(conn)
+        wrapped.delete_server('1')
+        self.assertEqual([1, 2], wrapped.compute.servers())
+        self.assertEqual(3, control.counters()['calls'])
+        self.assertIsNone(control.wrap(None))
+
+    def test_service_for(self):
+        self.assertEqual('compute', service_for('delete_server'))
+        self.assertEqual('network', service_for('list_floating_ips'))
+        self.assertEqual('identity', service_for('get_user_by_id'))
+        self.assertIsNone(service_for('close'))
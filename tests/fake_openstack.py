@@ -0,0 +1,447 @@
+"""
+Local stand-in for the parts of Keystone, Nova and Neutron that cloud-cleaner
+uses, so that tests and benchmarks can run a real openstacksdk connection
+without a cloud.
+
+Tests run the service on a free port, with fake_cloud, which points
+OS_CLIENT_CONFIG_FILE at a clouds file whose "fake" cloud is the service. The
+"fake" cloud in tests/clouds.yaml points at the default address of the
+service instead, for when it is run on its own, with a generated inventory:
+
+    python -m tests.fake_openstack --servers 10000 --fips 10000 --latency 0.05
+"""
+import json
+import os
+import random
+import re
+import time
+from argparse import ArgumentParser
+from bisect import bisect_right
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from shutil import rmtree
+from socketserver import ThreadingMixIn
+from tempfile import mkdtemp
+from threading import Lock, Thread
+from urllib.parse import parse_qs, urlsplit
+
+DEFAULT_PORT = 8775
+TOKEN = 'fake-token'
+EXPIRES = '2099-01-01T00:00:00.000000Z'
+COMPUTE_VERSION = {'id': 'v2.1', 'status': 'CURRENT', 'version': '2.79',
+                   'min_version': '2.1'}
+ROUTES = (
+    ('GET', re.compile(r'^/compute/v2\.1/servers/detail$'), 'list_servers'),
+    ('GET', re.compile(r'^/compute/v2\.1/servers/([^/]+)$'), 'get_server'),
+    ('DELETE', re.compile(r'^/compute/v2\.1/servers/([^/]+)$'),
+     'delete_server'),
+    ('GET', re.compile(r'^/network/v2\.0/floatingips$'), 'list_fips'),
+    ('GET', re.compile(r'^/network/v2\.0/floatingips/([^/]+)$'), 'get_fip'),
+    ('DELETE', re.compile(r'^/network/v2\.0/floatingips/([^/]+)$'),
+     'delete_fip'),
+    ('GET', re.compile(r'^/v3/users/([^/]+)$'), 'get_user'),
+)
+
+
+class Collection(object):  # pylint: disable=R0205
+    """
+    Resources of one type, listed in the order of their ids with
+    limit/marker pagination. Ids stay in the sorted index after their
+    resource is deleted, so that deleting is cheap and a deleted id is still
+    a valid marker.
+    """
+    def __init__(self, items):
+        self.__items = {item['id']: item for item in items}
+        self.__ids = sorted(self.__items)
+
+    def __len__(self):
+        return len(self.__items)
+
+    def get(self, item_id):
+        """Get a resource by id, or None"""
+        return self.__items.get(item_id)
+
+    def delete(self, item_id):
+        """Delete a resource, returning False if it did not exist"""
+        return self.__items.pop(item_id, None) is not None
+
+    def page(self, limit=None, marker=None, match=None):
+        """
+        List one page of the resources, after the marker.
+
+        :param limit: Most resources to list, or None for all of them
+        :param marker: Id of the last resource of the previous page
+        :param match: Callable selecting the resources to list
+        :return: List of resources
+        """
+        start = 0 if marker is None else bisect_right(self.__ids, marker)
+        page = []
+        for item_id in self.__ids[start:]:
+            if limit is not None and len(page) >= limit:
+                break
+            item = self.__items.get(item_id)
+            if item is not None and (match is None or match(item)):
+                page.append(item)
+        return page
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    """
+    HTTP server handling each request on a thread of its own, as
+    http.server.ThreadingHTTPServer does from Python 3.7
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class FakeOpenStack(_Server):
+    """
+    Serves Keystone, Nova and Neutron from one local port. Every call to
+    Nova, Neutron or the Keystone users API first sleeps "latency" seconds,
+    then fails with a 429 with probability "throttle_rate", or with a 500
+    with probability "error_rate". Authentication and version discovery are
+    never delayed or failed. The calls made are counted in "calls", by
+    method and route.
+
+    :param servers: Nova server bodies, as listed by /servers/detail
+    :param floating_ips: Neutron floating IP bodies
+    :param users: Keystone user bodies
+    :param port: Port to listen on. The default of 0 picks a free one.
+    """
+    def __init__(self, servers=(), floating_ips=(), users=(), latency=0.0,
+                 throttle_rate=0.0, error_rate=0.0, port=0, seed=0):
+        # pylint: disable=R0913
+        super().__init__(('127.0.0.1', port), _Handler)
+        self.servers = Collection(servers)
+        self.floating_ips = Collection(floating_ips)
+        self.users = {user['id']: user for user in users}
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.calls = {}
+        self.__random = random.Random(seed)
+        self.__lock = Lock()
+        self.__thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    @property
+    def auth_url(self):
+        return 'http://127.0.0.1:%d/v3' % self.port
+
+    def write_clouds(self, path, name='fake'):
+        """
+        Write a clouds file with a cloud that points at the service.
+
+        :param path: Path of the file. JSON is written, so it should end in
+                     ".json".
+        :param name: Name of the cloud
+        :return: None
+        """
+        cloud = {'auth': {'auth_url': self.auth_url, 'username': 'user',
+                          'password': 'password',
+                          'project_name': 'project',
+                          'user_domain_name': 'Default',
+                          'project_domain_name': 'Default'},
+                 'region_name': 'RegionOne'}
+        with open(path, 'w') as clouds:
+            json.dump({'clouds': {name: cloud}}, clouds)
+
+    def count(self, call):
+        """Count a call that never fails"""
+        with self.__lock:
+            self.calls[call] = self.calls.get(call, 0) + 1
+
+    def record(self, call):
+        """
+        Count a call, and draw whether it is to fail.
+
+        :return: HTTP status to fail the call with, or None
+        """
+        with self.__lock:
+            self.calls[call] = self.calls.get(call, 0) + 1
+            draw = self.__random.random()
+        if draw < self.throttle_rate:
+            return 429
+        if draw < self.throttle_rate + self.error_rate:
+            return 500
+        return None
+
+    def __enter__(self):
+        self.__thread = Thread(target=self.serve_forever, daemon=True)
+        self.__thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        self.__dispatch('GET')
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        self.__dispatch('POST')
+
+    def do_DELETE(self):  # pylint: disable=invalid-name
+        self.__dispatch('DELETE')
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+    def __dispatch(self, method):
+        url = urlsplit(self.path)
+        path = url.path.rstrip('/')
+        self.__query = parse_qs(url.query)
+        self.__body()
+        if method == 'POST' and path == '/v3/auth/tokens':
+            self.server.count('POST issue_token')
+            self.__token()
+            return
+        if method == 'GET' and path in ('/v3', '/compute', '/compute/v2.1',
+                                        '/network', '/network/v2.0'):
+            self.__discovery(path)
+            return
+        for route_method, pattern, name in ROUTES:
+            match = pattern.match(path)
+            if route_method == method and match:
+                self.__call(name, match.groups())
+                return
+        self.__reply(404, {'itemNotFound': {'message': 'No route'}})
+
+    def __call(self, name, args):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        failure = self.server.record('%s %s' % (self.command, name))
+        if failure == 429:
+            self.__reply(429, {'message': 'Rate limited'},
+                         {'Retry-After': '0'})
+        elif failure is not None:
+            self.__reply(failure, {'message': 'Injected failure'})
+        else:
+            getattr(self, '_%s' % name)(*args)
+
+    def _list_servers(self):
+        since = self.__param('changes-since')
+        name = self.__param('name')
+        pattern = re.compile(name) if name is not None else None
+
+        def _match(server):
+            return ((since is None or server['updated'] >= since) and
+                    (pattern is None or pattern.search(server['name'])))
+        servers = self.server.servers.page(self.__limit(),
+                                           self.__param('marker'), _match)
+        self.__reply(200, {'servers': servers})
+
+    def _get_server(self, server_id):
+        self.__found('server', self.server.servers.get(server_id))
+
+    def _delete_server(self, server_id):
+        self.__deleted(self.server.servers.delete(server_id))
+
+    def _list_fips(self):
+        ids = set(self.__query.get('id', ()))
+        fips = self.server.floating_ips.page(
+            self.__limit(), self.__param('marker'),
+            (lambda fip: fip['id'] in ids) if ids else None)
+        self.__reply(200, {'floatingips': fips})
+
+    def _get_fip(self, fip_id):
+        self.__found('floatingip', self.server.floating_ips.get(fip_id))
+
+    def _delete_fip(self, fip_id):
+        self.__deleted(self.server.floating_ips.delete(fip_id))
+
+    def _get_user(self, user_id):
+        self.__found('user', self.server.users.get(user_id))
+
+    def __found(self, key, item):
+        if item is None:
+            self.__reply(404, {'itemNotFound': {'message': 'Not found'}})
+        else:
+            self.__reply(200, {key: item})
+
+    def __deleted(self, existed):
+        if existed:
+            self.__reply(204)
+        else:
+            self.__reply(404, {'itemNotFound': {'message': 'Not found'}})
+
+    def __token(self):
+        base = 'http://%s' % self.headers['Host']
+
+        def _service(kind, name, url):
+            return {'type': kind, 'name': name, 'id': name, 'endpoints': [
+                {'id': '%s-%s' % (name, interface), 'interface': interface,
+                 'region': 'RegionOne', 'region_id': 'RegionOne',
+                 'url': base + url}
+                for interface in ('public', 'internal', 'admin')]}
+        domain = {'id': 'default', 'name': 'Default'}
+        self.__reply(201, {'token': {
+            'methods': ['password'],
+            'expires_at': EXPIRES,
+            'issued_at': datetime.utcnow().isoformat() + 'Z',
+            'user': {'id': 'fake-user', 'name': 'user', 'domain': domain},
+            'project': {'id': 'fake-project', 'name': 'project',
+                        'domain': domain},
+            'roles': [{'id': 'admin', 'name': 'admin'}],
+            'catalog': [_service('identity', 'keystone', '/v3'),
+                        _service('compute', 'nova', '/compute/v2.1'),
+                        _service('network', 'neutron', '/network')]
+        }}, {'X-Subject-Token': TOKEN})
+
+    def __discovery(self, path):
+        base = 'http://%s' % self.headers['Host']
+        if path == '/v3':
+            self.__reply(200, {'version': {
+                'id': 'v3.14', 'status': 'stable', 'updated': EXPIRES,
+                'links': [{'rel': 'self', 'href': base + '/v3/'}]}})
+        elif path.startswith('/compute'):
+            version = dict(COMPUTE_VERSION, links=[
+                {'rel': 'self', 'href': base + '/compute/v2.1/'}])
+            if path == '/compute':
+                self.__reply(200, {'versions': [version]})
+            else:
+                self.__reply(200, {'version': version})
+        elif path == '/network':
+            self.__reply(200, {'versions': [{
+                'id': 'v2.0', 'status': 'CURRENT',
+                'links': [{'rel': 'self', 'href': base + '/network/v2.0/'}]
+            }]})
+        else:
+            self.__reply(200, {'resources': []})
+
+    def __param(self, name):
+        values = self.__query.get(name)
+        return values[0] if values else None
+
+    def __limit(self):
+        limit = self.__param('limit')
+        return None if limit is None else int(limit)
+
+    def __body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+
+    def __reply(self, status, body=None, headers=None):
+        data = b'' if body is None else json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        if body is not None:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@contextmanager
+def fake_cloud(service):
+    """
+    Run a service, with OS_CLIENT_CONFIG_FILE pointing at a clouds file whose
+    "fake" cloud is the service, for as long as the context lasts.
+
+    :param service: The FakeOpenStack
+    :return: Context manager giving the running service
+    """
+    workdir = mkdtemp()
+    path = os.path.join(workdir, 'clouds.json')
+    service.write_clouds(path)
+    previous = os.environ.get('OS_CLIENT_CONFIG_FILE')
+    os.environ['OS_CLIENT_CONFIG_FILE'] = path
+    try:
+        with service:
+            yield service
+    finally:
+        if previous is None:
+            del os.environ['OS_CLIENT_CONFIG_FILE']
+        else:
+            os.environ['OS_CLIENT_CONFIG_FILE'] = previous
+        rmtree(workdir)
+
+
+def fake_server(index, now):
+    """
+    Generate the Nova body of a server, launched "index" hours before "now".
+    Every tenth server is named as a pet.
+    """
+    launched = (now - timedelta(hours=index)).strftime('%Y-%m-%dT%H:%M:%S')
+    return {
+        'id': 'server-%08d' % index,
+        'name': ('pet-%d' if index % 10 == 0 else 'test-%d') % index,
+        'status': 'ACTIVE',
+        'user_id': 'user-%d' % (index % 10),
+        'tenant_id': 'fake-project',
+        'created': launched + 'Z',
+        'updated': launched + 'Z',
+        'OS-SRV-USG:launched_at': launched + '.000000',
+        'addresses': {},
+        'metadata': {}
+    }
+
+
+def fake_fip(index):
+    """
+    Generate the Neutron body of a floating IP. Every other one is attached.
+    """
+    return {
+        'id': 'fip-%08d' % index,
+        'floating_ip_address': '10.%d.%d.%d' % (index // 65536 % 256,
+                                                index // 256 % 256,
+                                                index % 256),
+        'fixed_ip_address': '192.168.%d.%d' % (index // 256 % 256,
+                                               index % 256),
+        'port_id': 'port-%d' % index if index % 2 else None,
+        'status': 'ACTIVE' if index % 2 else 'DOWN',
+        'floating_network_id': 'public',
+        'router_id': None,
+        'tenant_id': 'fake-project',
+        'project_id': 'fake-project'
+    }
+
+
+def fake_user(index):
+    """Generate the Keystone body of a user"""
+    return {'id': 'user-%d' % index, 'name': 'user%d' % index,
+            'email': 'user%d@example.com' % index, 'enabled': True,
+            'domain_id': 'default'}
+
+
+def main(argv=None):
+    """Run the service with a generated inventory until interrupted"""
+    parser = ArgumentParser(description='Fake OpenStack service')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--servers', type=int, default=1000)
+    parser.add_argument('--fips', type=int, default=1000)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds each API call takes')
+    parser.add_argument('--throttle-rate', type=float, default=0.0,
+                        help='Fraction of API calls to answer with a 429')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Fraction of API calls to answer with a 500')
+    options = parser.parse_args(argv)
+    now = datetime.utcnow()
+    service = FakeOpenStack(
+        servers=(fake_server(i, now) for i in range(options.servers)),
+        floating_ips=(fake_fip(i) for i in range(options.fips)),
+        users=(fake_user(i) for i in range(10)), latency=options.latency,
+        throttle_rate=options.throttle_rate, error_rate=options.error_rate,
+        port=options.port)
+    print('Serving on %s' % service.auth_url)
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    service.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Fake OpenStack listings and services shared by the test cases"""
+import re
+import socketserver
+from threading import Thread
+
+ADDRESS = re.compile(r'<(.*)>')
+
+
+def paged(items):
+    """
+    Build a fake listing call for a collection, paginated with limit/marker
+    the way OpenStack APIs are. Any other query parameters are ignored.
+    """
+    def _list(limit=None, marker=None, **_):
+        start = 0
+        if marker is not None:
+            start = [i.id for i in items].index(marker) + 1
+        end = len(items) if limit is None else start + limit
+        return iter(items[start:end])
+    return _list
+
+
+class FakeSmtpServer(socketserver.ThreadingTCPServer):
+    """
+    Local stand-in for an SMTP relay. It accepts just enough SMTP for
+    smtplib to send mail, and records the connections made and the messages
+    sent. Recipients listed in "refuse" are rejected.
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, refuse=()):
+        super().__init__(('127.0.0.1', 0), _SmtpHandler)
+        self.connections = 0
+        self.messages = []
+        self.refuse = set(refuse)
+        self.__thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def __enter__(self):
+        self.__thread = Thread(target=self.serve_forever, daemon=True)
+        self.__thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+class _SmtpHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.server.connections += 1
+        self.__reply('220 fake SMTP')
+        sender, receivers = None, []
+        for line in self.rfile:
+            command = line.decode().strip()
+            verb = command[:4].upper()
+            if verb == 'QUIT':
+                self.__reply('221 bye')
+                return
+            if verb == 'MAIL':
+                sender, receivers = ADDRESS.search(command).group(1), []
+            elif verb == 'RCPT':
+                receiver = ADDRESS.search(command).group(1)
+                if receiver in self.server.refuse:
+                    self.__reply('550 refused')
+                    continue
+                receivers.append(receiver)
+            elif verb == 'DATA':
+                self.__reply('354 go ahead')
+                self.server.messages.append((sender, receivers,
+                                             self.__data()))
+            self.__reply('250 OK')
+
+    def __data(self):
+        lines = []
+        for line in self.rfile:
+            if line == b'.\r\n':
+                break
+            lines.append(line.decode())
+        return ''.join(lines)
+
+    def __reply(self, text):
+        self.wfile.write(text.encode() + b'\r\n')